@@ -8,6 +8,17 @@ int relayPin2 = 6;  // setting relay2 pin of Arduino
 
 unsigned long customDelayTime = 300000;  // Default 300 seconds or 5 minutes
 
+// ---- Binary telemetry (enabled with "BIN:1", back to text with "BIN:0") ----
+// Frame: 0xA5 | seq u16 | millis u32 | adc u16 | mode u8 | crc8 (little endian, 11 bytes)
+// This rig does not measure the cell voltage, so adc is always 0 like the text lines.
+// mode: 0 Unknown, 1 Charging, 2 Discharging, 3 Stop. Text acks are still printed as lines.
+// Text sample lines end in " | T: <millis>" so the Pi can place them on the board's clock.
+bool binaryMode = false;
+unsigned long frameIntervalMs = 10;   // "RATE:<ms>"
+unsigned long lastFrameTime = 0;
+uint16_t frameSeq = 0;
+uint8_t reportedMode = 0;
+
 void setup() 
 {
   Serial.begin(115200);
@@ -29,7 +40,7 @@ void loop()
   {
     handlePiMessage(); 
     Charging();
-    delay(1000);
+    waitWithFrames(1000);
   }
 
 //----- Sending HIGH to Arduino-----//
@@ -42,7 +53,7 @@ void loop()
   {
     handlePiMessage(); 
     Discharging();
-    delay(1000);
+    waitWithFrames(1000);
   }
 
 }
@@ -74,6 +85,23 @@ void handlePiMessage()
         Serial.println("Invalid time value. Must be greater than 0.");
       }
     } 
+    else if (message.startsWith("BIN:"))
+    {
+      binaryMode = message.substring(4).toInt() == 1;
+      Serial.print("Binary telemetry ");
+      Serial.println(binaryMode ? "ON" : "OFF");
+    }
+    else if (message.startsWith("RATE:"))
+    {
+      unsigned long val = message.substring(5).toInt();
+      if (val > 0)
+      {
+        frameIntervalMs = val;
+        Serial.print("Updated frame interval to: ");
+        Serial.print(frameIntervalMs);
+        Serial.println(" ms");
+      }
+    }
     else {}
   }
 }
@@ -84,7 +112,10 @@ void handlePiMessage()
 
 void Discharging() 
 {
-  Serial.println("Live Input | VOLTAGE: 0.0000 | DIR: STABLE | MODE: Discharging");
+  reportedMode = 2;
+  if (binaryMode) return;
+  Serial.print("Live Input | VOLTAGE: 0.0000 | DIR: STABLE | MODE: Discharging | T: ");
+  Serial.println(millis());
 }
 
 /////////////////////////////////////////////////////////
@@ -93,5 +124,56 @@ void Discharging()
 
 void Charging() 
 {
-  Serial.println("Live Input | VOLTAGE: 0.0000 | DIR: STABLE | MODE: Charging");
+  reportedMode = 1;
+  if (binaryMode) return;
+  Serial.print("Live Input | VOLTAGE: 0.0000 | DIR: STABLE | MODE: Charging | T: ");
+  Serial.println(millis());
+}
+
+/////////////////////////////////////////////////////////
+//--Binary telemetry frames, see the header comment--//
+/////////////////////////////////////////////////////////
+
+uint8_t crc8(const uint8_t *data, uint8_t len) {
+  uint8_t crc = 0;
+  for (uint8_t i = 0; i < len; i++) {
+    crc ^= data[i];
+    for (uint8_t b = 0; b < 8; b++) {
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : (crc << 1);
+    }
+  }
+  return crc;
+}
+
+void sendFrame(uint16_t adc) {
+  uint8_t frame[11];
+  unsigned long now = millis();
+  frame[0] = 0xA5;
+  frame[1] = frameSeq & 0xFF;
+  frame[2] = frameSeq >> 8;
+  frame[3] = now & 0xFF;
+  frame[4] = (now >> 8) & 0xFF;
+  frame[5] = (now >> 16) & 0xFF;
+  frame[6] = (now >> 24) & 0xFF;
+  frame[7] = adc & 0xFF;
+  frame[8] = adc >> 8;
+  frame[9] = reportedMode;
+  frame[10] = crc8(frame + 1, 9);
+  Serial.write(frame, 11);
+  frameSeq++;
+}
+
+// Replaces delay(): in binary mode keeps sending frames every frameIntervalMs while waiting.
+void waitWithFrames(unsigned long ms) {
+  if (!binaryMode) {
+    delay(ms);
+    return;
+  }
+  unsigned long start = millis();
+  while (millis() - start < ms) {
+    if (millis() - lastFrameTime >= frameIntervalMs) {
+      lastFrameTime = millis();
+      sendFrame(0);
+    }
+  }
 }
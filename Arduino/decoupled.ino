@@ -29,6 +29,17 @@ float lastVoltage = 0.0;
 unsigned long customDelayTime = 120000;
 unsigned long dischargeBelowThresholdStart = 0; // เพิ่มตัวแปรนี้
 
+// ---- Binary telemetry (enabled with "BIN:1", back to text with "BIN:0") ----
+// Frame: 0xA5 | seq u16 | millis u32 | adc u16 | mode u8 | crc8 (little endian, 11 bytes)
+// mode: 0 Unknown, 1 Charging, 2 Discharging, 3 Stop. Text acks are still printed as lines.
+// Text sample lines end in " | T: <millis>" so the Pi can place them on the board's clock.
+bool binaryMode = false;
+unsigned long frameIntervalMs = 10;   // "RATE:<ms>"
+unsigned long lastFrameTime = 0;
+uint16_t frameSeq = 0;
+uint8_t reportedMode = 0;
+bool reportZero = false;   // mirrors the text lines that print VOLTAGE: 0.0000
+
 void setup() {
   Serial.begin(115200);
   pinMode(relay1, OUTPUT);
@@ -123,7 +134,7 @@ void loop() {
     while (millis() - holdStart < customDelayTime) 
     {
       printDischargingAsZero();
-      delay(1000);
+      waitWithFrames(1000);
     }
 
     Serial.println("Finished Discharging loop. Entering LOOP CHARGING phase again...");
@@ -180,7 +191,7 @@ void loop() {
     displayVoltageStatus(currentVoltage);
   }
 
-  delay(1000);
+  waitWithFrames(1000);
 }
 
 // === Utility functions ===
@@ -195,25 +206,86 @@ void displayVoltageStatus(float voltage) {
   String direction = (voltage > lastVoltage) ? "INCREASING" : (voltage < lastVoltage ? "DECREASING" : lastDirectionPrinted);
   lastVoltage = voltage;
   lastDirectionPrinted = direction;
+  reportedMode = isDischarging ? 2 : 1;
+  reportZero = false;
+  if (binaryMode) return;
   String mode = isDischarging ? "Discharging" : "Charging";
   Serial.print("Live Input | VOLTAGE: ");
   Serial.print(voltage, 4);
   Serial.print(" | DIR: ");
   Serial.print(direction);
   Serial.print(" | MODE: ");
-  Serial.println(mode);
+  Serial.print(mode);
+  Serial.print(" | T: ");
+  Serial.println(millis());
 }
 
 void printStoppedStatus() {
-  Serial.println("Live Input | VOLTAGE: 0.0000 | DIR: STABLE | MODE: Stop");
+  reportedMode = 3;
+  reportZero = true;
+  if (binaryMode) return;
+  Serial.print("Live Input | VOLTAGE: 0.0000 | DIR: STABLE | MODE: Stop | T: ");
+  Serial.println(millis());
 }
 
 void printDischargingAsZero() {
-  Serial.println("Live Input | VOLTAGE: 0.0000 | DIR: STABLE | MODE: Discharging");
+  reportedMode = 2;
+  reportZero = true;
+  if (binaryMode) return;
+  Serial.print("Live Input | VOLTAGE: 0.0000 | DIR: STABLE | MODE: Discharging | T: ");
+  Serial.println(millis());
 }
 
 void printChargingAsZero() {
-  Serial.println("Live Input | VOLTAGE: 0.0000 | DIR: STABLE | MODE: Charging");
+  reportedMode = 1;
+  reportZero = true;
+  if (binaryMode) return;
+  Serial.print("Live Input | VOLTAGE: 0.0000 | DIR: STABLE | MODE: Charging | T: ");
+  Serial.println(millis());
+}
+
+uint8_t crc8(const uint8_t *data, uint8_t len) {
+  uint8_t crc = 0;
+  for (uint8_t i = 0; i < len; i++) {
+    crc ^= data[i];
+    for (uint8_t b = 0; b < 8; b++) {
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : (crc << 1);
+    }
+  }
+  return crc;
+}
+
+void sendFrame(uint16_t adc) {
+  uint8_t frame[11];
+  unsigned long now = millis();
+  frame[0] = 0xA5;
+  frame[1] = frameSeq & 0xFF;
+  frame[2] = frameSeq >> 8;
+  frame[3] = now & 0xFF;
+  frame[4] = (now >> 8) & 0xFF;
+  frame[5] = (now >> 16) & 0xFF;
+  frame[6] = (now >> 24) & 0xFF;
+  frame[7] = adc & 0xFF;
+  frame[8] = adc >> 8;
+  frame[9] = reportedMode;
+  frame[10] = crc8(frame + 1, 9);
+  Serial.write(frame, 11);
+  frameSeq++;
+}
+
+// Replaces delay(): in binary mode keeps sending frames every frameIntervalMs while waiting.
+void waitWithFrames(unsigned long ms) {
+  if (!binaryMode) {
+    delay(ms);
+    return;
+  }
+  unsigned long start = millis();
+  while (millis() - start < ms) {
+    if (millis() - lastFrameTime >= frameIntervalMs) {
+      lastFrameTime = millis();
+      sendFrame(reportZero ? 0 : analogRead(voltagePin));
+    }
+  }
 }
 
 void startCharging() {
@@ -267,6 +339,18 @@ void handlePiMessage() {
       } else {
         Serial.println("Invalid time value. Must be greater than 0.");
       }
+    } else if (message.startsWith("BIN:")) {
+      binaryMode = message.substring(4).toInt() == 1;
+      Serial.print("Binary telemetry ");
+      Serial.println(binaryMode ? "ON" : "OFF");
+    } else if (message.startsWith("RATE:")) {
+      unsigned long val = message.substring(5).toInt();
+      if (val > 0) {
+        frameIntervalMs = val;
+        Serial.print("Updated frame interval to: ");
+        Serial.print(frameIntervalMs);
+        Serial.println(" ms");
+      }
     } else if (message.equalsIgnoreCase("STOP")) {
       simulationRunning = false;
       stopAllRelays();
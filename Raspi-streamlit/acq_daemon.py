@@ -0,0 +1,169 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from device_manager import DeviceManager
+from metrics import METRICS
+
+# ---- Acquisition Daemon ----
+# Owns every serial port and sample store so experiments keep running when the
+# dashboard (or a browser tab) dies. The Streamlit apps talk to it over a small
+# local JSON API; see daemon_client.py.
+#
+#   GET  /devices                               -> ["/dev/ttyACM0", ...]
+#   GET  /status?port=P                         -> worker status
+#   GET  /samples?port=P&since=N&generation=G   -> samples appended after seq N
+#   GET  /chart?port=P&window=S                 -> downsampled chart points
+#   GET  /events?port=P&n=20                    -> recent firmware messages
+#   GET  /transactions?port=P&n=5               -> recent config pushes and their acks
+#   GET  /metrics                               -> Prometheus text format
+#   POST /scan                                  -> rescan for boards
+#   POST /connect | /close | /end_run           {"port"}
+#   POST /write                                 {"port", "data"}
+#   POST /binary                                {"port", "enabled", "interval_ms"}
+#   POST /send_config                           {"port", "lines", "timeout", "retries"}
+#   POST /begin_run                             {"port", "voltage", "meta"}
+#   POST /resume                                {"port", "path"} reload a run log
+#   POST /continue_run                          {"port"} record on into the reloaded log
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    manager = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body, code=200):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _reply_text(self, text):
+        data = text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _worker(self, port):
+        if port not in self.manager.ports():
+            raise KeyError(f"Unknown board {port}")
+        return self.manager.get(port)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == "/devices":
+                self._reply(self.manager.ports())
+            elif url.path == "/metrics":
+                self._reply_text(METRICS.prometheus())
+            elif url.path == "/status":
+                self._reply(self._worker(query["port"]).status())
+            elif url.path == "/samples":
+                generation = query.get("generation")
+                generation, start_seq, end_seq, seconds, voltage, state = self._worker(query["port"]).read_since(
+                    int(query.get("since", 0)), int(generation) if generation is not None else None)
+                self._reply({
+                    "generation": generation, "start": start_seq, "seq": end_seq,
+                    "seconds": seconds.tolist(), "voltage": voltage.tolist(), "state": state.tolist(),
+                })
+            elif url.path == "/chart":
+                window = query.get("window")
+                frame = self._worker(query["port"]).chart_frame(float(window) if window else None)
+                self._reply({"seconds": frame["Seconds"].tolist(), "voltage": frame["Voltage"].tolist()})
+            elif url.path == "/events":
+                self._reply(self._worker(query["port"]).recent_events(int(query.get("n", 20))))
+            elif url.path == "/transactions":
+                self._reply(self._worker(query["port"]).recent_transactions(int(query.get("n", 5))))
+            else:
+                self._reply({"error": "not found"}, 404)
+        except KeyError as e:
+            self._reply({"error": e.args[0] if e.args else str(e)}, 404)
+        except Exception as e:
+            self._reply({"error": str(e)}, 500)
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("body is not a JSON object")
+        except ValueError as e:
+            self._reply({"error": f"bad request: {e}"}, 400)
+            return
+        try:
+            if self.path == "/scan":
+                self._reply(self.manager.scan())
+                return
+            worker = self._worker(body["port"])
+            if self.path == "/connect":
+                self._reply({"connected": worker.connect(), "error": str(worker.error) if worker.error else None})
+            elif self.path == "/close":
+                worker.close()
+                self._reply({"ok": True})
+            elif self.path == "/write":
+                worker.write(body["data"].encode())
+                self._reply({"ok": True})
+            elif self.path == "/binary":
+                worker.set_binary(body["enabled"], body.get("interval_ms", 10))
+                self._reply({"ok": True})
+            elif self.path == "/send_config":
+                self._reply(worker.send_config(body["lines"], body.get("timeout", 3.0), body.get("retries", 2)))
+            elif self.path == "/begin_run":
+                worker.begin_run(body.get("voltage", 0.0), body.get("meta"))
+                self._reply({"ok": True})
+            elif self.path == "/resume":
+                self._reply({"ok": worker.resume(body.get("path"))})
+            elif self.path == "/continue_run":
+                self._reply({"ok": worker.continue_run()})
+            elif self.path == "/end_run":
+                worker.end_run()
+                self._reply({"ok": True})
+            else:
+                self._reply({"error": "not found"}, 404)
+        except KeyError as e:
+            self._reply({"error": e.args[0] if e.args else str(e)}, 404)
+        except Exception as e:
+            self._reply({"error": str(e)}, 500)
+
+
+def rescan_forever(manager, interval):
+    while True:
+        time.sleep(interval)
+        manager.scan()
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, rescan=10.0):
+    manager = DeviceManager(115200)
+    manager.scan()
+    DaemonHandler.manager = manager
+    if rescan:
+        threading.Thread(target=rescan_forever, args=(manager, rescan), daemon=True).start()
+    server = ThreadingHTTPServer((host, port), DaemonHandler)
+    print(f"FNM acquisition daemon on http://{host}:{port} ({', '.join(manager.ports()) or 'no boards yet'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        manager.close_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless serial acquisition for the FNM dashboards.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--rescan", type=float, default=10.0, help="seconds between board scans (0 = off)")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.rescan)
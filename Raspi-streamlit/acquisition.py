@@ -0,0 +1,516 @@
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import serial
+from serial.tools import list_ports
+
+from clock_sync import ClockSync
+from command_channel import CommandChannel
+from cycles import CycleDetector, CycleStats
+from downsample import LevelOfDetail
+from frames import BINARY_OFF, BINARY_ON, DEFAULT_INTERVAL_MS, FrameDecoder
+from metrics import METRICS
+from phase_metrics import MetricsLog, PhaseMetrics
+from protocol import LineParser
+from retention import Retention
+from sample_store import STATE_CODES, SampleStore
+from segment_log import LOG_DIR, SegmentWriter, latest_log, new_log_path, recover, reopen
+from serial_reader import SerialReader
+
+CHARGING = STATE_CODES["Charging"]
+BOOT_DELAY = 2.0     # bootloader time after the board resets
+RETRY_MIN = 0.5      # reconnect backoff, doubled per failed attempt
+RETRY_MAX = 8.0
+CYCLE_THRESHOLD = 0.05  # V; decoupled.ino treats the cell as discharged at or below this
+# Long-run mode (retention.py): keep full resolution for this many minutes, roll older
+# samples up per second / per minute. 0 keeps every sample in memory.
+RETENTION_MINUTES = float(os.environ.get("FNM_RETENTION_MINUTES", "0"))
+
+
+# ---- Port Helpers ----
+def usb_serial_number(device):
+    for info in list_ports.comports():
+        if info.device == device:
+            return info.serial_number
+    return None
+
+
+def find_serial_number(serial_number):
+    # The same board can come back under another name (ttyACM0 -> ttyACM1) after a USB rebind.
+    for info in list_ports.comports():
+        if serial_number and info.serial_number == serial_number:
+            return info.device
+    return None
+
+
+def keep_dtr(ser):
+    # Clears HUPCL so closing the port no longer drops DTR, and with it the next open
+    # no longer resets the board. Returns whether HUPCL was still set, i.e. whether
+    # this open most likely just reset the board.
+    try:
+        import termios
+        attrs = termios.tcgetattr(ser.fd)
+        was_set = bool(attrs[2] & termios.HUPCL)
+        attrs[2] &= ~termios.HUPCL
+        termios.tcsetattr(ser.fd, termios.TCSANOW, attrs)
+        return was_set
+    except (ImportError, AttributeError, OSError):
+        return True
+
+
+# ---- Acquisition Worker ----
+# Owns the serial port and drains it on its own thread, so samples are
+# stamped when they arrive instead of when the next Streamlit rerun happens.
+# The UI only ever takes snapshots of the sample store under the lock.
+# The port stays open across runs; if the board drops off the bus the thread
+# reopens it with backoff while the command channel holds queued commands.
+class AcquisitionWorker:
+    def __init__(self, port="/dev/ttyACM0", baudrate=115200, maxlen=None, log_dir=LOG_DIR, retention=RETENTION_MINUTES):
+        self.port = port
+        self.device = port  # current device path, may change after a rebind
+        self.serial_number = None
+        self.baudrate = baudrate
+        self.ser = None
+        self.reader = None
+        self.error = None
+        self.link_wanted = False
+        self.ready_at = 0.0
+        self.reconnects = 0
+        self.config = None  # last config pushed, replayed after the board reboots mid-run
+        self._backoff = RETRY_MIN
+        self._retry_at = 0.0
+
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.store = SampleStore(maxlen=maxlen)
+        self.retention = Retention(retention * 60) if retention else None
+        self.lod = LevelOfDetail()
+        self.writer = None
+        self.metrics_log = None  # .phases.csv / .cycles.csv / .summary.json next to the log
+        self.log_path = None
+        self.recovered = False
+        self.log_dir = log_dir
+        self.log_prefix = f"run-{os.path.basename(port)}"
+        self.meta = {}
+        self.voltage = 1.0
+        self.charging = True
+        self.recording = False
+        self.start_time = time.monotonic()
+        self.stop_time = None
+        self.parser = LineParser()
+        self.decoder = FrameDecoder()
+        self.clock = ClockSync()
+        self.events = deque(maxlen=200)  # (wall clock, kind, text) of non-sample lines
+        self.cycles = CycleDetector(CYCLE_THRESHOLD)
+        self.cycle_stats = CycleStats()
+        self.phase_metrics = PhaseMetrics()
+        self.commands = CommandChannel(self.write, ready=self.ready)
+
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._reset_metrics()
+
+    # ---- Connection ----
+    def connect(self, device=None):
+        # Never sleeps: if opening reset the board, queued commands wait for ready_at instead.
+        self.link_wanted = True
+        device = device or self.device
+        try:
+            ser = serial.Serial(device, self.baudrate, timeout=0.1)
+            reset = keep_dtr(ser)
+            ser.reset_input_buffer()
+        except Exception as e:
+            self.error = e
+            return False
+        with self.lock:
+            self.ser = ser
+            self.reader = SerialReader(ser)
+            self.device = device
+            self.serial_number = usb_serial_number(device) or self.serial_number
+            self.error = None
+            self.ready_at = time.monotonic() + (BOOT_DELAY if reset else 0.0)
+            self.parser.reset()
+            self.decoder.reset()
+            self.clock.reset()  # opening may reset the board, restarting millis()
+        return True
+
+    def close(self):
+        self.link_wanted = False
+        self._drop()
+
+    def _drop(self):
+        with self.lock:
+            ser = self.ser
+            self.ser = None
+        if ser:
+            with self.write_lock:
+                try:
+                    ser.close()
+                except Exception:
+                    pass
+
+    @property
+    def connected(self):
+        return self.ser is not None
+
+    def ready(self):
+        return self.ser is not None and time.monotonic() >= self.ready_at
+
+    @property
+    def link(self):
+        if self.ser is not None:
+            return "up"
+        return "reconnecting" if self.link_wanted else "closed"
+
+    def write(self, data):
+        ser = self.ser
+        if not ser:
+            raise serial.SerialException("Serial not connected.")
+        with self.write_lock:
+            ser.write(data)
+
+    def set_binary(self, enabled, interval_ms=DEFAULT_INTERVAL_MS):
+        # Frames and text share the stream, so the decoder needs no mode switch of its own.
+        if enabled:
+            self.write(f"RATE:{int(interval_ms)}\n".encode())
+        self.write(BINARY_ON if enabled else BINARY_OFF)
+
+    def send_config(self, lines, timeout=3.0, retries=2):
+        # Returns at once; the acks are tracked by the command channel (see recent_transactions).
+        lines = list(lines)
+        if lines != ["STOP"]:
+            self.config = lines
+        return self.commands.submit(lines, timeout, retries).as_dict()
+
+    def recent_transactions(self, n=5):
+        return self.commands.recent(n)
+
+    # ---- Run Control ----
+    def begin_run(self, voltage, meta=None):
+        start_wall = time.time()
+        # The Pi's UTC offset, so analysis on another machine (or in UTC) gets the lab's local time.
+        meta = dict(meta or {}, port=self.port, start_wall=start_wall, utc_offset=time.localtime(start_wall).tm_gmtoff)
+        with self.lock:
+            if self.writer:
+                self.writer.close()
+            self.store.clear()
+            if self.retention:
+                self.retention.clear()
+            self.cycles.reset()
+            self.cycle_stats.reset()
+            self.phase_metrics.reset()
+            self.voltage = voltage
+            self.charging = True
+            self.start_time = time.monotonic()
+            self.stop_time = None
+            self.meta = meta
+            self.log_path = new_log_path(self.log_dir, self.log_prefix)
+            self.writer = SegmentWriter(self.log_path, meta)
+            self.metrics_log = MetricsLog(self.log_path)
+            self.recovered = False
+            self.recording = True
+
+    def end_run(self):
+        with self.lock:
+            self.recording = False
+            self.stop_time = time.monotonic()
+            if self.writer:
+                self.writer.close()
+                self.writer = None
+            if self.metrics_log:
+                self.metrics_log.write_summary(self.phase_metrics.summary())
+                self.metrics_log = None
+
+    def resume(self, path=None):
+        # Reloads the newest run log after a restart; a torn tail from a crash is cut off.
+        path = path or latest_log(self.log_dir, self.log_prefix)
+        if not path:
+            return False
+        recovered = recover(path)
+        if recovered is None:
+            self._event("log", f"Skipped unreadable run log {os.path.basename(path)} (moved to .bad)")
+            return False
+        meta, seconds, voltage, state = recovered
+        with self.lock:
+            self.store.clear()
+            self.store.extend(seconds, voltage, state)
+            if self.retention:
+                self.retention.clear()
+                self.retention.trim(self.store)
+            self.cycles.reset()
+            self.cycle_stats.reset()
+            self.cycle_stats.add(self.cycles.feed(seconds, voltage))
+            # The sidecars already hold the phases finished before the restart.
+            self.phase_metrics.reset()
+            self.phase_metrics.feed(seconds, voltage, state)
+            last = seconds[-1] if len(seconds) else 0.0
+            self.stop_time = time.monotonic()
+            self.start_time = self.stop_time - last
+            self.log_path = path
+            self.meta = meta
+            self.recovered = not meta["closed"]
+            if len(voltage):
+                self.voltage = float(voltage[-1])
+        return True
+
+    def continue_run(self):
+        # After a restart: records on into the recovered run's log, on the run's own clock
+        # (seconds since its start_wall, so the outage shows as a gap).
+        with self.lock:
+            if self.recording or not self.log_path or "start_wall" not in self.meta:
+                return False
+            meta = {key: value for key, value in self.meta.items() if key != "closed"}
+            self.start_time = time.monotonic() - (time.time() - meta["start_wall"])
+            self.stop_time = None
+            self.meta = meta
+            reopen(self.log_path)
+            self.writer = SegmentWriter(self.log_path, meta)
+            self.metrics_log = MetricsLog(self.log_path)
+            self.recording = True
+        return True
+
+    def elapsed(self):
+        end = self.stop_time if self.stop_time is not None else time.monotonic()
+        return end - self.start_time
+
+    def snapshot(self):
+        with self.lock:
+            return self.store.to_frame()
+
+    def chart_frame(self, window=None):
+        history = None
+        with self.lock:
+            seconds, voltage, _ = self.store.view()
+            first_seq = self.store.seq - len(self.store)
+            generation = self.store.generation
+            if self.retention and len(seconds):
+                # Rolled-up rows are updated in place, so their points are taken under the lock.
+                history = self.retention.history(None if window is None else float(seconds[-1]) - window, self.lod.budget)
+        frame = self.lod.frame(seconds, voltage, first_seq, generation, window)
+        if history is not None and len(history[0]):
+            frame = pd.concat([pd.DataFrame({"Seconds": history[0], "Voltage": history[1]}), frame], ignore_index=True)
+        return frame
+
+    def recent_events(self, n=20):
+        with self.lock:
+            return list(self.events)[-n:]
+
+    def last(self):
+        with self.lock:
+            return self.store.last()
+
+    def version(self):
+        # Changes whenever a sample is added or a new run starts.
+        with self.lock:
+            return self.store.generation, self.store.seq
+
+    def cycle_summary(self):
+        with self.lock:
+            return self.cycle_stats.summary()
+
+    def phase_summary(self):
+        with self.lock:
+            return self.phase_metrics.summary()
+
+    def last_state(self):
+        last = self.last()
+        return last[2] if last else None
+
+    def read_since(self, seq=0, generation=None):
+        # Samples appended after absolute index `seq`; a new run (generation) starts over from 0.
+        with self.lock:
+            seconds, voltage, state = self.store.view()
+            first_seq = self.store.seq - len(self.store)
+            current = self.store.generation
+            end_seq = self.store.seq
+        if generation is not None and generation != current:
+            seq = 0
+        start = min(max(seq - first_seq, 0), len(seconds))
+        return current, first_seq + start, end_seq, seconds[start:], voltage[start:], state[start:]
+
+    def status(self):
+        last = self.last()
+        return {
+            "port": self.port,
+            "device": self.device,
+            "connected": self.connected,
+            "link": self.link,
+            "reconnects": self.reconnects,
+            "error": str(self.error) if self.error else None,
+            "recording": self.recording,
+            "voltage": self.voltage,
+            "charging": bool(self.charging),
+            "meta": self.meta,
+            "recovered": self.recovered,
+            "log_path": self.log_path,
+            "elapsed": self.elapsed(),
+            "samples": len(self.store),
+            "retention": self.retention.stats() if self.retention else None,
+            "seq": self.store.seq,
+            "generation": self.store.generation,
+            "last": last,
+            "cycles": self.cycle_summary(),
+            "phases": self.phase_summary(),
+            "frames": {"frames": self.decoder.frames, "dropped": self.decoder.dropped, "bad_crc": self.decoder.bad_crc},
+            "reader": self.reader.stats() if self.reader else None,
+            "clock": self.clock.stats(),
+        }
+
+    # ---- Thread ----
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"acq-{self.port}", daemon=True)
+        self._thread.start()
+        self.commands.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.commands.stop()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            ser = self.ser
+            if ser is None:
+                if self.link_wanted and time.monotonic() >= self._retry_at:
+                    self._reconnect()
+                else:
+                    time.sleep(0.1)
+                continue
+            reader = self.reader
+            try:
+                chunk = reader.read()
+            except Exception as e:
+                self._lost(e)
+                continue
+            arrival = time.monotonic()
+            if chunk:
+                self._handle_chunk(chunk, arrival)
+            with self.lock:
+                if self.writer:
+                    self.writer.tick()
+            if arrival - self._published >= 1.0:
+                self._publish_metrics()
+
+    def _lost(self, e):
+        self.error = e
+        self._drop()
+        self._backoff = RETRY_MIN
+        self._retry_at = time.monotonic() + self._backoff
+        self._event("link", f"Board disconnected: {e}")
+
+    def _reconnect(self):
+        device = find_serial_number(self.serial_number) or self.device
+        if not self.connect(device):
+            self._backoff = min(self._backoff * 2, RETRY_MAX)
+            self._retry_at = time.monotonic() + self._backoff
+            return
+        # A USB rebind power-cycles the board, so assume it rebooted and lost its config.
+        self.ready_at = max(self.ready_at, time.monotonic() + BOOT_DELAY)
+        self.reconnects += 1
+        self._event("link", f"Reconnected on {device}")
+        if self.recording and self.config:
+            self.commands.submit(self.config)
+
+    def _event(self, kind, text):
+        with self.lock:
+            self.events.append((time.strftime("%H:%M:%S"), kind, text))
+
+    def _handle_chunk(self, chunk, arrival):
+        start = time.perf_counter()
+        unparsed = self.parser.unparsed
+        frames, text = self.decoder.feed(chunk)
+        decoded = time.perf_counter()
+        batch = self.parser.feed(text)
+        parsed = time.perf_counter()
+        with self.lock:
+            if batch.events:
+                stamp = time.strftime("%H:%M:%S")
+                self.events.extend((stamp, kind, line) for kind, line in batch.events)
+            if len(batch) and len(frames):
+                # Text lines and frames interleave in the stream: record them in board-time order.
+                seconds = np.concatenate([self._stamp(batch.millis, arrival), self._stamp(frames.millis, arrival)])
+                order = np.argsort(seconds, kind="stable")
+                self._record(seconds[order], np.concatenate([batch.voltage, frames.voltage])[order],
+                             np.concatenate([batch.state, frames.state])[order])
+            elif len(batch):
+                self._record(self._stamp(batch.millis, arrival), batch.voltage, batch.state)
+            elif len(frames):
+                self._record(self._stamp(frames.millis, arrival), frames.voltage, frames.state)
+        if batch.events:
+            self.commands.on_events(batch.events, arrival)
+
+        counts = self._counts
+        counts["bytes"] += len(chunk)
+        counts["reads"] += 1
+        counts["lines"] += batch.lines
+        counts["text"] += len(batch)
+        counts["frame"] += len(frames)
+        counts["unparsed"] += self.parser.unparsed - unparsed
+        for stage, seconds in (("decode", decoded - start), ("parse", parsed - decoded),
+                               ("record", time.perf_counter() - parsed)):
+            timing = self._timings[stage]
+            timing[0] += 1
+            timing[1] += seconds
+            if seconds > timing[2]:
+                timing[2] = seconds
+
+    def _publish_metrics(self):
+        port, counts = self.port, self._counts
+        METRICS.inc("fnm_serial_bytes_total", counts["bytes"], port=port)
+        METRICS.inc("fnm_serial_reads_total", counts["reads"], port=port)
+        METRICS.inc("fnm_lines_total", counts["lines"], port=port)
+        METRICS.inc("fnm_samples_total", counts["text"], port=port, source="text")
+        METRICS.inc("fnm_samples_total", counts["frame"], port=port, source="frame")
+        METRICS.inc("fnm_unparsed_lines_total", counts["unparsed"], port=port)
+        for stage, (count, total, worst) in self._timings.items():
+            METRICS.observe_many("fnm_ingest_seconds", count, total, worst, port=port, stage=stage)
+        reader = self.reader
+        if reader:
+            METRICS.set("fnm_serial_buffer_bytes", reader.waiting, port=port)
+            METRICS.set("fnm_serial_buffer_high_water_bytes", reader.waiting_high, port=port)
+            METRICS.set("fnm_serial_chunk_high_water_bytes", reader.chunk_high, port=port)
+            METRICS.set("fnm_serial_rate_bytes", reader.rate, port=port)
+            METRICS.set("fnm_serial_coalesced", reader.delayed, port=port)
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self._counts = dict.fromkeys(("bytes", "reads", "lines", "text", "frame", "unparsed"), 0)
+        self._timings = {stage: [0, 0.0, 0.0] for stage in ("decode", "parse", "record")}
+        self._published = time.monotonic()
+
+    def _stamp(self, millis, arrival):
+        # Run seconds of each sample: its board millis() mapped through the clock sync, so
+        # samples read in one chunk keep their own times; the chunk's arrival for text
+        # lines from sketches that do not send T.
+        seconds = np.full(len(millis), arrival - self.start_time)
+        known = millis >= 0
+        if known.any():
+            board = self.clock.board_seconds(millis[known])
+            self.clock.observe(float(board[-1]), arrival)
+            seconds[known] = self.clock.to_host(board) - self.start_time
+        return seconds
+
+    def _record(self, seconds, voltage, state):
+        self.voltage = float(voltage[-1])
+        self.charging = (state[-1] == CHARGING)
+        if self.recording:
+            # Keep the time axis sorted for the chart even if a frame's millis() lags the last text sample.
+            last = self.store.last()
+            seconds = np.maximum(seconds, last[0] if last else 0.0)
+            self.store.extend(seconds, voltage, state)
+            if self.retention:
+                self.retention.trim(self.store)
+            self.writer.extend(seconds, voltage, state)
+            self.cycle_stats.add(self.cycles.feed(seconds, voltage))
+            phases, cycles = self.phase_metrics.feed(seconds, voltage, state)
+            if phases:
+                self.metrics_log.append(phases, cycles)
+                self.metrics_log.write_summary(self.phase_metrics.summary())
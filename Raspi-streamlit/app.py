@@ -1,26 +1,21 @@
 import streamlit as st
-import time
-import pandas as pd
-import altair as alt
-import serial
-import re
-from streamlit_autorefresh import st_autorefresh
+import os
+from command_channel import describe
+from daemon_client import DaemonClient
+from ui import HEADERS, WAITING, format_time, readout
 
 st.set_page_config(page_title="Electrolyzer Dashboard", layout="centered")
-st_autorefresh(interval=400, key="autorefresh")
+
+# ---- Live Refresh ----
+# Only the live sections below are fragments that rerun on their own every LIVE_INTERVAL
+# seconds; the inputs, the buttons and the rest of the page rerun only when used.
+LIVE_INTERVAL = 0.25
 
 
 # ---- UI & Style ----
-st.markdown("""
-    <style>
-    body { background-color: #f5fff5; }
-    .title { text-align: center; color: #2E8B57; font-size: 36px; font-weight: bold; }
-    .subtitle { text-align: center; color: #444; font-size: 18px; margin-top: -10px; }
-    </style>
-    <div class='title'>FNM Team</div>
-    <div class='subtitle'>Supercapacitive Electrolyzer Dashboard</div>
-    <hr style="margin-top:10px;"/>
-""", unsafe_allow_html=True)
+# Static markup is built once per process in ui.py; altair and the acquisition stack
+# are imported where they are first needed.
+st.markdown(HEADERS["electrolyzer"], unsafe_allow_html=True)
 
 # ---- Input ----
 col1, col2 = st.columns(2)
@@ -35,16 +30,34 @@ with st.container():
 
 
 # ---- Serial ----
-if "ser" not in st.session_state:
-    try:
-        st.session_state.ser = serial.Serial('/dev/ttyACM0', 115200, timeout=0.1)
-        # st.session_state.ser = serial.Serial('/dev/ttyACM1', 115200, timeout=0.1)
-        time.sleep(2)
-        st.session_state.ser.reset_input_buffer()
+@st.cache_resource
+def get_worker():
+    # When acq_daemon.py is running it owns the port and this page is only a client.
+    client = DaemonClient()
+    if client.available():
+        return client.get('/dev/ttyACM0')
+    from acquisition import AcquisitionWorker
+
+    worker = AcquisitionWorker('/dev/ttyACM0', 115200)
+    # worker = AcquisitionWorker('/dev/ttyACM1', 115200)
+    worker.resume()
+    worker.connect()
+    worker.start()
+    return worker
+
+worker = get_worker()
+
+if "serial_checked" not in st.session_state:
+    st.session_state.serial_checked = True
+    if worker.connected:
         st.success("Serial connected.")
-    except Exception as e:
-        st.session_state.ser = None
-        st.error(f"Serial connection failed: {e}")
+    else:
+        st.error(f"Serial connection failed: {worker.error}")
+    if worker.recovered:
+        st.warning(f"Recovered interrupted run from {os.path.basename(worker.log_path)}.")
+
+if worker.link == "reconnecting":
+    st.warning(f"Board link lost ({worker.error}); reconnecting, commands are queued meanwhile.")
 
 # ---- Send to Arduino ----
 # if st.button("Send to Arduino"):
@@ -60,165 +73,98 @@ if "ser" not in st.session_state:
 #             st.error(f"Failed to send: {e}")
 # ---- Send to Arduino ----
 
-if "sent" not in st.session_state:
-    st.session_state.sent = False
-
 # if st.button("Send to Arduino"):
-if st.button("Send to Arduino", disabled=st.session_state.sent):
-    if not st.session_state.ser:
-        try:
-            st.session_state.ser = serial.Serial('/dev/ttyACM0', 115200, timeout=0.1)
-            # st.session_state.ser = serial.Serial('/dev/ttyACM1', 115200, timeout=0.1)
-            time.sleep(2)
-            st.session_state.ser.reset_input_buffer()
-            st.success("Serial connected.")
-        except Exception as e:
-            st.session_state.ser = None
-            st.error(f"Serial connection failed: {e}")
-
-    if st.session_state.ser:
-        try:
-            st.session_state.voltage = min_voltage
-            st.session_state.charging = True
-            st.session_state.data = []
-            st.session_state.start_time = time.time()
-            st.session_state.running = True
-            st.session_state.sent = True
-            # -------------------------------------
-            st.session_state.ser.write(f"Peak:{peak_voltage:.2f}\n".encode())
-            time.sleep(0.05)
-            st.session_state.ser.write(f"Min:{min_voltage:.2f}\n".encode())
-            time.sleep(0.05)
-            discharge_milli_seconds = int(discharge_minutes * 60 * 1000)
-            st.session_state.ser.write(f"Time:{discharge_milli_seconds}\n".encode())
-            time.sleep(0.05)
-            print(f"Peak:{peak_voltage:.2f}")
-            print(f"Min:{min_voltage:.2f}")
-            print(f"Time:{discharge_milli_seconds}")
-            st.success("Sent to Arduino and RESET all states.")
-        except Exception as e:
-            st.error(f"Failed to send: {e}")
-
-# ---- Init State ----
-if "voltage" not in st.session_state:
-    st.session_state.voltage = 1.0
-if "charging" not in st.session_state:
-    st.session_state.charging = True
-if "data" not in st.session_state:
-    st.session_state.data = []
-if "start_time" not in st.session_state:
-    st.session_state.start_time = time.time()
-if "running" not in st.session_state:
-    st.session_state.running = False
-
-# ---- Real-time Serial Read ----
-if st.session_state.running and st.session_state.ser:
+if st.button("Send to Arduino", disabled=worker.recording):
+    if not worker.connected:
+        st.warning(f"Board offline ({worker.error}); the config is queued until it reconnects.")
+
     try:
-        while st.session_state.ser.in_waiting > 0:
-            line = st.session_state.ser.readline().decode('utf-8', errors='ignore').strip()
-            if line:
-                match = re.search(r"VOLTAGE:\s*([0-9.]+)\s*\|\s*DIR:\s*(\w+)\s*\|\s*MODE:\s*(\w+)", line)
-                if match:
-                    voltage = float(match.group(1))
-                    mode = match.group(3)
-                    st.session_state.voltage = voltage
-                    st.session_state.charging = (mode == "Charging")
-                    elapsed = int(time.time() - st.session_state.start_time)
-                    st.session_state.data.append({
-                        "Seconds": elapsed,
-                        "Voltage": voltage,
-                        "State": mode
-                    })
+        worker.begin_run(min_voltage, {"mode": "Decoupled", "peak": peak_voltage, "min": min_voltage, "discharge_min": discharge_minutes})
+        # -------------------------------------
+        discharge_milli_seconds = int(discharge_minutes * 60 * 1000)
+        lines = [f"Peak:{peak_voltage:.2f}", f"Min:{min_voltage:.2f}", f"Time:{discharge_milli_seconds}"]
+        worker.send_config(lines)
+        print("\n".join(lines))
+        st.success("Sent to Arduino and RESET all states.")
     except Exception as e:
-        st.error(f"Error reading serial: {e}")
-
-# ---- Display Voltage ----
-# color = "#2E8B57" if st.session_state.charging else "#F44336"
-# st.markdown(
-#     f"<span style='font-size: 35px; color: {color}; font-weight: 600;'> Voltage (V): {st.session_state.voltage:.3f} V</span>",
-#     unsafe_allow_html=True
-# )
-# ---- Display Voltage + State ----
-if st.session_state.data:
-    latest_state = st.session_state.data[-1]["State"]
-    if latest_state == "Stop":
-        state_text = "Stop"
-        state_color = "#FFFFFF"
-        color = "#888888"
-    elif latest_state == "Charging":
-        state_text = "Charging"
-        state_color = "#0099FF"
-        color = "#2E8B57"
-    elif latest_state == "Discharging":
-        state_text = "Discharging"
-        state_color = "#F44336"
-        color = "#F44336"
+        st.error(f"Failed to send: {e}")
+
+@st.fragment(run_every=LIVE_INTERVAL)
+def live_status():
+    # ---- Config Acknowledgements ----
+    transactions = worker.recent_transactions(1)
+    if transactions:
+        st.caption("Last config push: " + " · ".join(describe(command) for command in transactions[-1]["commands"]))
+
+    # ---- Latest Sample ----
+    # The worker thread drains the port continuously; a rerun only reads its latest sample.
+    last = worker.last()
+
+    # ---- Display Voltage ----
+    # color = "#2E8B57" if st.session_state.charging else "#F44336"
+    # st.markdown(
+    #     f"<span style='font-size: 35px; color: {color}; font-weight: 600;'> Voltage (V): {st.session_state.voltage:.3f} V</span>",
+    #     unsafe_allow_html=True
+    # )
+    # ---- Display Voltage + State ----
+    if last:
+        st.markdown(readout(worker.voltage, last[2]), unsafe_allow_html=True)
     else:
-        state_text = latest_state
-        state_color = "#888888"
-        color = "#888888"
-
-    st.markdown(
-        f"""
-        <div style='display:flex;align-items:center;gap:20px;'>
-            <span style='font-size: 35px; color: {color}; font-weight: 600;'>
-                Voltage (V): {st.session_state.voltage:.3f} V
-            </span>
-            <span style='font-size: 28px; color: {state_color}; font-weight: 600; background-color:#222; padding:4px 16px; border-radius:12px;'>
-                [{state_text}]
-            </span>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
-else:
-    st.markdown(
-        "<span style='font-size: 20px; color: #888;'>Waiting for Arduino data...</span>",
-        unsafe_allow_html=True
-    )
-
-# if st.session_state.data:
-#     color = "#2E8B57" if st.session_state.charging else "#F44336"
-#     state_text = "Charging" if st.session_state.charging else "Discharging"
-#     state_color = "#0099FF" if st.session_state.charging else "#F44336"
-
-#     st.markdown(
-#         f"""
-#         <div style='display:flex;align-items:center;gap:20px;'>
-#             <span style='font-size: 35px; color: {color}; font-weight: 600;'>
-#                 Voltage (V): {st.session_state.voltage:.3f} V
-#             </span>
-#             <span style='font-size: 28px; color: {state_color}; font-weight: 600;'>
-#                 [{state_text}]
-#             </span>
-#         </div>
-#         """,
-#         unsafe_allow_html=True
-#     )
-# else:
-#     st.markdown(
-#         "<span style='font-size: 20px; color: #888;'>Waiting for Arduino data...</span>",
-#         unsafe_allow_html=True
-#     )
-
-# color = "#2E8B57" if st.session_state.charging else "#F44336"
-# state_text = "Charging" if st.session_state.charging else "Discharging"
-# state_color = "#0099FF" if st.session_state.charging else "#F44336"
-
-# st.markdown(
-#     f"""
-#     <div style='display:flex;align-items:center;gap:20px;'>
-#         <span style='font-size: 35px; color: {color}; font-weight: 600;'>
-#             Voltage (V): {st.session_state.voltage:.3f} V
-#         </span>
-#         <span style='font-size: 28px; color: {state_color}; font-weight: 600;'>
-#             [{state_text}]
-#         </span>
-#     </div>
-#     """,
-#     unsafe_allow_html=True
-# )
-
+        st.markdown(WAITING, unsafe_allow_html=True)
+
+    # if st.session_state.data:
+    #     color = "#2E8B57" if st.session_state.charging else "#F44336"
+    #     state_text = "Charging" if st.session_state.charging else "Discharging"
+    #     state_color = "#0099FF" if st.session_state.charging else "#F44336"
+
+    #     st.markdown(
+    #         f"""
+    #         <div style='display:flex;align-items:center;gap:20px;'>
+    #             <span style='font-size: 35px; color: {color}; font-weight: 600;'>
+    #                 Voltage (V): {st.session_state.voltage:.3f} V
+    #             </span>
+    #             <span style='font-size: 28px; color: {state_color}; font-weight: 600;'>
+    #                 [{state_text}]
+    #             </span>
+    #         </div>
+    #         """,
+    #         unsafe_allow_html=True
+    #     )
+    # else:
+    #     st.markdown(
+    #         "<span style='font-size: 20px; color: #888;'>Waiting for Arduino data...</span>",
+    #         unsafe_allow_html=True
+    #     )
+
+    # color = "#2E8B57" if st.session_state.charging else "#F44336"
+    # state_text = "Charging" if st.session_state.charging else "Discharging"
+    # state_color = "#0099FF" if st.session_state.charging else "#F44336"
+
+    # st.markdown(
+    #     f"""
+    #     <div style='display:flex;align-items:center;gap:20px;'>
+    #         <span style='font-size: 35px; color: {color}; font-weight: 600;'>
+    #             Voltage (V): {st.session_state.voltage:.3f} V
+    #         </span>
+    #         <span style='font-size: 28px; color: {state_color}; font-weight: 600;'>
+    #             [{state_text}]
+    #         </span>
+    #     </div>
+    #     """,
+    #     unsafe_allow_html=True
+    # )
+
+
+    # ---- Arduino Messages ----
+    with st.expander("Arduino Messages"):
+        events = worker.recent_events()
+        if events:
+            st.text("\n".join(f"{stamp} [{kind}] {text}" for stamp, kind, text in events))
+        else:
+            st.caption("No messages yet.")
+
+
+live_status()
 
 # ---- Control Buttons ----
 # colA, colB = st.columns(2)
@@ -234,16 +180,13 @@ else:
 #         st.session_state.running = False
 # ---- Control Button ----
 if st.button("Stop"):
-    if st.session_state.ser:
-        try:
-            st.session_state.ser.write(b"STOP\n")
-            st.session_state.ser.close()
-            st.session_state.ser = None
-            st.success("Serial connection closed.")
-        except Exception as e:
-            st.error(f"Error while closing serial: {e}")
-    st.session_state.running = False
-    st.session_state.sent = False
+    # The port stays open, so the next Send starts without reopening (and resetting) the board.
+    try:
+        worker.send_config(["STOP"])
+        worker.end_run()
+        st.success("Stopped.")
+    except RuntimeError as e:
+        st.error(f"Failed to stop: {e}")
 # ---- Elapsed Time ----
 # if st.session_state.running:
 #     elapsed_time = int(time.time() - st.session_state.start_time)
@@ -254,39 +197,57 @@ if st.button("Stop"):
 # else:
 #     st.write(f"Elapsed Time: {elapsed_time // 60} min {elapsed_time % 60} sec")
 
-def format_time(seconds):
-    days = seconds // 86400
-    seconds = seconds % 86400
-    hours = seconds // 3600
-    seconds = seconds % 3600
-    minutes = seconds // 60
-    seconds = seconds % 60
-    return f"{days} day {hours} hrs {minutes} min {seconds} sec"
-
-if st.session_state.running:
-    elapsed_time = int(time.time() - st.session_state.start_time)
-else:
-    elapsed_time = st.session_state.data[-1]["Seconds"] if st.session_state.data else 0
-
-st.write(f"Elapsed Time: {format_time(elapsed_time)}")
-
-
-# ---- Chart ----
-df = pd.DataFrame(st.session_state.data)
-if not df.empty:
-    df["Minutes"] = df["Seconds"] / 60
-    x_axis = alt.X("Minutes", title="Time (min)") if df["Seconds"].max() > 60 else alt.X("Seconds", title="Time (s)")
-    ### 2 line chart ###
-    # chart = alt.Chart(df).mark_line().encode(
-    #     x=x_axis,
-    #     y=alt.Y("Voltage", title="Voltage (V)"),
-    #     color=alt.Color("State", scale=alt.Scale(domain=["Charging", "Discharging"], range=["green", "red"]))
-    # ).properties(width=700, height=400)
-
-    chart = alt.Chart(df).mark_line(color="green").encode(
-    x=x_axis,
-    y=alt.Y("Voltage", title="Voltage (V)")).properties(width=700, height=400)
-
-    st.altair_chart(chart, use_container_width=True)
-    csv = df.to_csv(index=False).encode()
-    st.download_button("Download CSV", csv, "voltage_log.csv", "text/csv")
+@st.fragment(run_every=LIVE_INTERVAL)
+def live_chart():
+    last = worker.last()
+    if worker.recording:
+        elapsed_time = int(worker.elapsed())
+    else:
+        elapsed_time = int(last[0]) if last else 0
+
+    st.write(f"Elapsed Time: {format_time(elapsed_time)}")
+
+    # ---- Chart ----
+    if last:
+        import altair as alt  # first chart only; later refreshes find it in sys.modules
+
+        # Fetched again only when samples arrived; otherwise the cached frame is re-sent.
+        version = worker.version()
+        cached = st.session_state.get("live_chart")
+        if cached is None or cached[0] != version:
+            chart_df = worker.chart_frame()
+            chart_df["Minutes"] = chart_df["Seconds"] / 60
+            cached = st.session_state["live_chart"] = (version, chart_df)
+        chart_df = cached[1]
+        x_axis = alt.X("Minutes", title="Time (min)") if chart_df["Seconds"].max() > 60 else alt.X("Seconds", title="Time (s)")
+        ### 2 line chart ###
+        # chart = alt.Chart(df).mark_line().encode(
+        #     x=x_axis,
+        #     y=alt.Y("Voltage", title="Voltage (V)"),
+        #     color=alt.Color("State", scale=alt.Scale(domain=["Charging", "Discharging"], range=["green", "red"]))
+        # ).properties(width=700, height=400)
+
+        chart = alt.Chart(chart_df).mark_line(color="green").encode(
+        x=x_axis,
+        y=alt.Y("Voltage", title="Voltage (V)")).properties(width=700, height=400)
+
+        st.altair_chart(chart, use_container_width=True)
+
+
+live_chart()
+
+# ---- Download Log ----
+# The CSV is built from the run log only when asked for. Size and mtime key the cache, so a
+# finished run is converted once; outside the live fragment, this runs on full reruns only.
+@st.cache_data(max_entries=1, show_spinner="Converting log to CSV...")
+def log_csv(path, size, mtime):
+    from segment_log import load_frame
+
+    return load_frame(path).to_csv(index=False).encode()
+
+
+if worker.log_path and os.path.exists(worker.log_path):
+    if st.button("Download Log"):
+        info = os.stat(worker.log_path)
+        name = os.path.splitext(os.path.basename(worker.log_path))[0] + ".csv"
+        st.download_button("Download CSV", log_csv(worker.log_path, info.st_size, info.st_mtime), name, "text/csv")
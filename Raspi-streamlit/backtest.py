@@ -0,0 +1,353 @@
+import argparse
+import itertools
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from sample_store import STATE_CODES
+from segment_log import read_segment
+from sim_device import Cell
+
+# ---- Decoupled Backtest ----
+# decoupled.ino's control loop ported to numpy, one column per parameter set, so a
+# whole grid of settings steps through time together. One tick is one loop() pass
+# (waitWithFrames(1000)); within a tick the steps run in the sketch's order, so the
+# same-pass cascades (peak -> discharge -> confirm, the stale voltage after the
+# custom-duration hold) behave as on the board.
+#
+# The relays change the voltage they react to, so a recorded trace cannot simply be
+# replayed under other settings (and the log holds 0 V for the Stop and hold phases,
+# which only print zeros). Instead the cell is fitted from a run log (first-order RC,
+# the same model sim_device.py uses) and every parameter set runs closed loop on it:
+#
+#   python backtest.py --fit logs/run-20250716-111500.fnmlog --peak 1.5 2 2.5 \
+#       --discharge 60 120 240 --stop 60 120 --hours 12 -o sweep.csv
+#   python backtest.py --replay logs/run-20250716-111500.fnmlog
+#
+# --replay runs a log's own settings on the cell fitted from it and compares the mode
+# timeline with the logged one, as a check of the port and the fitted cell.
+TICK_MS = 1000
+DEFAULTS = {
+    "peak": 2.0,          # V, "Peak:"
+    "min": 0.0,           # V, "Min:"; the sketch only checks it is below the peak
+    "discharge_s": 120.0,  # "Time:", discharging hold after the first loop phase
+    "stop_s": 120.0,      # each loop-charging (Stop) phase; hard-coded 120000 ms in the sketch
+    "confirm_s": 2.0,     # voltage must stay <= low this long before recharging
+    "low": 0.05,          # V, discharged
+    "high": 0.1,          # V, re-discharge level in the loop phases
+}
+METRICS = ["sequences", "sequences_per_h", "first_sequence_s", "peaks", "switches_per_h",
+           "discharge_fraction", "stop_fraction", "mean_voltage", "discharge_vs"]
+
+
+def default_cell():
+    cell = Cell()
+    return {"supply": cell.supply, "tau_charge": cell.tau_charge, "tau_discharge": cell.tau_discharge}
+
+
+def adc_voltage(voltage):
+    # analogRead() * (5.0 / 1023.0)
+    return np.clip(np.round(voltage * (1023 / 5.0)), 0, 1023) * (5.0 / 1023.0)
+
+
+# ---- State Machine ----
+def run(params, ticks, cell=None, noise=0.0, seed=0, history=False):
+    # params: {name: array} (one entry per parameter set, missing names take DEFAULTS).
+    # Returns the metrics per set, and with history=True the reported mode and relay
+    # state per tick.
+    n = len(next(iter(params.values())))
+    p = {name: np.broadcast_to(np.asarray(params.get(name, default), dtype=np.float64), (n,))
+         for name, default in DEFAULTS.items()}
+    peak, low, high = p["peak"], p["low"], p["high"]
+    delay_ms = np.round(p["discharge_s"] * 1000).astype(np.int64)
+    loop_ms = np.round(p["stop_s"] * 1000).astype(np.int64)
+    confirm_ms = np.round(p["confirm_s"] * 1000).astype(np.int64)
+    hold_ticks = np.maximum(-(-delay_ms // TICK_MS), 1)
+    valid = (peak > 0) & (peak <= 5) & (p["min"] >= 0) & (p["min"] < peak) & (delay_ms > 0)
+
+    discharging = np.zeros(n, dtype=bool)  # isDischarging, i.e. the relays
+    loop_phase = np.zeros(n, dtype=bool)
+    sub_started = np.zeros(n, dtype=bool)
+    second_pending = np.zeros(n, dtype=bool)
+    recharging = np.zeros(n, dtype=bool)
+    redischarging = np.zeros(n, dtype=bool)
+    sub_start = np.zeros(n, dtype=np.int64)
+    below_start = np.zeros(n, dtype=np.int64)
+    hold_end = np.full(n, -1, dtype=np.int64)  # tick the custom-duration hold returns at
+    v_hold = np.zeros(n)  # voltage read before the hold, used again after it
+    mode = np.zeros(n, dtype=np.uint8)  # reportedMode
+
+    cell = cell or default_cell()
+    v_cell = np.zeros(n)
+    charge_k = 1 - math.exp(-TICK_MS / 1000.0 / cell["tau_charge"])
+    discharge_k = 1 - math.exp(-TICK_MS / 1000.0 / cell["tau_discharge"])
+    rng = np.random.default_rng(seed)
+
+    sequences = np.zeros(n, dtype=np.int64)
+    first_sequence = np.full(n, np.nan)
+    peaks = np.zeros(n, dtype=np.int64)
+    switches = np.zeros(n, dtype=np.int64)
+    discharge_ticks = np.zeros(n, dtype=np.int64)
+    stop_ticks = np.zeros(n, dtype=np.int64)
+    v_sum = np.zeros(n)
+    v_discharge = np.zeros(n)
+    if history:
+        modes = np.empty((ticks, n), dtype=np.uint8)
+        relays = np.empty((ticks, n), dtype=bool)
+
+    def toggle(m, v):
+        up = m & ~discharging & (v > high)
+        down = m & discharging & (v <= low)
+        discharging[up] = True
+        discharging[down] = False
+
+    for k in range(ticks):
+        now = k * TICK_MS
+        v = adc_voltage(v_cell + rng.normal(0.0, noise, n) if noise else v_cell)
+        resume = hold_end == k
+        fresh = valid & (hold_end < 0)
+        before = discharging.copy()
+
+        # Step 2: peak -> discharging
+        m = fresh & ~discharging & (v >= peak) & ~loop_phase & ~recharging & ~redischarging
+        discharging |= m
+        peaks += m
+
+        # <= low for confirm_s -> recharging
+        m = fresh & discharging & ~loop_phase & ~recharging & ~redischarging
+        below = m & (v <= low)
+        confirmed = below & (below_start != 0) & (now - below_start >= confirm_ms)
+        below_start[below & (below_start == 0)] = now
+        below_start[(m & ~below) | confirmed] = 0
+        discharging &= ~confirmed
+        recharging |= confirmed
+
+        # Recharging: display, and the peak again -> re-discharge
+        m = fresh & recharging & ~discharging & ~loop_phase
+        mode[m & (v > low)] = 1
+        up = m & (v >= peak)
+        discharging |= up
+        redischarging |= up
+        recharging &= ~up
+
+        # Re-discharged -> Step 3
+        m = fresh & redischarging & discharging & (v <= low)
+        discharging &= ~m
+        loop_phase |= m
+        sub_started |= m
+        redischarging &= ~m
+        sub_start[m] = now
+
+        # Step 3: loop charging
+        m = fresh & loop_phase & sub_started & (now - sub_start < loop_ms)
+        mode[m] = 3
+        toggle(m, v)
+
+        # Step 4: discharging hold; the rest of this pass runs when it returns
+        m = fresh & loop_phase & sub_started & (now - sub_start >= loop_ms) & ~second_pending
+        discharging |= m
+        mode[m] = 2
+        hold_end[m] = k + hold_ticks[m]
+        v_hold[m] = v[m]
+        fresh &= ~m
+
+        discharging &= ~resume
+        second_pending |= resume
+        sub_started &= ~resume
+        hold_end[resume] = -1
+        active = fresh | resume
+        v = np.where(resume, v_hold, v)
+
+        # Step 5: wait for > high, then start the second loop
+        m = active & second_pending & ~sub_started
+        mode[m] = 1
+        go = m & (v > high)
+        sub_start[go] = now
+        sub_started |= go
+
+        # Step 6: second loop charging, then back to normal
+        m = active & second_pending & sub_started & (now - sub_start < loop_ms)
+        mode[m & ~go] = 3  # Step 5 just reset lastLoopPrint, so no Stop line this pass
+        toggle(m, v)
+        done = active & second_pending & sub_started & (now - sub_start >= loop_ms)
+        loop_phase &= ~done
+        sub_started &= ~done
+        second_pending &= ~done
+        discharging &= ~done
+        sequences += done
+        first_sequence[done & np.isnan(first_sequence)] = now / 1000.0
+
+        # Step 7: normal display
+        m = active & (v > low) & ~loop_phase & ~second_pending & ~recharging & ~redischarging
+        mode[m] = np.where(discharging[m], 2, 1)
+
+        switches += discharging != before
+        discharge_ticks += discharging
+        stop_ticks += mode == 3
+        v_sum += v_cell
+        v_discharge += np.where(discharging, v_cell, 0.0)
+        if history:
+            modes[k] = mode
+            relays[k] = discharging
+        target = np.where(discharging, 0.0, cell["supply"])
+        v_cell = v_cell + (target - v_cell) * np.where(discharging, discharge_k, charge_k)
+
+    hours = ticks * TICK_MS / 3.6e6
+    metrics = {
+        "valid": valid,
+        "sequences": sequences,
+        "sequences_per_h": sequences / hours,
+        "first_sequence_s": first_sequence,
+        "peaks": peaks,
+        "switches_per_h": switches / hours,
+        "discharge_fraction": discharge_ticks / ticks,
+        "stop_fraction": stop_ticks / ticks,
+        "mean_voltage": v_sum / ticks,
+        "discharge_vs": v_discharge * TICK_MS / 1000.0,
+    }
+    if history:
+        return metrics, modes, relays
+    return metrics
+
+
+# ---- Grid Sweep ----
+def grid(**values):
+    # Every combination of the given lists, as {name: array}.
+    names = list(values)
+    rows = list(itertools.product(*(values[name] for name in names)))
+    return {name: np.array([row[i] for row in rows], dtype=np.float64) for i, name in enumerate(names)}
+
+
+def _chunk(args):
+    params, ticks, cell, noise, seed = args
+    return run(params, ticks, cell, noise=noise, seed=seed)
+
+
+def sweep(params, hours=6.0, cell=None, noise=0.0, workers=None, chunk=2048):
+    # Parameter sets are split into chunks, each run vectorized in its own process.
+    n = len(next(iter(params.values())))
+    ticks = int(hours * 3.6e6 // TICK_MS)
+    cell = cell or default_cell()
+    workers = workers or os.cpu_count() or 1
+    chunk = max(min(chunk, -(-n // workers)), 1)
+    bounds = range(0, n, chunk)
+    jobs = [({name: values[i:i + chunk] for name, values in params.items()}, ticks, cell, noise, i) for i in bounds]
+    if len(jobs) == 1 or workers == 1:
+        results = [_chunk(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_chunk, jobs))
+    frame = pd.DataFrame({name: values for name, values in params.items()})
+    for name in ["valid"] + METRICS:
+        frame[name] = np.concatenate([result[name] for result in results])
+    return frame
+
+
+# ---- Log Helpers ----
+def fit_cell(seconds, voltage, state, max_gap=5.0):
+    # RC time constants from consecutive samples in the same mode. Samples at or below
+    # 0.05 V are mostly the zero lines of the Stop / hold phases and are skipped.
+    # Falls back to sim_device.py's cell where there is not enough of a mode.
+    cell = default_cell()
+    seconds = np.asarray(seconds, dtype=np.float64)
+    voltage = np.asarray(voltage, dtype=np.float64)
+    dt = np.diff(seconds)
+    ok = (dt > 0) & (dt <= max_gap) & (state[1:] == state[:-1]) & (voltage[1:] > 0.05) & (voltage[:-1] > 0.05)
+
+    m = ok & (state[1:] == STATE_CODES["Discharging"]) & (voltage[1:] < voltage[:-1])
+    if m.sum() >= 10:
+        cell["tau_discharge"] = float(np.median(-dt[m] / np.log(voltage[1:][m] / voltage[:-1][m])))
+
+    m = ok & (state[1:] == STATE_CODES["Charging"])
+    if m.sum() >= 10:
+        step = np.median(dt[m])
+        m &= np.abs(dt - step) <= 0.1 * step
+        a, b = np.polyfit(voltage[:-1][m], voltage[1:][m], 1)
+        if 0 < a < 1:
+            cell["tau_charge"] = float(-step / math.log(a))
+            cell["supply"] = float(b / (1 - a))
+    return cell
+
+
+def log_params(meta):
+    params = {name: [value] for name, value in DEFAULTS.items()}
+    for name, key, scale in [("peak", "peak", 1), ("min", "min", 1), ("discharge_s", "discharge_min", 60)]:
+        if meta.get(key) is not None:
+            params[name] = [float(meta[key]) * scale]
+    return params
+
+
+def mode_summary(modes):
+    # Share of passes in each reported mode and the number of Stop (loop) phases.
+    modes = np.asarray(modes)
+    stop = modes == STATE_CODES["Stop"]
+    return {
+        "charging": float(np.mean(modes == STATE_CODES["Charging"])),
+        "discharging": float(np.mean(modes == STATE_CODES["Discharging"])),
+        "stop": float(np.mean(stop)),
+        "stop_phases": int(np.count_nonzero(stop[1:] & ~stop[:-1]) + stop[0]),
+    }
+
+
+def replay(seconds, voltage, state, params, cell=None):
+    # The log's own settings on the cell fitted from it, against the logged timeline.
+    # Run time starts when the config is sent, so a line printed by pass k belongs to
+    # tick floor(t); passes that print nothing keep the previous mode. Timelines are
+    # compared in aggregate: ADC noise around 0.05 V moves a phase by a pass now and
+    # then, after which pass-by-pass agreement says little.
+    seconds = np.asarray(seconds, dtype=np.float64)
+    tick = np.maximum(seconds * 1000 // TICK_MS, 0).astype(np.int64)
+    ticks = int(tick[-1]) + 1
+    last = np.full(ticks, -1)
+    last[tick] = np.arange(len(tick))
+    last = np.maximum.accumulate(last)
+    logged = np.where(last >= 0, np.asarray(state)[np.maximum(last, 0)], 0)
+    cell = cell or fit_cell(seconds, voltage, state)
+    metrics, modes, relays = run(params, ticks, cell, history=True)
+    return pd.DataFrame([mode_summary(logged), mode_summary(modes[:, 0])], index=["logged", "backtest"])
+
+
+# ---- CLI ----
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay and sweep decoupled.ino settings offline.")
+    parser.add_argument("--fit", help="run log (.fnmlog) to fit the cell model from")
+    parser.add_argument("--replay", help="run log to replay with its own settings")
+    parser.add_argument("--peak", type=float, nargs="+", default=[DEFAULTS["peak"]], help="V")
+    parser.add_argument("--min", type=float, nargs="+", default=[DEFAULTS["min"]], help="V")
+    parser.add_argument("--discharge", type=float, nargs="+", default=[DEFAULTS["discharge_s"]], help="hold, seconds")
+    parser.add_argument("--stop", type=float, nargs="+", default=[DEFAULTS["stop_s"]], help="loop phase, seconds")
+    parser.add_argument("--confirm", type=float, nargs="+", default=[DEFAULTS["confirm_s"]], help="seconds")
+    parser.add_argument("--hours", type=float, default=6.0, help="simulated time per parameter set")
+    parser.add_argument("--noise", type=float, default=0.0, help="ADC noise, V (sim_device.py uses 0.002)")
+    parser.add_argument("--workers", type=int, help="processes (default: one per CPU)")
+    parser.add_argument("--sort", default="sequences_per_h", choices=METRICS)
+    parser.add_argument("-o", "--output", help="CSV of every parameter set")
+    args = parser.parse_args()
+
+    if args.replay:
+        meta, seconds, voltage, state = read_segment(args.replay)
+        print(os.path.basename(args.replay))
+        print(replay(seconds, voltage, state, log_params(meta)).round(3).to_string())
+        raise SystemExit
+
+    cell = default_cell()
+    if args.fit:
+        meta, seconds, voltage, state = read_segment(args.fit)
+        cell = fit_cell(seconds, voltage, state)
+    print("cell: " + ", ".join(f"{name} {value:.3g}" for name, value in cell.items()))
+
+    params = grid(peak=args.peak, min=args.min, discharge_s=args.discharge, stop_s=args.stop, confirm_s=args.confirm)
+    started = time.perf_counter()
+    results = sweep(params, args.hours, cell, args.noise, args.workers)
+    n = len(results)
+    print(f"{n} parameter sets x {args.hours:g} h in {time.perf_counter() - started:.1f} s")
+    results = results[results["valid"]].drop(columns="valid").sort_values(args.sort, ascending=False)
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"Wrote {args.output}")
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(results.head(10).round(3).to_string(index=False))
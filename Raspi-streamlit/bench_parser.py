@@ -0,0 +1,68 @@
+import argparse
+import re
+import time
+
+from protocol import LineParser
+
+# ---- Sample Traffic ----
+# Mostly samples, with the occasional ack the way decoupled.ino interleaves them.
+def make_stream(lines, ack_every=500):
+    out = []
+    for i in range(lines):
+        if ack_every and i % ack_every == ack_every - 1:
+            out.append(b"Updated custom delay time to: 120000 ms\r\n")
+        else:
+            mode = b"Charging" if (i // 60) % 2 == 0 else b"Discharging"
+            out.append(b"Live Input | VOLTAGE: %.4f | DIR: INCREASING | MODE: %s | T: %d\r\n" % ((i % 500) / 100, mode, i * 1000))
+    return b"".join(out)
+
+
+def chunks_of(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+# ---- Old Path ----
+# What the apps did per readline(): decode, uncompiled re.search, one dict per sample.
+def parse_regex(lines):
+    data = []
+    for raw in lines:
+        line = raw.decode('utf-8', errors='ignore').strip()
+        if line:
+            match = re.search(r"VOLTAGE:\s*([0-9.]+)\s*\|\s*DIR:\s*(\w+)\s*\|\s*MODE:\s*(\w+)", line)
+            if match:
+                data.append({"Seconds": 0, "Voltage": float(match.group(1)), "State": match.group(3)})
+    return len(data)
+
+
+def parse_chunks(chunks):
+    parser = LineParser()
+    return sum(len(parser.feed(chunk)) for chunk in chunks)
+
+
+def best_of(repeat, fn, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count, best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the per-line regex path with LineParser.")
+    parser.add_argument("--lines", type=int, default=200_000)
+    parser.add_argument("--chunk", type=int, default=4096, help="bytes per read(in_waiting)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    stream = make_stream(args.lines)
+    lines = stream.splitlines(keepends=True)
+    chunks = chunks_of(stream, args.chunk)
+
+    old_count, old_time = best_of(args.repeat, parse_regex, lines)
+    new_count, new_time = best_of(args.repeat, parse_chunks, chunks)
+
+    print(f"regex per line : {old_count} samples in {old_time:.3f} s ({args.lines / old_time:,.0f} lines/s)")
+    print(f"LineParser     : {new_count} samples in {new_time:.3f} s ({args.lines / new_time:,.0f} lines/s)")
+    print(f"speedup        : {old_time / new_time:.1f}x")
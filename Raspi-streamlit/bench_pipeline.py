@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import platform
+import pty
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tty
+
+import numpy as np
+import pyarrow as pa
+
+from acquisition import AcquisitionWorker
+from bench_parser import chunks_of, make_stream
+from sample_store import STATE_CODES
+from ui import CHART_SPECS
+
+# ---- Pipeline Benchmark ----
+# Times what one combine_app.py rerun costs as the history grows, stage by stage:
+#   drain   - parse + record the lines that arrive between two reruns (worker thread)
+#   frame   - pd.DataFrame snapshot of the whole store
+#   chart   - downsampled chart frame (what the dashboard plots)
+#   vega    - the chart frame and CHART_SPECS spec serialized the way st.vega_lite_chart
+#             ships them (Arrow IPC data, JSON spec)
+#   csv     - full-history CSV encode (what Download Log builds when clicked)
+# plus parser throughput, serial-to-store latency over a pty and peak RSS.
+# Each history size runs in its own process so its peak RSS is its own.
+#
+#   python bench_pipeline.py --sizes 1000 100000 10000000 --out bench_report.json
+#   python bench_pipeline.py --compare bench_report.json    # exit 1 on regressions
+DEFAULT_SIZES = [1_000, 100_000, 10_000_000]
+STAGES = ["drain", "frame", "chart", "vega", "csv"]
+
+
+def timed(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": round(statistics.median(times), 3), "max_ms": round(max(times), 3)}
+
+
+def fill(worker, samples, parse_max):
+    # Up to parse_max samples go through the real parse/record path; the rest of the
+    # history is appended as arrays, since generating 10M text lines would dominate.
+    parsed = min(samples, parse_max)
+    chunks = chunks_of(make_stream(parsed, ack_every=0), 4096)
+    start = time.perf_counter()
+    for chunk in chunks:
+        worker._handle_chunk(chunk, time.monotonic())
+    parse_time = time.perf_counter() - start
+    rest = samples - parsed
+    if rest:
+        seconds = np.linspace(worker.last()[0], worker.last()[0] + rest, rest)
+        voltage = (np.arange(rest) % 500 / 100).astype(np.float32)
+        state = np.full(rest, STATE_CODES["Charging"], dtype=np.uint8)
+        with worker.lock:
+            worker.store.extend(seconds, voltage, state)
+    return parsed / parse_time
+
+
+def vega_payload(frame):
+    # As in combine_app.py's live chart, then what st.vega_lite_chart sends for it.
+    frame["Minutes"] = frame["Seconds"] / 60
+    spec = CHART_SPECS["Minutes" if frame["Seconds"].max() > 60 else "Seconds"]
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(frame)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return json.dumps(spec), sink.getvalue()
+
+
+def run_size(samples, repeat, rerun_lines, parse_max, log_dir):
+    worker = AcquisitionWorker("bench", log_dir=log_dir)
+    worker.begin_run(0.0, {"mode": "Decoupled"})
+    lines_per_s = fill(worker, samples, parse_max)
+    rerun_chunk = make_stream(rerun_lines, ack_every=0)
+
+    stages = {
+        "drain": timed(repeat, lambda: worker._handle_chunk(rerun_chunk, time.monotonic())),
+        "frame": timed(repeat, worker.snapshot),
+        "chart": timed(repeat, worker.chart_frame),
+        "vega": timed(repeat, lambda: vega_payload(worker.chart_frame())),
+        "csv": timed(max(1, repeat // 5), lambda: worker.snapshot().to_csv(index=False)),
+    }
+    worker.end_run()
+    # A rerun plots the chart frame and no longer encodes the CSV, but the CSV stays
+    # in the report since it is the cost of any full-history export.
+    rerun_ms = sum(stages[stage]["median_ms"] for stage in ("drain", "chart", "vega"))
+    return {
+        "samples": samples,
+        "lines_per_s": round(lines_per_s),
+        "stages": stages,
+        "rerun_ms": round(rerun_ms, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def serial_latency(samples=50):
+    # Time from a line being written to the pty until the worker's store has it.
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    with tempfile.TemporaryDirectory() as log_dir:
+        worker = AcquisitionWorker(os.ttyname(slave), log_dir=log_dir)
+        worker.connect()
+        worker.start()
+        worker.begin_run(0.0)
+        latencies = []
+        for i in range(samples):
+            voltage = 1.0 + i / 1000
+            start = time.perf_counter()
+            os.write(master, b"Live Input | VOLTAGE: %.4f | DIR: INCREASING | MODE: Charging\n" % voltage)
+            while True:
+                last = worker.last()
+                if last and abs(last[1] - voltage) < 1e-4:
+                    break
+                time.sleep(0.0002)
+            latencies.append((time.perf_counter() - start) * 1000)
+        worker.end_run()
+        worker.stop()
+        worker.close()
+    os.close(master)
+    os.close(slave)
+    latencies.sort()
+    return {
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        "max_ms": round(latencies[-1], 3),
+    }
+
+
+def compare(report, baseline, tolerance):
+    regressions = []
+    for size, result in report["sizes"].items():
+        old = baseline["sizes"].get(size)
+        if not old:
+            continue
+        for stage in STAGES:
+            if stage not in old["stages"]:
+                continue  # a baseline from before the stage existed
+            new_ms = result["stages"][stage]["median_ms"]
+            old_ms = old["stages"][stage]["median_ms"]
+            if new_ms > old_ms * (1 + tolerance) and new_ms - old_ms > 0.5:
+                regressions.append(f"{size} samples, {stage}: {old_ms:.2f} -> {new_ms:.2f} ms")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ingest and rerun path of the dashboard.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="history sizes in samples")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--rerun-lines", type=int, default=40, help="lines arriving between two reruns")
+    parser.add_argument("--parse-max", type=int, default=200_000, help="samples filled through the parser")
+    parser.add_argument("--out", default="bench_report.json")
+    parser.add_argument("--compare", help="baseline report; exit 1 if a stage got slower")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown for --compare")
+    parser.add_argument("--one", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one is not None:
+        with tempfile.TemporaryDirectory() as log_dir:
+            result = run_size(args.one, args.repeat, args.rerun_lines, args.parse_max, log_dir)
+        print(json.dumps(result))
+        sys.exit(0)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "latency": serial_latency(),
+        "sizes": {},
+    }
+    print(f"serial -> store latency: p50 {report['latency']['p50_ms']:.2f} ms, p95 {report['latency']['p95_ms']:.2f} ms")
+    for size in args.sizes:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--one", str(size), "--repeat", str(args.repeat),
+             "--rerun-lines", str(args.rerun_lines), "--parse-max", str(args.parse_max)],
+            capture_output=True, text=True, check=True,
+        )
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        report["sizes"][str(size)] = result
+        stages = "  ".join(f"{stage} {result['stages'][stage]['median_ms']:.2f}" for stage in STAGES)
+        print(f"{size:>10,} samples: {result['lines_per_s']:,} lines/s  rerun {result['rerun_ms']:.2f} ms  "
+              f"[{stages} ms]  peak RSS {result['peak_rss_mb']:.0f} MB")
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# ---- Startup Profile ----
+# What a cold start of a dashboard costs on this machine, each measured in a fresh
+# interpreter so nothing is already in sys.modules:
+#   imports    - `python -X importtime` of the app's own top-level imports, with the
+#                packages that take longest (cumulative, so pandas includes numpy)
+#   first run  - streamlit and the app script up to its first complete page
+#   rerun      - a second full run of the same script (what an input change costs)
+#   heavy      - which of the big packages the first page ended up importing
+# Run it with and without acq_daemon.py running; with the daemon the page only
+# needs the client side.
+#
+#   python bench_startup.py combine_app.py app.py --repeat 3 --out startup.json
+HEAVY = ["numpy", "pandas", "pyarrow", "altair", "serial"]
+APP_MODULES = {
+    "combine_app.py": ["command_channel", "daemon_client", "device_manager", "metrics", "ui"],
+    "app.py": ["command_channel", "daemon_client", "ui"],
+}
+
+
+def importtime(code):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    # "import time: self [us] | cumulative | imported package", nesting shown by indentation
+    rows = []
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            rows.append((int(self_us), int(cumulative_us), name))
+    return rows
+
+
+def import_profile(modules, top=8):
+    startup = {name for self_us, cumulative_us, name in importtime("pass")}  # the interpreter's own
+    packages = {}
+    total = 0
+    for self_us, cumulative_us, name in importtime("import " + ", ".join(modules)):
+        if name in startup:
+            continue
+        total += self_us
+        if name.startswith(" ") and not name.startswith("  "):  # top level of this import
+            packages[name.strip()] = cumulative_us
+    slowest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return {"total_ms": round(total / 1000, 1), "slowest_ms": {name: round(us / 1000, 1) for name, us in slowest}}
+
+
+def run_once(app):
+    # In its own process (see --one): times streamlit + the script's first and second run.
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    imported = time.perf_counter()
+    at = AppTest.from_file(app, default_timeout=60).run()
+    first = time.perf_counter()
+    at.run()
+    rerun = time.perf_counter()
+    return {
+        "streamlit_ms": round((imported - start) * 1000, 1),
+        "first_run_ms": round((first - imported) * 1000, 1),
+        "rerun_ms": round((rerun - first) * 1000, 1),
+        "heavy": [name for name in HEAVY if name in sys.modules],
+        "errors": [str(e.value) for e in at.exception],
+    }
+
+
+def profile(app, repeat):
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), app, "--one"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    best = {key: min(run[key] for run in runs) for key in ("streamlit_ms", "first_run_ms", "rerun_ms")}
+    return {**best, "heavy": runs[-1]["heavy"], "errors": runs[-1]["errors"],
+            "imports": import_profile(APP_MODULES.get(app, []))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the cold start of the dashboards.")
+    parser.add_argument("apps", nargs="*", default=["combine_app.py"])
+    parser.add_argument("--repeat", type=int, default=3, help="cold starts per app (the best is kept)")
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument("--one", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one:
+        print(json.dumps(run_once(args.apps[0])))
+        sys.exit(0)
+
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "apps": {}}
+    for app in args.apps:
+        result = report["apps"][app] = profile(app, args.repeat)
+        print(f"{app}: app imports {result['imports']['total_ms']:.0f} ms, streamlit {result['streamlit_ms']:.0f} ms, "
+              f"first run {result['first_run_ms']:.0f} ms, rerun {result['rerun_ms']:.0f} ms")
+        print("  slowest imports: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in result["imports"]["slowest_ms"].items()))
+        print("  heavy packages after first page: " + (", ".join(result["heavy"]) or "none"))
+        for error in result["errors"]:
+            print("  ERROR " + error)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"report written to {args.out}")
@@ -0,0 +1,96 @@
+import numpy as np
+
+# ---- Board Clock Sync ----
+# Maps the board's millis() to this machine's monotonic clock, so every sample is
+# placed by when the board took it rather than when its chunk was read.
+#
+# Each chunk gives one observation: the board time of its newest sample and the
+# host time the chunk arrived. arrival - board time is the clock offset plus the
+# transfer delay, and the delay is never negative. So the offset is the lower
+# envelope: the smallest value per `bin_s` seconds of board time. A line fitted
+# through the last `window` seconds of those minima gives the offset and the drift.
+# Arduino resonators are off by up to ~0.5%, i.e. seconds per day, so the drift
+# matters. The fit follows changes from temperature or a new board continuously.
+#
+# millis() is unwrapped past its 49.7-day rollover. A large backwards step means
+# the board rebooted, and the estimate starts over (the worker also resets it when
+# it reopens the port, since a USB rebind power-cycles the board).
+WRAP_MS = 1 << 32
+REBOOT_MS = 10_000  # a backwards step larger than this (and not a rollover) is a reboot
+
+
+class ClockSync:
+    def __init__(self, bin_s=10.0, window=600.0):
+        self.bin_s = bin_s
+        self.window = window
+        self.reboots = 0
+        self.reset()
+
+    def reset(self):
+        self._last_raw = None
+        self._base = 0
+        self._bins = {}  # bin number -> (board seconds, min offset)
+        self.offset = None  # host seconds at board time 0
+        self.drift = 0.0  # host seconds per board second - 1
+        self.residual = 0.0  # delay of the last observation above the envelope, s
+
+    def board_seconds(self, millis):
+        # uint32 millis() -> float64 seconds since the board started, unwrapped.
+        raw = np.asarray(millis, dtype=np.int64)
+        if not len(raw):
+            return raw.astype(np.float64)
+        prev = np.r_[raw[0] if self._last_raw is None else self._last_raw, raw[:-1]]
+        step = raw - prev
+        wraps = step < -WRAP_MS // 2
+        if np.any((step < -REBOOT_MS) & ~wraps):
+            self.reset()
+            self.reboots += 1
+            prev = np.r_[raw[0], raw[:-1]]
+            step = raw - prev
+            wraps = step < -WRAP_MS // 2
+        unwrapped = raw + self._base + WRAP_MS * np.cumsum(wraps)
+        self._base += WRAP_MS * int(np.count_nonzero(wraps))
+        self._last_raw = int(raw[-1])
+        return unwrapped / 1000.0
+
+    def observe(self, board_s, arrival):
+        # board_s: board time of the newest sample in a chunk that arrived at `arrival`.
+        delay = arrival - board_s
+        key = int(board_s // self.bin_s)
+        best = self._bins.get(key)
+        if best is None or delay < best[1]:
+            self._bins[key] = (board_s, delay)
+            oldest = key - int(self.window // self.bin_s)
+            for stale in [k for k in self._bins if k < oldest]:
+                del self._bins[stale]
+            self._fit()
+        self.residual = arrival - self.to_host(board_s)
+
+    def _fit(self):
+        points = np.array(list(self._bins.values()))
+        if len(points) < 3:
+            self.offset = float(points[:, 1].min())
+            self.drift = 0.0
+            return
+        # Centred, as board seconds run into the millions after a few weeks.
+        center = points[:, 0].mean()
+        slope, intercept = np.polyfit(points[:, 0] - center, points[:, 1], 1)
+        self.drift = float(slope)
+        self.offset = float(intercept - slope * center)
+
+    def to_host(self, board_s):
+        return board_s * (1.0 + self.drift) + self.offset
+
+    @property
+    def synced(self):
+        return self.offset is not None
+
+    def stats(self):
+        return {
+            "synced": self.synced,
+            "offset_s": self.offset,
+            "drift_ppm": round(self.drift * 1e6, 1),
+            "residual_ms": round(self.residual * 1000, 2),
+            "bins": len(self._bins),
+            "reboots": self.reboots,
+        }
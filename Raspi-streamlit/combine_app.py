@@ -1,31 +1,67 @@
 import streamlit as st
-import time
-import pandas as pd
-import altair as alt
-import serial
-import re
-from streamlit_autorefresh import st_autorefresh
-from serial.tools import list_ports
+import os
+from command_channel import config_lines, describe
+from daemon_client import DaemonClient
+from device_manager import DEFAULT_PORT, DeviceManager
+from metrics import METRICS, serve_metrics
+from ui import CHART_SPECS, CHART_WINDOWS, HEADERS, WAITING, badge, format_time, readout, tile
 st.set_page_config(page_title="FNM Team Dashboard", layout="centered")
-st_autorefresh(interval=400, key="autorefresh")
+rerun = METRICS.stopwatch("fnm_rerun_stage_seconds")
+
+# ---- Live Refresh ----
+# Only the live sections below are fragments that refresh themselves every LIVE_INTERVAL
+# seconds; the rest of the page (style, inputs, buttons) reruns only when an input changes.
+LIVE_INTERVAL = 0.25
 
 # ---- UI & Style ----
-st.markdown("""
-    <style>
-    body { background-color: #f5fff5; }
-    .title { text-align: center; color: #2E8B57; font-size: 36px; font-weight: bold; }
-    .subtitle { text-align: center; color: #444; font-size: 18px; margin-top: -10px; }
-
-    div.row-widget.stRadio > div {
-        flex-direction: row;
-        justify-content: center;
-        gap: 30px;
-    }
-    </style>
-    <div class='title'>FNM Team</div>
-    <div class='subtitle'>Dashboard</div>
-    <hr style="margin-top:10px;"/>
-""", unsafe_allow_html=True)
+# Static markup and chart specs live in ui.py, built once per process (see there).
+# Heavy modules are imported where they are used: pandas for the Diagnostics table and
+# the chart frame, the acquisition stack only when this page owns the ports.
+st.markdown(HEADERS["combine"], unsafe_allow_html=True)
+
+# ---- Boards ----
+# Every attached board gets its own acquisition worker; the form below drives the selected one.
+# When acq_daemon.py is running it owns the ports and this page is only a client.
+@st.cache_resource
+def get_manager():
+    client = DaemonClient()
+    if client.available():
+        return client
+    manager = DeviceManager(115200)
+    manager.scan()
+    # The daemon serves /metrics itself; without it the dashboard can export them.
+    if os.environ.get("FNM_METRICS_PORT"):
+        serve_metrics(int(os.environ["FNM_METRICS_PORT"]))
+    return manager
+
+manager = get_manager()
+
+col_board, col_scan = st.columns([4, 1])
+with col_scan:
+    st.write("")
+    if st.button("Rescan"):
+        manager.scan()
+with col_board:
+    port = st.selectbox("Board", manager.ports() or [DEFAULT_PORT])
+
+@st.fragment(run_every=LIVE_INTERVAL)
+def board_tiles():
+    ports = manager.ports()
+    if len(ports) <= 1:
+        return
+    channel_cols = st.columns(len(ports))
+    for channel_col, channel_port in zip(channel_cols, ports):
+        channel = manager.get(channel_port)
+        channel_state = (channel.last_state() or "Idle") if channel.recording else "Idle"
+        with channel_col:
+            st.markdown(
+                tile(os.path.basename(channel_port), channel.meta.get("mode", "-"), channel.voltage, channel_state),
+                unsafe_allow_html=True
+            )
+
+board_tiles()
+
+rerun.lap("boards")
 
 # ---- Mode Selection ----
 mode = st.radio("Select Project", ["Decoupled", "CDI", "Custom"], horizontal=True)
@@ -40,6 +76,7 @@ if mode == "Decoupled":
     discharge_minutes = st.number_input("Discharge Time (minutes)", min_value=0.0, value=2.0, step=0.1)
 
     stop_minutes = st.number_input("Stop Time (minutes)", min_value=0.0, value=0.0, step=0.1)
+    binary_telemetry = st.checkbox("Binary telemetry (100 Hz sampling)", value=False)
 
 elif mode == "CDI":
     min_voltage = 0.0
@@ -56,213 +93,211 @@ else:  # Custom
         custom_discharge_min = st.number_input("Discharging Time (minutes)", min_value=0.0, value=1.0, step=0.1)
 
 
+rerun.lap("inputs")
+
 # ---- Serial ----
-if "ser" not in st.session_state:
-    try:
-        st.session_state.ser = serial.Serial('/dev/ttyACM0', 115200, timeout=0.1)
-        time.sleep(2)
-        st.session_state.ser.reset_input_buffer()
-        st.success("Serial connected.")
-    except Exception as e:
-        st.session_state.ser = None
-        st.error(f"Serial connection failed: {e}")
+worker = manager.get(port)
 
-if "sent" not in st.session_state:
-    st.session_state.sent = False
+if f"serial_checked_{port}" not in st.session_state:
+    st.session_state[f"serial_checked_{port}"] = True
+    if worker.connected:
+        st.success(f"Serial connected ({port}).")
+    else:
+        st.error(f"Serial connection failed: {worker.error}")
+    if worker.recovered:
+        st.warning(f"Recovered interrupted run from {os.path.basename(worker.log_path)}.")
 
 # ---- Send to Arduino ----
-if st.button("Send to Arduino", disabled=st.session_state.sent):
-    if not st.session_state.ser:
-        try:
-            st.session_state.ser = serial.Serial('/dev/ttyACM0', 115200, timeout=0.1)
-            time.sleep(2)
-            st.session_state.ser.reset_input_buffer()
-            st.success("Serial connected.")
-        except Exception as e:
-            st.session_state.ser = None
-            st.error(f"Serial connection failed: {e}")
-
-    if st.session_state.ser:
-        try:
-            st.session_state.voltage = min_voltage
-            st.session_state.charging = True
-            st.session_state.data = []
-            st.session_state.start_time = time.time()
-            st.session_state.running = True
-            st.session_state.sent = True
-
-            if mode == "Decoupled":
-                discharge_milli_seconds = int(discharge_minutes * 60 * 1000)
-                stop_ms = int(stop_minutes * 60 * 1000)
-                st.session_state.ser.write(f"Peak:{peak_voltage:.2f}\n".encode()); time.sleep(0.05)
-                st.session_state.ser.write(f"Min:{min_voltage:.2f}\n".encode());  time.sleep(0.05)
-                st.session_state.ser.write(f"Time:{discharge_milli_seconds}\n".encode()); time.sleep(0.05)
-                st.session_state.ser.write(f"stop:{stop_ms}\n".encode()); time.sleep(0.05)
-                print(f"Peak:{peak_voltage:.2f}")
-                print(f"Min:{min_voltage:.2f}")
-                print(f"Time:{discharge_milli_seconds}")
-                print(f"stop:{stop_ms}")
-
-            elif mode == "CDI":
-                discharge_milli_seconds = int(discharge_minutes * 60 * 1000)
-                st.session_state.ser.write(f"Time:{discharge_milli_seconds}\n".encode()); time.sleep(0.05)
-                print(f"Time:{discharge_milli_seconds}")
-
-            else:  # Custom
-                c_ms  = int(custom_charge_min * 60 * 1000)
-                dc_ms = int(custom_discharge_min * 60 * 1000)
-                st.session_state.ser.write(f"c_time:{c_ms}\n".encode());  time.sleep(0.05)
-                st.session_state.ser.write(f"dc_time:{dc_ms}\n".encode()); time.sleep(0.05)
-                print(f"c_time:{c_ms}")
-                print(f"dc_time:{dc_ms}")
-
-            st.success(f"Sent to Arduino in {mode} mode.")
-        except Exception as e:
-            st.error(f"Failed to send: {e}")
-
-# ---- Init State ----
-if "voltage" not in st.session_state:
-    st.session_state.voltage = 1.0
-if "charging" not in st.session_state:
-    st.session_state.charging = True
-if "data" not in st.session_state:
-    st.session_state.data = []
-if "start_time" not in st.session_state:
-    st.session_state.start_time = time.time()
-if "running" not in st.session_state:
-    st.session_state.running = False
-
-# ---- Real-time Serial Read ----
-if st.session_state.running and st.session_state.ser:
+if st.button("Send to Arduino", disabled=worker.recording):
+    if not worker.connected:
+        st.warning(f"Board offline ({worker.error}); the config is queued until it reconnects.")
+
     try:
-        while st.session_state.ser.in_waiting > 0:
-            line = st.session_state.ser.readline().decode('utf-8', errors='ignore').strip()
-            if line:
-                match = re.search(r"VOLTAGE:\s*([0-9.]+)\s*\|\s*DIR:\s*(\w+)\s*\|\s*MODE:\s*(\w+)", line)
-                if match:
-                    voltage = float(match.group(1))
-                    mode_label = match.group(3)
-                    st.session_state.voltage = voltage
-                    st.session_state.charging = (mode_label == "Charging")
-                    elapsed = int(time.time() - st.session_state.start_time)
-                    st.session_state.data.append({
-                        "Seconds": elapsed,
-                        "Voltage": voltage,
-                        "State": mode_label
-                    })
-    except Exception as e:
-        st.error(f"Error reading serial: {e}")
-
-# ---- Display Voltage / State ----
-if st.session_state.data or mode in ["CDI", "Custom"]:
-    if mode in ["CDI", "Custom"] and st.session_state.running:
-        state_text = "Unknown"
-        state_color = "#888888"
-        if st.session_state.charging:
-            state_text = "Charging"
-            state_color = "#0099FF"
+        if mode == "Decoupled":
+            settings = {"peak": peak_voltage, "min": min_voltage, "discharge_min": discharge_minutes, "stop_min": stop_minutes, "binary": binary_telemetry}
+        elif mode == "CDI":
+            settings = {"time_min": discharge_minutes}
         else:
-            state_text = "Discharging"
-            state_color = "#F44336"
-
-        st.markdown(
-            f"""
-            <div style='display:flex;align-items:center;justify-content:center;'>
-                <span style='font-size: 32px; color: {state_color}; font-weight: 600; background-color:#222; padding:6px 20px; border-radius:12px;'>
-                    [{state_text}]
-                </span>
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
-
-    elif st.session_state.data and mode == "Decoupled":
-        latest_state = st.session_state.data[-1]["State"]
-        if latest_state == "Stop":
-            state_text = "Stop"
-            state_color = "#FFFFFF"
-            color = "#888888"
-        elif latest_state == "Charging":
-            state_text = "Charging"
-            state_color = "#0099FF"
-            color = "#2E8B57"
-        elif latest_state == "Discharging":
-            state_text = "Discharging"
-            state_color = "#F44336"
-            color = "#F44336"
+            settings = {"charge_min": custom_charge_min, "discharge_min": custom_discharge_min}
+        worker.begin_run(min_voltage, {"mode": mode, **settings})
+        lines = config_lines(mode, settings)
+
+        # One batched write; the acks are checked off by the worker's command channel.
+        worker.send_config(lines)
+        print("\n".join(lines))
+        st.success(f"Sent to Arduino in {mode} mode.")
+    except Exception as e:
+        st.error(f"Failed to send: {e}")
+
+rerun.lap("serial")
+
+# ---- Live Status ----
+@st.fragment(run_every=LIVE_INTERVAL)
+def live_status():
+    live = METRICS.stopwatch("fnm_live_stage_seconds", section="status")
+    if worker.link == "reconnecting":
+        st.warning(f"Board link lost ({worker.error}); reconnecting, commands are queued meanwhile.")
+
+    # ---- Config Acknowledgements ----
+    transactions = worker.recent_transactions(1)
+    if transactions:
+        st.caption("Last config push: " + " · ".join(describe(command) for command in transactions[-1]["commands"]))
+
+    # ---- Latest Sample ----
+    # The worker thread drains the port continuously; a refresh only reads its latest sample.
+    last = worker.last()
+
+    # ---- Display Voltage / State ----
+    if last or mode in ["CDI", "Custom"]:
+        if mode in ["CDI", "Custom"] and worker.recording:
+            st.markdown(badge("Charging" if worker.charging else "Discharging"), unsafe_allow_html=True)
+
+        elif last and mode == "Decoupled":
+            st.markdown(readout(worker.voltage, last[2]), unsafe_allow_html=True)
+    else:
+        st.markdown(WAITING, unsafe_allow_html=True)
+
+
+    # ---- Arduino Messages ----
+    with st.expander("Arduino Messages"):
+        events = worker.recent_events()
+        if events:
+            st.text("\n".join(f"{stamp} [{kind}] {text}" for stamp, kind, text in events))
         else:
-            state_text = latest_state
-            state_color = "#888888"
-            color = "#888888"
-
-        st.markdown(
-            f"""
-            <div style='display:flex;align-items:center;gap:20px;'>
-                <span style='font-size: 35px; color: {color}; font-weight: 600;'>
-                    Voltage (V): {st.session_state.voltage:.3f} V
-                </span>
-                <span style='font-size: 28px; color: {state_color}; font-weight: 600; background-color:#222; padding:4px 16px; border-radius:12px;'>
-                    [{state_text}]
-                </span>
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
-else:
-    st.markdown(
-        "<span style='font-size: 20px; color: #888;'>Waiting for Arduino data...</span>",
-        unsafe_allow_html=True
-    )
+            st.caption("No messages yet.")
+    live.total("fnm_live_seconds")
 
+live_status()
+rerun.lap("status")
 
 # ---- Stop Button ----
 if st.button("Stop"):
-    if st.session_state.ser:
-        try:
-            st.session_state.ser.write(b"STOP\n")
-            st.session_state.ser.close()
-            st.session_state.ser = None
-            st.success("Serial connection closed.")
-        except Exception as e:
-            st.error(f"Error while closing serial: {e}")
-    st.session_state.running = False
-    st.session_state.sent = False
-
-# ---- Elapsed Time ----
-def format_time(seconds):
-    days = seconds // 86400
-    seconds = seconds % 86400
-    hours = seconds // 3600
-    seconds = seconds % 3600
-    minutes = seconds // 60
-    seconds = seconds % 60
-    return f"{days} day {hours} hrs {minutes} min {seconds} sec"
-
-if st.session_state.running:
-    elapsed_time = int(time.time() - st.session_state.start_time)
-else:
-    elapsed_time = st.session_state.data[-1]["Seconds"] if st.session_state.data else 0
-
-st.write(f"Elapsed Time: {format_time(elapsed_time)}")
-
-# ---- Chart (Only in Decoupled) ----
-df = pd.DataFrame(st.session_state.data)
-
-if mode == "Decoupled" and not df.empty:
-    df["Minutes"] = df["Seconds"] / 60
-    x_axis = alt.X("Minutes", title="Time (min)") if df["Seconds"].max() > 60 else alt.X("Seconds", title="Time (s)")
-    chart = alt.Chart(df).mark_line(color="green").encode(
-        x=x_axis,
-        y=alt.Y("Voltage", title="Voltage (V)")
-    ).properties(width=700, height=400)
-    st.altair_chart(chart, use_container_width=True)
-
-    csv = df.to_csv(index=False).encode()
-    st.download_button("Download CSV", csv, "voltage_log.csv", "text/csv")
-
-elif mode == "CDI":
-    st.info("CDI mode active — voltage chart is not shown.")
-
-elif mode == "Custom":
-    st.info("custom mode active — voltage chart is not shown.")
-
+    # The port stays open, so the next Send starts without reopening (and resetting) the board.
+    try:
+        worker.send_config(["STOP"])
+        worker.end_run()
+        st.success("Stopped.")
+    except RuntimeError as e:
+        st.error(f"Failed to stop: {e}")
+
+# ---- Live Chart ----
+@st.fragment(run_every=LIVE_INTERVAL)
+def live_chart():
+    live = METRICS.stopwatch("fnm_live_stage_seconds", section="chart")
+    last = worker.last()
+    if worker.recording:
+        elapsed_time = int(worker.elapsed())
+    else:
+        elapsed_time = int(last[0]) if last else 0
+
+    st.write(f"Elapsed Time: {format_time(elapsed_time)}")
+    if worker.decoder.frames:
+        st.caption(f"Binary frames: {worker.decoder.frames}, dropped: {worker.decoder.dropped}, bad CRC: {worker.decoder.bad_crc}")
+
+    # ---- Cycle Statistics ----
+    # Excursions are detected by the worker as samples arrive (see cycles.py): a rise above
+    # 0.05 V, the peak, and the decay back below it. Not the MODE cycles of Phase Metrics below.
+    cycle_summary = worker.cycle_summary()
+    if mode == "Decoupled" and cycle_summary["cycles"]:
+        last_cycle = cycle_summary["last"]
+        col_count, col_peak, col_rise, col_decay = st.columns(4)
+        col_count.metric("Excursions > 0.05 V", cycle_summary["cycles"])
+        col_peak.metric("Last Peak (V)", f"{last_cycle['peak_value']:.3f}")
+        col_rise.metric("Charge to Peak (s)", f"{last_cycle['rise_s']:.1f}")
+        col_decay.metric("Decay to 0.05 V (s)", f"{last_cycle['to_threshold_s']:.1f}",
+                         f"{last_cycle['to_threshold_s'] - cycle_summary['mean_to_threshold_s']:+.1f} vs mean", delta_color="off")
+        st.caption("Mean over the run: " + " · ".join(
+            f"{cycle_summary[polarity]['count']} {polarity}: {cycle_summary[polarity]['mean_duration_s']:.1f} s above 0.05 V, "
+            f"{cycle_summary[polarity]['mean_integral']:.2f} V·s"
+            for polarity in ("charge", "discharge") if cycle_summary[polarity]["count"]))
+
+    live.lap("cycles")
+
+    # ---- Phase Metrics ----
+    # Running aggregates per MODE phase and per MODE cycle (Charging to the next Charging),
+    # kept by the worker (see phase_metrics.py) and also written next to the run log.
+    phase_summary = worker.phase_summary()
+    if phase_summary["phases"]:
+        st.dataframe([
+            {"State": name, "Phases": row["phases"], "Mean (s)": round(row["mean_duration_s"], 1),
+             "Mean V": round(row["mean_v"], 3), "Std V": round(row["std_v"], 3),
+             "∫V dt (V·s)": round(row["integral"], 2), "∫V² dt (V²·s)": round(row["energy"], 2)}
+            for name, row in phase_summary["states"].items()
+        ], hide_index=True, use_container_width=True)
+        cycle = phase_summary.get("cycle")
+        if cycle:
+            ratio = f"{cycle['ratio']:.2f}" if cycle["ratio"] is not None else "–"
+            drift = f"{cycle['peak_drift_mv_per_h']:+.1f} mV/h" if cycle["peak_drift_mv_per_h"] is not None else "–"
+            st.caption(f"{phase_summary['cycles']} MODE cycles (Charging to Charging) · charge/discharge {ratio} · "
+                       f"peak {cycle['mean_peak_v']:.3f} V, drift {drift} · ∫V² dt {cycle['mean_energy']:.2f} V²·s per cycle")
+        current = phase_summary["open"]
+        if current:
+            st.caption(f"Current phase: {current['state']} for {current['duration_s']:.0f} s, mean {current['mean_v']:.3f} V")
+    live.lap("phases")
+
+    # ---- Chart (Only in Decoupled) ----
+    if mode == "Decoupled" and last:
+        chart_window = st.selectbox("Chart Window", list(CHART_WINDOWS), index=0)
+        # The chart frame is only fetched again when samples arrived or the window changed;
+        # a refresh with nothing new re-sends the cached frame.
+        key = (port, worker.version(), chart_window)
+        cached = st.session_state.get("live_chart")
+        if cached is None or cached[0] != key:
+            # Downsampled to a fixed bucket budget, so the spec size does not grow with the run.
+            chart_df = worker.chart_frame(CHART_WINDOWS[chart_window])
+            chart_df["Minutes"] = chart_df["Seconds"] / 60
+            cached = st.session_state["live_chart"] = (key, chart_df)
+        chart_df = cached[1]
+        live.lap("chart_frame")
+        x_field = "Minutes" if chart_df["Seconds"].max() > 60 else "Seconds"
+        st.vega_lite_chart(chart_df, CHART_SPECS[x_field], use_container_width=True)
+        live.lap("chart")
+
+    elif mode == "CDI":
+        st.info("CDI mode active — voltage chart is not shown.")
+
+    elif mode == "Custom":
+        st.info("custom mode active — voltage chart is not shown.")
+
+    live.total("fnm_live_seconds")
+
+live_chart()
+
+# ---- Download Log ----
+# The CSV is built from the run log only when asked for. Size and mtime key the cache, so a
+# finished run is converted once; outside the live fragment, this runs on full reruns only.
+@st.cache_data(max_entries=1, show_spinner="Converting log to CSV...")
+def log_csv(path, size, mtime):
+    from segment_log import load_frame
+
+    return load_frame(path).to_csv(index=False).encode()
+
+
+if mode == "Decoupled" and worker.log_path and os.path.exists(worker.log_path):
+    if st.button("Download Log"):
+        info = os.stat(worker.log_path)
+        name = os.path.splitext(os.path.basename(worker.log_path))[0] + ".csv"
+        st.download_button("Download CSV", log_csv(worker.log_path, info.st_size, info.st_mtime), name, "text/csv")
+
+rerun.lap("chart")
+
+# ---- Diagnostics ----
+# Numbers are process-wide and include earlier reruns; this rerun is added once the script ends.
+# Behind a toggle rather than an expander: an expander's body runs (and imports pandas,
+# asks the daemon for /metrics) on every rerun even while it is collapsed.
+if st.toggle("Diagnostics"):
+    rows = METRICS.rows()
+    if rows:
+        import pandas as pd
+
+        st.dataframe(
+            pd.DataFrame(rows, columns=["Metric", "Labels", "Value / Count", "Mean (ms)", "Max (ms)"]),
+            hide_index=True, use_container_width=True,
+        )
+    if isinstance(manager, DaemonClient):
+        st.caption("Acquisition daemon")
+        st.code(manager.metrics(), language="text")
+    else:
+        st.caption("Prometheus text (set FNM_METRICS_PORT to serve it over HTTP)")
+        st.code(METRICS.prometheus(), language="text")
+rerun.total("fnm_rerun_seconds")
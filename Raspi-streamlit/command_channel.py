@@ -0,0 +1,210 @@
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+
+# ---- Acknowledgements ----
+# Command prefix -> (event kind that confirms it, event kind that rejects it).
+# Kinds come from protocol.classify(). None means the firmware prints nothing
+# back (e.g. decoupled.ino takes "Peak:" silently and confirms it with the
+# "Updated Peak/Min received" line that follows "Min:").
+ACKS = {
+    "Peak": ("ack_peak_min", None),
+    "Min": ("ack_peak_min", None),
+    "Time": ("ack_time", "error"),
+    "c_time": ("ack_c_time", None),
+    "dc_time": ("ack_dc_time", None),
+    "BIN": ("ack_bin", None),
+    "RATE": ("ack_rate", None),
+}
+# The sketches read one line per loop pass (handlePiMessage), about a second per pass
+# while a run is going, so each line of a push adds that much to the ack deadline.
+LINE_TIME = 1.0
+
+
+class Command:
+    def __init__(self, line):
+        self.line = line.strip()
+        self.ack, self.reject = ACKS.get(self.line.split(":", 1)[0], (None, None))
+        self.status = "queued"  # queued -> pending -> ok | sent | rejected | timeout | failed
+        self.attempts = 0
+        self.sent_at = None
+        self.latency_ms = None
+        self.reply = None
+
+    def as_dict(self):
+        return {
+            "line": self.line, "status": self.status, "attempts": self.attempts,
+            "latency_ms": self.latency_ms, "reply": self.reply,
+        }
+
+
+class Transaction:
+    _ids = itertools.count(1)
+
+    def __init__(self, lines, timeout=3.0, retries=2):
+        self.id = next(self._ids)
+        self.commands = [Command(line) for line in lines]
+        self.timeout = timeout
+        self.retries = retries
+        self.submitted = time.time()
+        self.finished = None
+        self.done = threading.Event()
+
+    def as_dict(self):
+        return {
+            "id": self.id, "submitted": self.submitted, "finished": self.finished,
+            "commands": [command.as_dict() for command in self.commands],
+        }
+
+
+def describe(command):
+    status = command["status"]
+    if status == "ok":
+        return f"{command['line']} ✓ {command['latency_ms']:.0f} ms"
+    if status == "sent":
+        return f"{command['line']} (no ack expected)"
+    if status in ("queued", "pending"):
+        return f"{command['line']} …"
+    if status == "timeout":
+        return f"{command['line']} ✗ no ack after {command['attempts']} tries"
+    return f"{command['line']} ✗ {command['reply']}"
+
+
+# ---- Run Configs ----
+# The lines that start a run of each sketch, from the settings kept in the run's
+# log metadata (minutes and volts, as entered on the dashboard).
+def config_lines(mode, settings):
+    if mode == "Decoupled":
+        from frames import DEFAULT_INTERVAL_MS  # frames pulls in numpy; the scheduler and dashboard need not
+
+        lines = [
+            f"Peak:{settings['peak']:.2f}",
+            f"Min:{settings['min']:.2f}",
+            f"Time:{int(settings['discharge_min'] * 60 * 1000)}",
+            f"stop:{int(settings.get('stop_min', 0.0) * 60 * 1000)}",
+        ]
+        lines += [f"RATE:{DEFAULT_INTERVAL_MS}", "BIN:1"] if settings.get("binary") else ["BIN:0"]
+        return lines
+    if mode == "CDI":
+        return [f"Time:{int(settings['time_min'] * 60 * 1000)}"]
+    if mode == "Custom":
+        return [f"c_time:{int(settings['charge_min'] * 60 * 1000)}", f"dc_time:{int(settings['discharge_min'] * 60 * 1000)}"]
+    raise ValueError(f"unknown mode {mode!r}")
+
+
+# ---- Command Channel ----
+# Config pushes are queued and sent from this channel's own thread: every line of
+# a transaction goes out in one write, then the acks are awaited with a timeout
+# and anything unconfirmed is resent. Callers never sleep between writes.
+# While `ready()` is false (board offline or still booting) transactions are held
+# for up to `hold` seconds.
+class CommandChannel:
+    def __init__(self, write, ready=None, history=20, hold=60.0):
+        self.write = write
+        self.ready = ready or (lambda: True)
+        self.hold = hold
+        self.history = deque(maxlen=history)
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._pending = []
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="commands", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._queue.put(None)
+        if self._thread:
+            self._thread.join(timeout=1.0)
+
+    def submit(self, lines, timeout=3.0, retries=2):
+        transaction = Transaction(lines, timeout, retries)
+        with self._cond:
+            self.history.append(transaction)
+        self._queue.put(transaction)
+        return transaction
+
+    def recent(self, n=5):
+        with self._cond:
+            return [transaction.as_dict() for transaction in list(self.history)[-n:]]
+
+    # Called by the acquisition thread with the firmware events of each chunk.
+    def on_events(self, events, arrival):
+        with self._cond:
+            if not self._pending:
+                return
+            for kind, text in events:
+                for command in self._pending:
+                    if command.status != "pending":
+                        continue
+                    if kind == command.ack:
+                        command.status = "ok"
+                    elif kind == command.reject:
+                        command.status = "rejected"
+                    else:
+                        continue
+                    command.latency_ms = round((arrival - command.sent_at) * 1000, 1)
+                    command.reply = text
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            transaction = self._queue.get()
+            if transaction is None:
+                return
+            self._execute(transaction)
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + self.hold
+        while not self.ready():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _execute(self, transaction):
+        todo = transaction.commands
+        error = None
+        for _ in range(transaction.retries + 1):
+            if not self._wait_ready():
+                error = "board not connected"
+                break
+            with self._cond:
+                now = time.monotonic()
+                for command in todo:
+                    command.attempts += 1
+                    command.sent_at = now
+                    command.status = "pending" if command.ack else "sent"
+                self._pending = [command for command in todo if command.ack]
+            try:
+                self.write("".join(command.line + "\n" for command in todo).encode())
+            except Exception as e:
+                # Usually the board dropped off the bus; the next attempt waits for it to come back.
+                error = str(e)
+                with self._cond:
+                    self._pending = []
+                continue
+            error = None
+
+            deadline = time.monotonic() + transaction.timeout + LINE_TIME * len(todo)
+            with self._cond:
+                while any(command.status == "pending" for command in self._pending):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                todo = [command for command in self._pending if command.status == "pending"]
+                self._pending = []
+            if not todo:
+                break
+
+        for command in todo:
+            command.status = "failed" if error else "timeout"
+            command.reply = error
+        transaction.finished = time.time()
+        transaction.done.set()
@@ -0,0 +1,193 @@
+import argparse
+import os
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# ---- Cycle Detection ----
+# A cycle is one excursion of |signal| above `threshold`: it starts at the first
+# sample at or above it, peaks, and ends at the first sample back below it (the
+# notebooks' "drop below 0.05"). Per cycle we keep
+#   start, peak_time, peak_value (signed), end
+#   rise_s          start -> peak (charging up to the peak)
+#   to_threshold_s  peak -> end   (decay back below the threshold)
+#   duration_s      start -> end
+#   integral        trapezoid of the signal over the cycle (C for a current in A,
+#                   V*s for a voltage)
+#   polarity        "charge" for a positive peak, "discharge" for a negative one
+# Excursions whose peak stays under `height` or that last less than `min_duration`
+# seconds are noise and are dropped.
+#
+# feed() takes the samples in chunks of any size and keeps only the open cycle's
+# accumulators between calls, so the same code runs over a multi-day log offline
+# and on every serial chunk in the acquisition thread. Work per chunk is numpy over
+# the chunk plus one small step per threshold crossing.
+COLUMNS = ["cycle", "start", "peak_time", "peak_value", "end", "rise_s", "to_threshold_s",
+           "duration_s", "integral", "polarity"]
+
+
+def cumulative_trapezoid(t, y, last=None):
+    # area[i] is the trapezoid between sample i-1 (or `last`, the (t, y) of the previous
+    # chunk's last sample) and i; returns [0, cumsum(area)], so total[j] - total[i] is the
+    # area from sample i-1 to j-1. Shared with phase_metrics.py.
+    t0, y0 = last if last else (t[0], y[0])
+    area = np.empty(len(t))
+    area[0] = (t[0] - t0) * (y[0] + y0) / 2
+    area[1:] = np.diff(t) * (y[1:] + y[:-1]) / 2
+    return np.concatenate(([0.0], np.cumsum(area)))
+
+
+class CycleDetector:
+    def __init__(self, threshold=0.05, height=0.0, min_duration=0.0):
+        self.threshold = threshold
+        self.height = height
+        self.min_duration = min_duration
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.active = False
+        self._last = None  # (t, y) of the previous sample, for the trapezoid across chunks
+        self._start = None
+        self._peak = 0.0
+        self._peak_time = None
+        self._area = 0.0
+
+    def feed(self, t, y):
+        t = np.asarray(t, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        n = len(t)
+        if not n:
+            return []
+        magnitude = np.abs(y)
+        above = magnitude >= self.threshold
+        before = np.empty(n, dtype=bool)
+        before[0] = self.active
+        before[1:] = above[:-1]
+        crossings = np.flatnonzero(above != before)
+
+        total = cumulative_trapezoid(t, y, self._last)
+        self._last = (t[-1], y[-1])
+
+        cycles = []
+        lo = first = 0  # open cycle's first sample in this chunk, and its first trapezoid
+        for i in crossings:
+            if self.active:
+                self._fold(t, y, magnitude, lo, i)
+                self._area += total[i + 1] - total[first]  # up to and including the drop sample
+                cycle = self._close(t[i])
+                if cycle:
+                    cycles.append(cycle)
+            else:
+                self._start = t[i]
+                self._peak = 0.0
+                self._peak_time = t[i]
+                self._area = 0.0
+                lo, first = i, i + 1
+            self.active = not self.active
+        if self.active:
+            self._fold(t, y, magnitude, lo, n)
+            self._area += total[n] - total[first]
+        return cycles
+
+    def _fold(self, t, y, magnitude, lo, hi):
+        if hi > lo:
+            k = lo + int(np.argmax(magnitude[lo:hi]))
+            if magnitude[k] > abs(self._peak):
+                self._peak = y[k]
+                self._peak_time = t[k]
+
+    def _close(self, end):
+        duration = end - self._start
+        if abs(self._peak) < self.height or duration < self.min_duration:
+            return None
+        self.count += 1
+        return {
+            "cycle": self.count,
+            "start": float(self._start),
+            "peak_time": float(self._peak_time),
+            "peak_value": float(self._peak),
+            "end": float(end),
+            "rise_s": float(self._peak_time - self._start),
+            "to_threshold_s": float(end - self._peak_time),
+            "duration_s": float(duration),
+            "integral": float(self._area),
+            "polarity": "charge" if self._peak >= 0 else "discharge",
+        }
+
+
+def detect(t, y, threshold=0.05, height=0.0, min_duration=0.0, chunk=1_000_000):
+    # Offline: whole log in bounded chunks, so memory stays flat on multi-day recordings.
+    detector = CycleDetector(threshold, height, min_duration)
+    cycles = []
+    for i in range(0, len(t), chunk):
+        cycles.extend(detector.feed(t[i:i + chunk], y[i:i + chunk]))
+    return pd.DataFrame(cycles, columns=COLUMNS)
+
+
+# ---- Live Statistics ----
+# Running totals over every cycle of a run plus the most recent ones for display.
+class CycleStats:
+    def __init__(self, keep=50):
+        self.recent = deque(maxlen=keep)
+        self.reset()
+
+    def reset(self):
+        self.recent.clear()
+        self.totals = {polarity: [0, 0.0, 0.0] for polarity in ("charge", "discharge")}  # count, duration, integral
+
+    def add(self, cycles):
+        for cycle in cycles:
+            total = self.totals[cycle["polarity"]]
+            total[0] += 1
+            total[1] += cycle["duration_s"]
+            total[2] += cycle["integral"]
+            self.recent.append(cycle)
+
+    def summary(self):
+        summary = {"cycles": sum(total[0] for total in self.totals.values()), "last": self.recent[-1] if self.recent else None}
+        for polarity, (count, duration, integral) in self.totals.items():
+            summary[polarity] = {
+                "count": count,
+                "mean_duration_s": duration / count if count else None,
+                "mean_integral": integral / count if count else None,
+            }
+        if self.recent:
+            recent = list(self.recent)
+            summary["mean_to_threshold_s"] = sum(cycle["to_threshold_s"] for cycle in recent) / len(recent)
+            summary["mean_peak"] = sum(abs(cycle["peak_value"]) for cycle in recent) / len(recent)
+        return summary
+
+
+# ---- CLI ----
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the charge/discharge cycles of a run log or CSV.")
+    parser.add_argument("path", help=".fnmlog run log or CSV")
+    parser.add_argument("--time", default="Seconds", help="CSV time column (seconds, or anything pandas parses as dates)")
+    parser.add_argument("--value", default="Voltage", help="CSV signal column, e.g. 'Value_2ND ' for the potentiostat current")
+    parser.add_argument("--threshold", type=float, default=0.05)
+    parser.add_argument("--height", type=float, default=0.0, help="minimum |peak| for a cycle to count")
+    parser.add_argument("--min-duration", type=float, default=0.0, help="seconds")
+    parser.add_argument("-o", "--output", help="CSV of the cycles (default: print a summary)")
+    args = parser.parse_args()
+
+    if args.path.endswith(".fnmlog"):
+        from segment_log import read_segment
+        meta, seconds, voltage, state = read_segment(args.path)
+        t, y = seconds, voltage
+    else:
+        frame = pd.read_csv(args.path, usecols=[args.time, args.value])
+        t = frame[args.time]
+        if not pd.api.types.is_numeric_dtype(t):
+            t = pd.to_datetime(t).astype("int64") / 1e9
+        t, y = t.to_numpy(np.float64), frame[args.value].to_numpy(np.float64)
+
+    cycles = detect(t, y, args.threshold, args.height, args.min_duration)
+    if args.output:
+        cycles.to_csv(args.output, index=False)
+        print(f"Wrote {len(cycles)} cycles to {args.output}")
+    else:
+        print(f"{os.path.basename(args.path)}: {len(cycles)} cycles")
+        if len(cycles):
+            print(cycles.groupby("polarity")[["duration_s", "rise_s", "to_threshold_s", "integral"]].mean().round(3))
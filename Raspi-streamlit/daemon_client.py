@@ -0,0 +1,209 @@
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+from urllib.parse import urlencode
+
+from acq_daemon import DEFAULT_HOST, DEFAULT_PORT
+
+DEFAULT_URL = os.environ.get("FNM_DAEMON_URL", f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+
+
+class UnknownBoard(RuntimeError):
+    # The daemon has no worker for the port (404), e.g. no board is attached yet.
+    pass
+
+
+# ---- Daemon Client ----
+# Same surface as DeviceManager, backed by acq_daemon.py's HTTP API.
+class DaemonClient:
+    def __init__(self, url=DEFAULT_URL, timeout=2.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.workers = {}
+
+    def request(self, path, query=None, body=None):
+        url = self.url + path + ("?" + urlencode(query) if query else "")
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            error = UnknownBoard if e.code == 404 else RuntimeError
+            raise error(json.loads(e.read() or b"{}").get("error", str(e))) from None
+
+    def metrics(self):
+        with urllib.request.urlopen(self.url + "/metrics", timeout=self.timeout) as resp:
+            return resp.read().decode()
+
+    def available(self):
+        try:
+            self.request("/devices")
+        except (OSError, RuntimeError, ValueError):
+            # ValueError: something else answered on the port, not with JSON.
+            return False
+        return True
+
+    def scan(self):
+        return self.request("/scan", body={})
+
+    def ports(self):
+        return self.request("/devices")
+
+    def get(self, port):
+        worker = self.workers.get(port)
+        if worker is None:
+            worker = self.workers[port] = RemoteWorker(self, port)
+        return worker
+
+
+# ---- Remote Worker ----
+# Mirrors the AcquisitionWorker attributes the dashboards read. Status is
+# fetched once and reused for `ttl` seconds, so one rerun costs one request.
+# A port the daemon does not have reads like a worker whose port is offline,
+# so the page shows the error instead of failing; commands to it raise.
+def offline_status(port):
+    return {
+        "port": port, "device": port, "connected": False, "link": "closed", "reconnects": 0,
+        "error": f"No board at {port} on the acquisition daemon", "recording": False, "voltage": 0.0,
+        "charging": False, "meta": {}, "recovered": False, "log_path": None, "elapsed": 0.0, "samples": 0,
+        "retention": None, "seq": 0, "generation": 0, "last": None, "cycles": {"cycles": 0, "last": None},
+        "phases": {"phases": 0, "cycles": 0, "states": {}, "open": None, "last_phase": None, "last_cycle": None},
+        "frames": {"frames": 0, "dropped": 0, "bad_crc": 0}, "reader": None, "clock": None,
+    }
+
+
+class RemoteWorker:
+    def __init__(self, client, port, ttl=0.25):
+        self.client = client
+        self.port = port
+        self.ttl = ttl
+        self._status = None
+        self._fetched = 0.0
+
+    def status(self):
+        if self._status is None or time.monotonic() - self._fetched > self.ttl:
+            try:
+                self._status = self.client.request("/status", {"port": self.port})
+            except UnknownBoard:
+                self._status = offline_status(self.port)
+            self._fetched = time.monotonic()
+        return self._status
+
+    def _post(self, path, **body):
+        self._status = None
+        return self.client.request(path, body={"port": self.port, **body})
+
+    # ---- Status ----
+    @property
+    def connected(self):
+        return self.status()["connected"]
+
+    @property
+    def link(self):
+        return self.status()["link"]
+
+    @property
+    def error(self):
+        return self.status()["error"]
+
+    @property
+    def recording(self):
+        return self.status()["recording"]
+
+    @property
+    def voltage(self):
+        return self.status()["voltage"]
+
+    @property
+    def charging(self):
+        return self.status()["charging"]
+
+    @property
+    def meta(self):
+        return self.status()["meta"]
+
+    @property
+    def recovered(self):
+        return self.status()["recovered"]
+
+    @property
+    def log_path(self):
+        return self.status()["log_path"]
+
+    @property
+    def decoder(self):
+        return SimpleNamespace(**self.status()["frames"])
+
+    def elapsed(self):
+        return self.status()["elapsed"]
+
+    def last(self):
+        last = self.status()["last"]
+        return tuple(last) if last else None
+
+    def last_state(self):
+        last = self.last()
+        return last[2] if last else None
+
+    def version(self):
+        status = self.status()
+        return status["generation"], status["seq"]
+
+    def cycle_summary(self):
+        return self.status()["cycles"]
+
+    def phase_summary(self):
+        return self.status()["phases"]
+
+    def chart_frame(self, window=None):
+        import pandas as pd  # only the Decoupled chart needs it; keeps the client light to import
+
+        query = {"port": self.port}
+        if window is not None:
+            query["window"] = window
+        points = self.client.request("/chart", query)
+        return pd.DataFrame({"Seconds": points["seconds"], "Voltage": points["voltage"]})
+
+    def recent_events(self, n=20):
+        try:
+            return [tuple(event) for event in self.client.request("/events", {"port": self.port, "n": n})]
+        except UnknownBoard:
+            return []
+
+    def recent_transactions(self, n=5):
+        try:
+            return self.client.request("/transactions", {"port": self.port, "n": n})
+        except UnknownBoard:
+            return []
+
+    # ---- Commands ----
+    def connect(self):
+        return self._post("/connect")["connected"]
+
+    def close(self):
+        self._post("/close")
+
+    def write(self, data):
+        self._post("/write", data=data.decode())
+
+    def set_binary(self, enabled, interval_ms=10):
+        self._post("/binary", enabled=enabled, interval_ms=interval_ms)
+
+    def send_config(self, lines, timeout=3.0, retries=2):
+        return self._post("/send_config", lines=list(lines), timeout=timeout, retries=retries)
+
+    def begin_run(self, voltage, meta=None):
+        self._post("/begin_run", voltage=voltage, meta=meta)
+
+    def end_run(self):
+        self._post("/end_run")
+
+    def resume(self, path=None):
+        return self._post("/resume", path=path)["ok"]
+
+    def continue_run(self):
+        return self._post("/continue_run")["ok"]
@@ -0,0 +1,74 @@
+import os
+import threading
+
+from serial.tools import list_ports
+
+# ---- Board Detection ----
+# USB vendor ids of the boards we use (Arduino, Arduino clones with CH340 / FTDI bridges).
+BOARD_VIDS = {0x2341, 0x2A03, 0x1A86, 0x0403}
+DEFAULT_PORT = "/dev/ttyACM0"
+# Ports that are not USB boards, e.g. sim_device.py's pty link (comma separated).
+EXTRA_PORTS = [port for port in os.environ.get("FNM_EXTRA_PORTS", "").split(",") if port]
+
+
+def board_infos():
+    return sorted(
+        (info for info in list_ports.comports()
+         if info.vid in BOARD_VIDS or info.device.startswith("/dev/ttyACM")),
+        key=lambda info: info.device,
+    )
+
+
+def find_boards():
+    return [info.device for info in board_infos()]
+
+
+# ---- Device Manager ----
+# One acquisition worker per attached board, created on scan() and kept for the
+# life of the process, so every rig runs its own experiment side by side.
+# A board that comes back under a new device name after a USB rebind is still
+# owned by its old worker (matched by USB serial number), not given a new one.
+class DeviceManager:
+    def __init__(self, baudrate=115200):
+        self.baudrate = baudrate
+        self.workers = {}
+        self.lock = threading.Lock()
+
+    def scan(self):
+        with self.lock:
+            owned = {worker.device for worker in self.workers.values()}
+            owned |= {worker.serial_number for worker in self.workers.values() if worker.serial_number}
+        for info in board_infos():
+            if info.device not in owned and info.serial_number not in owned:
+                self.get(info.device)
+        for device in EXTRA_PORTS:
+            if device not in owned and os.path.exists(device):
+                self.get(device)
+        return self.ports()
+
+    def get(self, port):
+        with self.lock:
+            worker = self.workers.get(port)
+            if worker is None:
+                # Imported here: numpy/pandas are only needed once a board is opened, so a
+                # dashboard talking to the daemon (which imports this module) starts faster.
+                from acquisition import AcquisitionWorker
+
+                worker = AcquisitionWorker(port, self.baudrate)
+                worker.resume()
+                worker.connect()
+                worker.start()
+                self.workers[port] = worker
+        return worker
+
+    def ports(self):
+        with self.lock:
+            return sorted(self.workers)
+
+    def close_all(self):
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            worker.end_run()
+            worker.stop()
+            worker.close()
@@ -0,0 +1,136 @@
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+# ---- Min/Max Buckets ----
+# Reduces sorted samples to one (min, max) pair per time bucket of `width`
+# seconds. Returns bucket ids and the time/value of each bucket's min and max.
+def minmax_buckets(seconds, voltage, width):
+    ids = np.floor(seconds / width).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    counts = np.diff(np.r_[starts, len(ids)])
+    v_min = np.minimum.reduceat(voltage, starts)
+    v_max = np.maximum.reduceat(voltage, starts)
+    t_min = seconds[first_hit(voltage == np.repeat(v_min, counts), starts)]
+    t_max = seconds[first_hit(voltage == np.repeat(v_max, counts), starts)]
+    return ids[starts], t_min, v_min, t_max, v_max
+
+
+def first_hit(hit, starts):
+    idx = np.flatnonzero(hit)
+    segment = np.searchsorted(starts, idx, side="right") - 1
+    _, first = np.unique(segment, return_index=True)
+    return idx[first]
+
+
+def bucket_points(t_min, v_min, t_max, v_max):
+    # Two points per bucket, in time order, so spikes survive the reduction.
+    min_first = t_min <= t_max
+    seconds = np.column_stack([np.where(min_first, t_min, t_max), np.where(min_first, t_max, t_min)]).ravel()
+    voltage = np.column_stack([np.where(min_first, v_min, v_max), np.where(min_first, v_max, v_min)]).ravel()
+    keep = np.r_[True, seconds[1:] != seconds[:-1]]
+    return seconds[keep], voltage[keep]
+
+
+# ---- Level ----
+# Buckets of one power-of-two width, extended only with samples it has not seen.
+class _Level:
+    def __init__(self, width):
+        self.width = width
+        self.cursor = 0  # absolute sample index (store seq) already folded in
+        self.n = 0
+        self.ids = np.empty(64, dtype=np.int64)
+        self.t_min = np.empty(64, dtype=np.float64)
+        self.v_min = np.empty(64, dtype=np.float32)
+        self.t_max = np.empty(64, dtype=np.float64)
+        self.v_max = np.empty(64, dtype=np.float32)
+
+    def _grow(self, need):
+        if need <= len(self.ids):
+            return
+        capacity = max(need, 2 * len(self.ids))
+        for name in ("ids", "t_min", "v_min", "t_max", "v_max"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def update(self, seconds, voltage, first_seq):
+        start = max(self.cursor - first_seq, 0)
+        self.cursor = first_seq + len(seconds)
+        if start >= len(seconds):
+            return
+        ids, t_min, v_min, t_max, v_max = minmax_buckets(seconds[start:], voltage[start:], self.width)
+
+        # The newest cached bucket may still be open: fold the first new bucket into it.
+        if self.n and ids[0] == self.ids[self.n - 1]:
+            last = self.n - 1
+            if v_min[0] < self.v_min[last]:
+                self.t_min[last], self.v_min[last] = t_min[0], v_min[0]
+            if v_max[0] > self.v_max[last]:
+                self.t_max[last], self.v_max[last] = t_max[0], v_max[0]
+            ids, t_min, v_min, t_max, v_max = ids[1:], t_min[1:], v_min[1:], t_max[1:], v_max[1:]
+
+        count = len(ids)
+        self._grow(self.n + count)
+        end = self.n + count
+        self.ids[self.n:end] = ids
+        self.t_min[self.n:end] = t_min
+        self.v_min[self.n:end] = v_min
+        self.t_max[self.n:end] = t_max
+        self.v_max[self.n:end] = v_max
+        self.n = end
+
+    def drop_before(self, t):
+        # Forgets buckets wholly before `t` once they are half the level, so a level
+        # follows a store that drops its oldest samples instead of growing with the run.
+        lo = int(np.searchsorted(self.ids[:self.n], math.floor(t / self.width), side="left"))
+        if lo and 2 * lo >= self.n:
+            for name in ("ids", "t_min", "v_min", "t_max", "v_max"):
+                values = getattr(self, name)
+                values[:self.n - lo] = values[lo:self.n]
+            self.n -= lo
+
+    def window(self, t_start, t_end):
+        ids = self.ids[:self.n]
+        lo = np.searchsorted(ids, math.floor(t_start / self.width), side="left")
+        hi = np.searchsorted(ids, math.floor(t_end / self.width), side="right")
+        return bucket_points(self.t_min[lo:hi], self.v_min[lo:hi], self.t_max[lo:hi], self.v_max[lo:hi])
+
+
+# ---- Level of Detail ----
+# Keeps chart cost bounded by `budget` buckets whatever the run length.
+# Levels are cached per bucket width, so each zoom window reuses its level and
+# a refresh only folds the samples that arrived since the previous one.
+class LevelOfDetail:
+    def __init__(self, budget=800):
+        self.budget = budget
+        self.generation = None
+        self.levels = {}
+        self.lock = threading.Lock()
+
+    def frame(self, seconds, voltage, first_seq, generation, window=None):
+        if not len(seconds):
+            return pd.DataFrame({"Seconds": seconds, "Voltage": voltage})
+
+        t_end = float(seconds[-1])
+        t_start = float(seconds[0]) if window is None else max(t_end - window, float(seconds[0]))
+        lo = np.searchsorted(seconds, t_start, side="left")
+        if len(seconds) - lo <= 2 * self.budget or t_end <= t_start:
+            return pd.DataFrame({"Seconds": seconds[lo:], "Voltage": voltage[lo:]})
+
+        k = math.ceil(math.log2((t_end - t_start) / self.budget))
+        with self.lock:
+            if generation != self.generation:
+                self.generation = generation
+                self.levels = {}
+            level = self.levels.get(k)
+            if level is None:
+                level = self.levels[k] = _Level(2.0 ** k)
+            level.update(seconds, voltage, first_seq)
+            level.drop_before(float(seconds[0]))
+            t, v = level.window(t_start, t_end)
+        return pd.DataFrame({"Seconds": t, "Voltage": v})
@@ -0,0 +1,140 @@
+import numpy as np
+
+# ---- Frame Format ----
+# Sent by the sketches after "BIN:1" (11 bytes, little endian):
+#   0xA5 | seq u16 | millis u32 | adc u16 | mode u8 | crc8 u8
+# crc8 (poly 0x07, init 0) covers the 9 bytes between sync and crc.
+# 0xA5 never occurs in the ASCII text protocol, so acks and other text lines
+# can share the stream; everything that is not a valid frame is handed back as text.
+SYNC = 0xA5
+FRAME_SIZE = 11
+FRAME_DTYPE = np.dtype([
+    ("sync", "u1"), ("seq", "<u2"), ("millis", "<u4"),
+    ("adc", "<u2"), ("mode", "u1"), ("crc", "u1"),
+])
+
+BINARY_ON = b"BIN:1\n"
+BINARY_OFF = b"BIN:0\n"
+DEFAULT_INTERVAL_MS = 10  # 100 Hz, vs the 1 Hz text lines
+
+
+def _crc8_table():
+    table = np.zeros(256, dtype=np.uint8)
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table[i] = crc
+    return table
+
+
+CRC8_TABLE = _crc8_table()
+
+
+def crc8(data):
+    crc = 0
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return int(crc)
+
+
+def encode_frame(seq, millis, adc, mode):
+    body = np.array([(SYNC, seq & 0xFFFF, millis & 0xFFFFFFFF, adc, mode, 0)], dtype=FRAME_DTYPE).tobytes()
+    return body[:-1] + bytes([crc8(body[1:-1])])
+
+
+# ---- Decoded Frames ----
+class Frames:
+    def __init__(self, seq, millis, voltage, state, adc):
+        self.seq = seq          # uint16[n]
+        self.millis = millis    # uint32[n], board clock
+        self.voltage = voltage  # float32[n]
+        self.state = state      # uint8[n], codes from STATE_NAMES
+        self.adc = adc          # uint16[n], raw reading
+
+    def __len__(self):
+        return len(self.seq)
+
+
+# ---- Frame Decoder ----
+# Candidate sync positions are checked with one vectorized CRC pass per chunk.
+class FrameDecoder:
+    def __init__(self, vref=5.0, adc_max=1023):
+        self.scale = vref / adc_max
+        self.last_seq = None
+        self.frames = 0
+        self.dropped = 0
+        self.bad_crc = 0
+        self._tail = b""
+
+    def reset(self):
+        self.last_seq = None
+        self._tail = b""
+
+    def feed(self, chunk):
+        data = self._tail + chunk if self._tail else chunk
+        self._tail = b""
+        if SYNC not in data:
+            return self._empty(), data
+
+        buf = np.frombuffer(data, dtype=np.uint8)
+        sync = np.flatnonzero(buf == SYNC)
+        whole = sync[sync + FRAME_SIZE <= len(buf)]
+
+        rows = buf[whole[:, None] + np.arange(FRAME_SIZE)]
+        crc = np.zeros(len(whole), dtype=np.uint8)
+        for col in range(1, FRAME_SIZE - 1):
+            crc = CRC8_TABLE[crc ^ rows[:, col]]
+        valid = crc == rows[:, -1]
+
+        # A payload byte may itself be 0xA5 and pass the CRC by chance; keep non-overlapping frames.
+        starts = []
+        next_free = 0
+        for pos in whole[valid]:
+            if pos >= next_free:
+                starts.append(pos)
+                next_free = pos + FRAME_SIZE
+        starts = np.array(starts, dtype=np.int64)
+
+        covered = np.zeros(len(buf), dtype=bool)
+        if len(starts):
+            covered[(starts[:, None] + np.arange(FRAME_SIZE)).ravel()] = True
+        self.bad_crc += int(np.count_nonzero(~covered[whole[~valid]]))
+
+        # A frame may be split across reads: keep it for the next chunk.
+        cut = len(buf)
+        for pos in sync[len(whole):]:
+            if not covered[pos]:
+                cut = int(pos)
+                self._tail = data[cut:]
+                break
+        text = buf[:cut][~covered[:cut]].tobytes()
+        if not len(starts):
+            return self._empty(), text
+
+        frames = buf[starts[:, None] + np.arange(FRAME_SIZE)].view(FRAME_DTYPE).ravel()
+        seq = frames["seq"].copy()
+        self._count(seq)
+        adc = frames["adc"].copy()
+        return Frames(
+            seq,
+            frames["millis"].copy(),
+            (adc * self.scale).astype(np.float32),
+            frames["mode"].copy(),
+            adc,
+        ), text
+
+    def _count(self, seq):
+        prev = np.empty(len(seq), dtype=np.int64)
+        prev[0] = int(seq[0]) - 1 if self.last_seq is None else self.last_seq
+        prev[1:] = seq[:-1]
+        gaps = (seq.astype(np.int64) - prev - 1) % 65536
+        self.dropped += int(gaps.sum())
+        self.frames += len(seq)
+        self.last_seq = int(seq[-1])
+
+    def _empty(self):
+        return Frames(
+            np.empty(0, np.uint16), np.empty(0, np.uint32),
+            np.empty(0, np.float32), np.empty(0, np.uint8), np.empty(0, np.uint16),
+        )
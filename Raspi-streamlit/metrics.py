@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ---- Metrics Registry ----
+# Process-wide counters, gauges and timers, keyed by name + labels. Each update is
+# one dict operation under a lock; the acquisition worker sums its per-chunk
+# numbers locally and publishes them once a second. FNM_METRICS=0 turns every
+# update into a no-op. prometheus() renders the text exposition format.
+class Metrics:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.timers = {}  # key -> [count, total seconds, max seconds]
+        self.help = {}
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, seconds, **labels):
+        self.observe_many(name, 1, seconds, seconds, **labels)
+
+    def observe_many(self, name, count, total, worst, **labels):
+        # Pre-aggregated timings, for hot paths that publish once a second.
+        if not self.enabled or not count:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                self.timers[key] = [count, total, worst]
+            else:
+                timer[0] += count
+                timer[1] += total
+                if worst > timer[2]:
+                    timer[2] = worst
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def stopwatch(self, name, **labels):
+        return Stopwatch(self, name, labels)
+
+    def rows(self):
+        # Flat view for the diagnostics panel: (metric, labels, value, mean ms, max ms).
+        with self.lock:
+            counters = list(self.counters.items())
+            gauges = list(self.gauges.items())
+            timers = [(key, list(value)) for key, value in self.timers.items()]
+        rows = []
+        for (name, labels), value in sorted(counters) + sorted(gauges):
+            rows.append((name, _label_text(labels), value, None, None))
+        for (name, labels), (count, total, worst) in sorted(timers):
+            rows.append((name, _label_text(labels), count, total / count * 1000, worst * 1000))
+        return rows
+
+    def prometheus(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            timers = sorted((key, list(value)) for key, value in self.timers.items())
+        out = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self.help:
+                    out.append(f"# HELP {name} {self.help[name]}")
+                out.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            out.append(f"{name}{_label_text(labels)} {value}")
+        for (name, labels), value in gauges:
+            header(name, "gauge")
+            out.append(f"{name}{_label_text(labels)} {value}")
+        for (name, labels), (count, total, worst) in timers:
+            header(name, "summary")
+            out.append(f"{name}_count{_label_text(labels)} {count}")
+            out.append(f"{name}_sum{_label_text(labels)} {total:.6f}")
+        for (name, labels), (count, total, worst) in timers:
+            header(name + "_max", "gauge")
+            out.append(f"{name}_max{_label_text(labels)} {worst:.6f}")
+        return "\n".join(out) + "\n"
+
+
+# Laps through a sequence of stages, e.g. the sections of one Streamlit rerun.
+class Stopwatch:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.start = self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.metrics.observe(self.name, now - self.last, stage=stage, **self.labels)
+        self.last = now
+
+    def total(self, name):
+        self.metrics.observe(name, time.perf_counter() - self.start, **self.labels)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics(enabled=os.environ.get("FNM_METRICS", "1") != "0")
+METRICS.describe("fnm_serial_bytes_total", "Bytes read from the serial port.")
+METRICS.describe("fnm_serial_reads_total", "Non-empty serial reads.")
+METRICS.describe("fnm_serial_buffer_bytes", "Bytes waiting in the OS serial buffer before the last read.")
+METRICS.describe("fnm_serial_buffer_high_water_bytes", "Most bytes found waiting in the OS serial buffer since the port was opened.")
+METRICS.describe("fnm_serial_chunk_high_water_bytes", "Largest single serial read since the port was opened.")
+METRICS.describe("fnm_serial_rate_bytes", "Smoothed serial byte rate (bytes/s).")
+METRICS.describe("fnm_serial_coalesced", "Reads that waited for the rest of a split line or frame, since the port was opened.")
+METRICS.describe("fnm_lines_total", "Complete text lines received.")
+METRICS.describe("fnm_samples_total", "Samples recorded, by source (text lines or binary frames).")
+METRICS.describe("fnm_unparsed_lines_total", "Lines that were neither a sample nor a known firmware message.")
+METRICS.describe("fnm_ingest_seconds", "Worker time per serial chunk, by stage.")
+METRICS.describe("fnm_rerun_stage_seconds", "Dashboard rerun time, by script section.")
+METRICS.describe("fnm_rerun_seconds", "Dashboard rerun time.")
+METRICS.describe("fnm_live_stage_seconds", "Dashboard live refresh time, by fragment and step.")
+METRICS.describe("fnm_live_seconds", "Dashboard live refresh time, by fragment.")
+
+
+# ---- Exporter ----
+class MetricsHandler(BaseHTTPRequestHandler):
+    metrics = METRICS
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        data = self.metrics.prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve_metrics(port, host="0.0.0.0"):
+    # Standalone /metrics endpoint for when the dashboard owns the ports (no daemon).
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,310 @@
+import argparse
+import csv
+import json
+import os
+from collections import deque
+
+import numpy as np
+
+from cycles import cumulative_trapezoid
+from sample_store import STATE_CODES, STATE_NAMES
+
+# ---- Phase Metrics ----
+# The numbers the notebooks recompute from the CSV after a run, kept up to date while
+# it records. A phase is a stretch of samples with the same MODE; it lasts from its
+# first sample to the first sample of the next phase. Per phase we keep
+#   state, start, end, duration_s, samples
+#   mean_v, std_v      Welford, merged chunk by chunk (Chan et al.)
+#   min_v, max_v, peak_time
+#   integral           trapezoid of V over the phase, V*s
+#   energy             trapezoid of V^2, V^2*s; the energy into a load R is energy / R
+#                      (the rig logs no current, so this is the proxy the notebooks use)
+# A cycle is a Charging phase and the phases after it, up to the next Charging:
+#   charge_s, discharge_s, stop_s, ratio (charge_s / discharge_s), peak_v,
+#   mean_charge_v, mean_discharge_v, integral, energy
+# Over the run: totals per state, and the drift of the cycle peaks (least squares
+# slope against cycle start, from running sums, in mV/h).
+#
+# Like cycles.py, feed() takes chunks of any size: numpy over the chunk plus one small
+# step per MODE change, and between calls only the open phase's and open cycle's
+# accumulators. Finished phases and cycles are returned to the caller, which appends
+# them to the sidecar files next to the run log (see MetricsLog).
+PHASE_COLUMNS = ["phase", "state", "start", "end", "duration_s", "samples", "mean_v", "std_v",
+                 "min_v", "max_v", "peak_time", "integral", "energy"]
+CYCLE_COLUMNS = ["cycle", "start", "end", "duration_s", "charge_s", "discharge_s", "stop_s", "ratio",
+                 "peak_v", "mean_charge_v", "mean_discharge_v", "integral", "energy"]
+CHARGING = STATE_CODES["Charging"]
+CYCLE_STATES = {"Charging": "charge_s", "Discharging": "discharge_s", "Stop": "stop_s"}
+
+
+def merge(acc, n, mean, m2):
+    # acc = [n, mean, M2]; folds in another group's n, mean and M2.
+    if not n:
+        return
+    total = acc[0] + n
+    delta = mean - acc[1]
+    acc[1] += delta * n / total
+    acc[2] += m2 + delta * delta * acc[0] * n / total
+    acc[0] = total
+
+
+def std(acc):
+    return float(np.sqrt(acc[2] / (acc[0] - 1))) if acc[0] > 1 else 0.0
+
+
+class PhaseMetrics:
+    def __init__(self, keep=50):
+        self.recent_phases = deque(maxlen=keep)
+        self.recent_cycles = deque(maxlen=keep)
+        self.reset()
+
+    def reset(self):
+        self.recent_phases.clear()
+        self.recent_cycles.clear()
+        self.phase_count = 0
+        self.cycle_count = 0
+        self._last = None  # (t, v) of the previous sample, for the trapezoids across chunks
+        self._phase = None  # open phase
+        self._cycle = None  # open cycle
+        # state -> [phases, seconds, integral, energy, [n, mean, M2]] over the closed phases
+        self.totals = {name: [0, 0.0, 0.0, 0.0, [0, 0.0, 0.0]] for name in STATE_NAMES}
+        # cycle totals: charge_s, discharge_s, integral, energy, peak_v
+        self.cycle_totals = np.zeros(5)
+        self._drift = np.zeros(5)  # n, sum t, sum y, sum t*t, sum t*y of (hours since first cycle, peak V)
+        self._drift_origin = None
+
+    def feed(self, t, v, state):
+        t = np.asarray(t, dtype=np.float64)
+        v = np.asarray(v, dtype=np.float64)
+        state = np.asarray(state, dtype=np.uint8)
+        n = len(t)
+        if not n:
+            return [], []
+        if self._phase is None:
+            self._open(t[0], state[0])
+        before = np.empty(n, dtype=np.uint8)
+        before[0] = self._phase["code"]
+        before[1:] = state[:-1]
+        changes = np.flatnonzero(state != before)
+
+        # Running trapezoids of V and V^2, carried across chunks from the previous last sample.
+        last_t, last_v = self._last if self._last else (t[0], v[0])
+        area = cumulative_trapezoid(t, v, (last_t, last_v))
+        area_sq = cumulative_trapezoid(t, v * v, (last_t, last_v * last_v))
+        self._last = (t[-1], v[-1])
+
+        phases, cycles = [], []
+        lo = first = 0  # open phase's first sample in this chunk, and its first trapezoid
+        for i in changes:
+            # The step into the next phase's first sample still belongs to this one.
+            self._fold(t, v, lo, i)
+            self._phase["integral"] += area[i + 1] - area[first]
+            self._phase["energy"] += area_sq[i + 1] - area_sq[first]
+            phase = self._close(t[i])
+            phases.append(phase)
+            cycle = self._add_to_cycle(phase, state[i] == CHARGING)
+            if cycle:
+                cycles.append(cycle)
+            self._open(t[i], state[i])
+            lo, first = i, i + 1
+        self._fold(t, v, lo, n)
+        self._phase["integral"] += area[n] - area[first]
+        self._phase["energy"] += area_sq[n] - area_sq[first]
+        self._phase["end"] = t[-1]
+        return phases, cycles
+
+    def _open(self, start, code):
+        self._phase = {"code": int(code), "start": float(start), "end": float(start), "acc": [0, 0.0, 0.0],
+                       "min": np.inf, "max": -np.inf, "peak_time": float(start), "integral": 0.0, "energy": 0.0}
+
+    def _fold(self, t, v, lo, hi):
+        if hi <= lo:
+            return
+        segment = v[lo:hi]
+        mean = segment.mean()
+        merge(self._phase["acc"], int(hi - lo), mean, float(((segment - mean) ** 2).sum()))
+        k = lo + int(np.argmax(segment))
+        if v[k] > self._phase["max"]:
+            self._phase["max"] = float(v[k])
+            self._phase["peak_time"] = float(t[k])
+        self._phase["min"] = min(self._phase["min"], float(segment.min()))
+
+    def _close(self, end):
+        open_phase = self._phase
+        acc = open_phase["acc"]
+        self.phase_count += 1
+        phase = {
+            "phase": self.phase_count,
+            "state": STATE_NAMES[open_phase["code"]],
+            "start": open_phase["start"],
+            "end": float(end),
+            "duration_s": float(end) - open_phase["start"],
+            "samples": acc[0],
+            "mean_v": float(acc[1]),
+            "std_v": std(acc),
+            "min_v": float(open_phase["min"]),
+            "max_v": float(open_phase["max"]),
+            "peak_time": open_phase["peak_time"],
+            "integral": float(open_phase["integral"]),
+            "energy": float(open_phase["energy"]),
+        }
+        total = self.totals[phase["state"]]
+        total[0] += 1
+        total[1] += phase["duration_s"]
+        total[2] += phase["integral"]
+        total[3] += phase["energy"]
+        merge(total[4], acc[0], acc[1], acc[2])
+        self.recent_phases.append(phase)
+        return phase
+
+    def _add_to_cycle(self, phase, next_is_charging):
+        # Returns the cycle when `phase` was its last one (the next phase starts a new charge).
+        if phase["state"] == "Charging":
+            self._cycle = {"start": phase["start"], "peak_v": phase["max_v"], "integral": 0.0, "energy": 0.0,
+                           "charge_s": 0.0, "discharge_s": 0.0, "stop_s": 0.0,
+                           "Charging": [0, 0.0], "Discharging": [0, 0.0]}  # samples, sum of V
+        cycle = self._cycle
+        if cycle is None:
+            return None  # the run started mid-cycle
+        if phase["state"] in CYCLE_STATES:
+            cycle[CYCLE_STATES[phase["state"]]] += phase["duration_s"]
+        if phase["state"] in ("Charging", "Discharging"):
+            cycle[phase["state"]][0] += phase["samples"]
+            cycle[phase["state"]][1] += phase["samples"] * phase["mean_v"]
+        cycle["peak_v"] = max(cycle["peak_v"], phase["max_v"])
+        cycle["integral"] += phase["integral"]
+        cycle["energy"] += phase["energy"]
+        cycle["end"] = phase["end"]
+        return self._close_cycle() if next_is_charging else None
+
+    def _close_cycle(self):
+        open_cycle, self._cycle = self._cycle, None
+        self.cycle_count += 1
+        cycle = {
+            "cycle": self.cycle_count,
+            "start": open_cycle["start"],
+            "end": open_cycle["end"],
+            "duration_s": open_cycle["end"] - open_cycle["start"],
+            "charge_s": open_cycle["charge_s"],
+            "discharge_s": open_cycle["discharge_s"],
+            "stop_s": open_cycle["stop_s"],
+            "ratio": open_cycle["charge_s"] / open_cycle["discharge_s"] if open_cycle["discharge_s"] else None,
+            "peak_v": open_cycle["peak_v"],
+            "mean_charge_v": open_cycle["Charging"][1] / open_cycle["Charging"][0] if open_cycle["Charging"][0] else None,
+            "mean_discharge_v": open_cycle["Discharging"][1] / open_cycle["Discharging"][0] if open_cycle["Discharging"][0] else None,
+            "integral": open_cycle["integral"],
+            "energy": open_cycle["energy"],
+        }
+        self.cycle_totals += (cycle["charge_s"], cycle["discharge_s"], cycle["integral"], cycle["energy"], cycle["peak_v"])
+        if self._drift_origin is None:
+            self._drift_origin = cycle["start"]
+        hours = (cycle["start"] - self._drift_origin) / 3600
+        self._drift += (1, hours, cycle["peak_v"], hours * hours, hours * cycle["peak_v"])
+        self.recent_cycles.append(cycle)
+        return cycle
+
+    def peak_drift(self):
+        # V/h of the cycle peaks; None until there are two cycles at different times.
+        n, st, sy, stt, sty = self._drift
+        denominator = n * stt - st * st
+        if n < 2 or denominator <= 0:
+            return None
+        return float((n * sty - st * sy) / denominator)
+
+    def summary(self):
+        states = {}
+        for name, (count, seconds, integral, energy, acc) in self.totals.items():
+            if count:
+                states[name] = {"phases": count, "total_s": seconds, "mean_duration_s": seconds / count,
+                                "mean_v": float(acc[1]), "std_v": std(acc), "integral": integral, "energy": energy}
+        summary = {"phases": self.phase_count, "cycles": self.cycle_count, "states": states, "open": None,
+                   "last_phase": self.recent_phases[-1] if self.recent_phases else None,
+                   "last_cycle": self.recent_cycles[-1] if self.recent_cycles else None}
+        if self._phase is not None:
+            acc = self._phase["acc"]
+            summary["open"] = {"state": STATE_NAMES[self._phase["code"]], "start": self._phase["start"],
+                               "duration_s": self._phase["end"] - self._phase["start"], "samples": acc[0],
+                               "mean_v": float(acc[1]), "max_v": float(self._phase["max"]) if acc[0] else None}
+        if self.cycle_count:
+            charge_s, discharge_s, integral, energy, peak_v = self.cycle_totals / self.cycle_count
+            drift = self.peak_drift()
+            summary["cycle"] = {
+                "mean_charge_s": float(charge_s),
+                "mean_discharge_s": float(discharge_s),
+                "ratio": float(charge_s / discharge_s) if discharge_s else None,
+                "mean_peak_v": float(peak_v),
+                "peak_drift_mv_per_h": drift * 1000 if drift is not None else None,
+                "mean_integral": float(integral),
+                "mean_energy": float(energy),
+            }
+        return summary
+
+
+# ---- Sidecar Files ----
+# Next to run-<date>-<time>.fnmlog: .phases.csv and .cycles.csv get a row per finished
+# phase / cycle as it closes, and .summary.json is replaced (atomically) with summary()
+# whenever one does and when the run ends. A run that is resumed after a restart keeps
+# appending to the same files.
+def sidecar_paths(log_path):
+    base = os.path.splitext(log_path)[0]
+    return base + ".phases.csv", base + ".cycles.csv", base + ".summary.json"
+
+
+class MetricsLog:
+    def __init__(self, log_path):
+        self.phases_path, self.cycles_path, self.summary_path = sidecar_paths(log_path)
+
+    def append(self, phases, cycles):
+        for path, columns, rows in ((self.phases_path, PHASE_COLUMNS, phases), (self.cycles_path, CYCLE_COLUMNS, cycles)):
+            if not rows:
+                continue
+            new = not os.path.exists(path)
+            with open(path, "a", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=columns)
+                if new:
+                    writer.writeheader()
+                writer.writerows(rows)
+
+    def write_summary(self, summary):
+        tmp = self.summary_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(summary, f, indent=2)
+        os.replace(tmp, self.summary_path)
+
+
+def compute(seconds, voltage, state, chunk=1_000_000):
+    # Offline: whole log in bounded chunks. The last, unfinished phase and cycle are not rows.
+    import pandas as pd
+
+    metrics = PhaseMetrics()
+    phases, cycles = [], []
+    for i in range(0, len(seconds), chunk):
+        new_phases, new_cycles = metrics.feed(seconds[i:i + chunk], voltage[i:i + chunk], state[i:i + chunk])
+        phases.extend(new_phases)
+        cycles.extend(new_cycles)
+    return pd.DataFrame(phases, columns=PHASE_COLUMNS), pd.DataFrame(cycles, columns=CYCLE_COLUMNS), metrics.summary()
+
+
+# ---- CLI ----
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-phase and per-cycle metrics of a run log.")
+    parser.add_argument("path", help=".fnmlog run log")
+    parser.add_argument("--write", action="store_true", help="(re)write the log's .phases.csv, .cycles.csv and .summary.json")
+    args = parser.parse_args()
+
+    from segment_log import read_segment
+
+    meta, seconds, voltage, state = read_segment(args.path)
+    phases, cycles, summary = compute(seconds, voltage, state)
+    if args.write:
+        phases_path, cycles_path, summary_path = sidecar_paths(args.path)
+        phases.to_csv(phases_path, index=False)
+        cycles.to_csv(cycles_path, index=False)
+        MetricsLog(args.path).write_summary(summary)
+        print(f"Wrote {len(phases)} phases to {phases_path} and {len(cycles)} cycles to {cycles_path}")
+    else:
+        print(f"{os.path.basename(args.path)}: {len(phases)} phases, {len(cycles)} cycles")
+        if len(phases):
+            print(phases.groupby("state")[["duration_s", "mean_v", "std_v", "integral", "energy"]].mean().round(3))
+        if "cycle" in summary:
+            print(json.dumps(summary["cycle"], indent=2))
@@ -0,0 +1,128 @@
+import re
+from itertools import repeat
+
+import numpy as np
+
+from sample_store import STATE_NAMES
+
+# ---- Text Protocol ----
+# Live Input | VOLTAGE: 1.2345 | DIR: INCREASING | MODE: Charging | T: 123456
+# T is the board's millis() when the line was printed; sketches older than it
+# leave it out, and those samples are stamped with their arrival time instead.
+SAMPLE_FIELDS = rb"VOLTAGE:[ \t]*([0-9.]+)[ \t]*\|[ \t]*DIR:[ \t]*\w+[ \t]*\|[ \t]*MODE:[ \t]*(\w+)"
+MILLIS_FIELD = rb"[ \t]*\|[ \t]*T:[ \t]*(\d+)"
+SAMPLE_PATTERN = re.compile(SAMPLE_FIELDS + rb"(?:" + MILLIS_FIELD + rb")?")  # any mix of old and new lines
+# A chunk normally comes from one sketch, so all its lines have T or none do. Those
+# two layouts get a pattern each, so T converts straight to int64 with no missing values.
+TIMED_PATTERN = re.compile(SAMPLE_FIELDS + MILLIS_FIELD)
+UNTIMED_PATTERN = re.compile(SAMPLE_FIELDS)
+NO_MILLIS = -1
+SAMPLE_MARKER = b"VOLTAGE:"
+MILLIS_MARKER = b"T:"
+STATE_BYTES = {name.encode(): code for code, name in enumerate(STATE_NAMES)}
+
+# Firmware chatter, matched by prefix. Acks are what the sketches print after applying a command.
+EVENT_PREFIXES = [
+    ("Updated Peak/Min received", "ack_peak_min"),
+    ("Updated custom delay time to", "ack_time"),
+    ("Updated CHARGING time to", "ack_c_time"),
+    ("Updated DISCHARGING time to", "ack_dc_time"),
+    ("Binary telemetry", "ack_bin"),
+    ("Updated frame interval to", "ack_rate"),
+    ("Simulation stopped", "stopped"),
+    ("Simulation resumed", "resumed"),
+    ("Invalid time value", "error"),
+    ("Cannot start", "error"),
+]
+PHASE_MARKERS = ("DISCHARGING", "RECHARGING", "LOOP CHARGING", "loop", "Resuming normal charging")
+
+
+def classify(line):
+    for prefix, kind in EVENT_PREFIXES:
+        if line.startswith(prefix):
+            return kind
+    if any(marker in line for marker in PHASE_MARKERS):
+        return "phase"
+    return "other"
+
+
+# ---- Batch ----
+class Batch:
+    def __init__(self, voltage, state, events, lines, millis=None):
+        self.voltage = voltage  # float32[n]
+        self.state = state      # uint8[n], codes from STATE_NAMES
+        self.millis = millis if millis is not None else np.full(len(voltage), NO_MILLIS, np.int64)  # int64[n], board clock
+        self.events = events    # [(kind, text)]
+        self.lines = lines      # complete lines seen, samples + events
+
+    def __len__(self):
+        return len(self.voltage)
+
+
+# ---- Line Parser ----
+# Takes whatever read(in_waiting) returned, splits it into lines itself and keeps
+# the trailing partial line for the next call. Sample lines are pulled out with
+# one findall over the whole chunk; lines are only walked one by one when the
+# chunk also carries firmware messages.
+class LineParser:
+    def __init__(self, max_partial=4096):
+        self.max_partial = max_partial
+        self._partial = b""
+        self.unparsed = 0
+
+    def reset(self):
+        self._partial = b""
+
+    def feed(self, chunk):
+        data = self._partial + chunk if self._partial else chunk
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._partial = data[-self.max_partial:]
+            return Batch(np.empty(0, np.float32), np.empty(0, np.uint8), [], 0)
+        self._partial = data[end + 1:]
+        body = data[:end]
+
+        markers = body.count(SAMPLE_MARKER)
+        pattern = TIMED_PATTERN if MILLIS_MARKER in body else UNTIMED_PATTERN
+        matches = pattern.findall(body)
+        if len(matches) < markers and pattern is TIMED_PATTERN:
+            # Lines without T (or corrupted ones) among them: match each line on its own terms.
+            pattern = SAMPLE_PATTERN
+            matches = pattern.findall(body)
+        lines = body.count(b"\n") + 1
+        events = []
+        if len(matches) != lines:
+            for raw in body.split(b"\n"):
+                if SAMPLE_MARKER in raw:
+                    continue
+                text = raw.decode("utf-8", errors="ignore").strip()
+                if text:
+                    events.append((classify(text), text))
+            self.unparsed += sum(1 for kind, _ in events if kind == "other")
+
+        self.unparsed += markers - len(matches)
+
+        try:
+            voltage = np.array([m[0] for m in matches], dtype=np.float32)
+        except ValueError:
+            # A corrupted number such as "1.2.3": drop just those samples.
+            parsed = [m for m in matches if _is_float(m[0])]
+            self.unparsed += len(matches) - len(parsed)
+            matches = parsed
+            voltage = np.array([m[0] for m in matches], dtype=np.float32)
+        state = np.fromiter(map(STATE_BYTES.get, [m[1] for m in matches], repeat(0)), np.uint8, len(matches))
+        if pattern is TIMED_PATTERN:
+            millis = np.array([m[2] for m in matches], dtype=np.int64)
+        elif pattern is SAMPLE_PATTERN:
+            millis = np.fromiter((int(m[2]) if m[2] else NO_MILLIS for m in matches), np.int64, len(matches))
+        else:
+            millis = np.full(len(matches), NO_MILLIS, np.int64)
+        return Batch(voltage, state, events, lines, millis)
+
+
+def _is_float(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
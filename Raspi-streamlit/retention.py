@@ -0,0 +1,194 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from downsample import bucket_points, first_hit, minmax_buckets
+
+# ---- Tiered Retention ----
+# Long-run mode for experiments that go on for days. The sample store keeps full
+# resolution only for the last `recent` seconds; older samples are folded into
+# per-second rollups, and per-second rollups older than `seconds` into per-minute
+# ones. Every rollup bucket keeps
+#   t_min, v_min, t_max, v_max   the extremes and when they happened (spikes still show)
+#   v_sum, count                 for the mean
+#   state                        the state code of its last sample
+# Folding runs as data ages out, in batches of half a tier, so it costs a few numpy
+# calls every few minutes and memory stays at about
+#   recent * rate raw samples + `seconds` per-second rows + one row per minute of run
+# The run log on disk still has every sample.
+FIELDS = [
+    ("ids", np.int64),
+    ("t_min", np.float64),
+    ("v_min", np.float32),
+    ("t_max", np.float64),
+    ("v_max", np.float32),
+    ("v_sum", np.float64),
+    ("count", np.int64),
+    ("state", np.uint8),
+]
+ROW_BYTES = sum(np.dtype(dtype).itemsize for name, dtype in FIELDS)
+
+
+def raw_rows(seconds, voltage, state):
+    # Samples as rollup rows of one sample each, so every tier folds the same way.
+    voltage = np.asarray(voltage, dtype=np.float32)
+    return {
+        "ids": np.floor(seconds).astype(np.int64),
+        "t_min": seconds, "v_min": voltage, "t_max": seconds, "v_max": voltage,
+        "v_sum": voltage.astype(np.float64), "count": np.ones(len(seconds), dtype=np.int64),
+        "state": state,
+    }
+
+
+# ---- Rollup ----
+# Buckets of `width` seconds in time order. ids are bucket numbers (floor(t / width)).
+class Rollup:
+    def __init__(self, width):
+        self.width = width
+        self.n = 0
+        for name, dtype in FIELDS:
+            setattr(self, name, np.empty(64, dtype=dtype))
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def nbytes(self):
+        return len(self.ids) * ROW_BYTES
+
+    def clear(self):
+        self.n = 0
+
+    def _grow(self, need):
+        if need > len(self.ids):
+            self._resize(max(need, 2 * len(self.ids)))
+
+    def _resize(self, capacity):
+        for name, dtype in FIELDS:
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def fold(self, rows, scale=1.0):
+        # rows: arrays by FIELDS name of finer buckets (or raw samples), in time order;
+        # their ids times `scale` are seconds.
+        if not len(rows["ids"]):
+            return
+        ids = np.floor(rows["ids"] * scale / self.width).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        counts = np.diff(np.r_[starts, len(ids)])
+        v_min = np.minimum.reduceat(rows["v_min"], starts)
+        v_max = np.maximum.reduceat(rows["v_max"], starts)
+        new = {
+            "ids": ids[starts],
+            "t_min": rows["t_min"][first_hit(rows["v_min"] == np.repeat(v_min, counts), starts)],
+            "v_min": v_min,
+            "t_max": rows["t_max"][first_hit(rows["v_max"] == np.repeat(v_max, counts), starts)],
+            "v_max": v_max,
+            "v_sum": np.add.reduceat(rows["v_sum"], starts),
+            "count": np.add.reduceat(rows["count"], starts),
+            "state": rows["state"][np.r_[starts[1:], len(ids)] - 1],
+        }
+
+        # The newest bucket may still be open: the first new bucket is merged into it.
+        if self.n and new["ids"][0] == self.ids[self.n - 1]:
+            last = self.n - 1
+            if new["v_min"][0] < self.v_min[last]:
+                self.t_min[last], self.v_min[last] = new["t_min"][0], new["v_min"][0]
+            if new["v_max"][0] > self.v_max[last]:
+                self.t_max[last], self.v_max[last] = new["t_max"][0], new["v_max"][0]
+            self.v_sum[last] += new["v_sum"][0]
+            self.count[last] += new["count"][0]
+            self.state[last] = new["state"][0]
+            new = {name: values[1:] for name, values in new.items()}
+
+        count = len(new["ids"])
+        self._grow(self.n + count)
+        for name, values in new.items():
+            getattr(self, name)[self.n:self.n + count] = values
+        self.n += count
+
+    def pop_before(self, t):
+        # Removes and returns the buckets that end at or before `t`.
+        k = int(np.searchsorted(self.ids[:self.n], math.floor(t / self.width), side="left"))
+        rows = {name: getattr(self, name)[:k].copy() for name, dtype in FIELDS}
+        for name, dtype in FIELDS:
+            values = getattr(self, name)
+            values[:self.n - k] = values[k:self.n]
+        self.n -= k
+        if len(self.ids) > 4 * max(self.n, 64):
+            self._resize(2 * max(self.n, 64))  # e.g. after resuming a long run in one go
+        return rows
+
+    def first_time(self):
+        return self.ids[0] * self.width if self.n else None
+
+    def points(self, t_start=None):
+        lo = 0 if t_start is None else np.searchsorted(self.ids[:self.n], math.floor(t_start / self.width), side="left")
+        n = self.n
+        if lo >= n:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float32)
+        return bucket_points(self.t_min[lo:n], self.v_min[lo:n], self.t_max[lo:n], self.v_max[lo:n])
+
+    def to_frame(self):
+        n = self.n
+        return pd.DataFrame({
+            "Seconds": self.ids[:n] * self.width,
+            "Min": self.v_min[:n],
+            "Max": self.v_max[:n],
+            "Mean": self.v_sum[:n] / np.maximum(self.count[:n], 1),
+            "Samples": self.count[:n],
+            "State": self.state[:n],
+        })
+
+
+# ---- Retention ----
+# Applied to a SampleStore after each append, with the worker's lock held.
+class Retention:
+    def __init__(self, recent=600.0, seconds=3600.0):
+        self.recent = recent
+        self.seconds = seconds
+        self.per_second = Rollup(1.0)
+        self.per_minute = Rollup(60.0)
+
+    def clear(self):
+        self.per_second.clear()
+        self.per_minute.clear()
+
+    def trim(self, store):
+        seconds, voltage, state = store.view()
+        if not len(seconds):
+            return
+        now = float(seconds[-1])
+        # Raw -> per second, cut on a whole second so no bucket is split across tiers.
+        if seconds[0] < now - 1.5 * self.recent:
+            k = int(np.searchsorted(seconds, math.floor(now - self.recent), side="left"))
+            self.per_second.fold(raw_rows(seconds[:k], voltage[:k], state[:k]))
+            store.drop(k)
+        # Per second -> per minute, cut on a whole minute.
+        first = self.per_second.first_time()
+        if first is not None and first < now - 1.5 * self.seconds:
+            cutoff = math.floor((now - self.seconds) / 60.0) * 60.0
+            self.per_minute.fold(self.per_second.pop_before(cutoff), self.per_second.width)
+
+    def history(self, t_start=None, budget=800):
+        # Chart points of the rolled-up part from `t_start` on, at most ~2 * budget. All
+        # of it is older than the store's first sample.
+        parts = [self.per_minute.points(t_start), self.per_second.points(t_start)]
+        seconds = np.concatenate([t for t, v in parts])
+        voltage = np.concatenate([v for t, v in parts])
+        if len(seconds) > 2 * budget:
+            span = float(seconds[-1] - seconds[0])
+            width = 2.0 ** math.ceil(math.log2(max(span, 1.0) / budget))
+            seconds, voltage = bucket_points(*minmax_buckets(seconds, voltage, width)[1:])
+        return seconds, voltage
+
+    def stats(self):
+        return {
+            "recent_s": self.recent,
+            "per_second": len(self.per_second),
+            "per_minute": len(self.per_minute),
+            "bytes": self.per_second.nbytes + self.per_minute.nbytes,
+        }
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+# ---- State Codes ----
+# Index in this list is the uint8 code kept in the store.
+STATE_NAMES = ["Unknown", "Charging", "Discharging", "Stop"]
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+
+
+def state_code(label):
+    return STATE_CODES.get(label, 0)
+
+
+# ---- Sample Store ----
+# Columnar store: float64 seconds, float32 voltage, uint8 state (13 bytes/sample).
+# Arrays grow by doubling; with maxlen set the oldest half is dropped once full.
+# Slots below len() are never written again, so views handed out by view() or
+# to_frame() stay valid while the acquisition thread keeps appending.
+class SampleStore:
+    def __init__(self, capacity=4096, maxlen=None):
+        self.maxlen = maxlen
+        self.seq = 0  # total samples ever appended, including dropped ones
+        self.generation = 0  # bumped by clear() so caches can tell runs apart
+        self.capacity = max(int(capacity), 16)
+        self._n = 0
+        self._alloc(self.capacity)
+
+    def _alloc(self, capacity, keep=0, start=0):
+        seconds = np.empty(capacity, dtype=np.float64)
+        voltage = np.empty(capacity, dtype=np.float32)
+        state = np.empty(capacity, dtype=np.uint8)
+        if keep:
+            seconds[:keep] = self._seconds[start:start + keep]
+            voltage[:keep] = self._voltage[start:start + keep]
+            state[:keep] = self._state[start:start + keep]
+        self._seconds, self._voltage, self._state = seconds, voltage, state
+        self._n = keep
+
+    def _reserve(self, extra):
+        need = self._n + extra
+        if self.maxlen and need > self.maxlen:
+            keep = max(min(self._n, self.maxlen // 2, self.maxlen - extra), 0)
+            self._alloc(max(len(self._seconds), self.maxlen), keep, self._n - keep)
+            need = self._n + extra
+        if need > len(self._seconds):
+            capacity = max(need, 2 * len(self._seconds))
+            if self.maxlen:
+                capacity = min(capacity, self.maxlen)
+            self._alloc(capacity, self._n)
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def nbytes(self):
+        return self._seconds.nbytes + self._voltage.nbytes + self._state.nbytes
+
+    def clear(self):
+        # Fresh arrays, like drop(): views of the previous run may still be in use.
+        self._alloc(self.capacity)
+        self.seq = 0
+        self.generation += 1
+
+    def drop(self, count):
+        # Drops the oldest `count` samples. The rest is copied to fresh arrays, so views
+        # handed out earlier stay valid; seq is unchanged (the dropped ones still count).
+        count = min(int(count), self._n)
+        if count > 0:
+            keep = self._n - count
+            capacity = len(self._seconds)
+            if capacity > 4 * max(keep, 16):
+                capacity = 2 * max(keep, 16)
+            self._alloc(capacity, keep, count)
+
+    def append(self, seconds, voltage, state):
+        self._reserve(1)
+        i = self._n
+        self._seconds[i] = seconds
+        self._voltage[i] = voltage
+        self._state[i] = state_code(state) if isinstance(state, str) else state
+        self._n = i + 1
+        self.seq += 1
+
+    def extend(self, seconds, voltage, state):
+        count = len(seconds)
+        if self.maxlen and count > self.maxlen:
+            seconds, voltage, state = seconds[-self.maxlen:], voltage[-self.maxlen:], state[-self.maxlen:]
+            self.seq += count - self.maxlen
+            count = self.maxlen
+        self._reserve(count)
+        i = self._n
+        self._seconds[i:i + count] = seconds
+        self._voltage[i:i + count] = voltage
+        self._state[i:i + count] = state
+        self._n = i + count
+        self.seq += count
+
+    def last(self):
+        if not self._n:
+            return None
+        i = self._n - 1
+        return float(self._seconds[i]), float(self._voltage[i]), STATE_NAMES[self._state[i]]
+
+    # ---- Views ----
+    def view(self):
+        n = self._n
+        return self._seconds[:n], self._voltage[:n], self._state[:n]
+
+    def to_frame(self):
+        seconds, voltage, state = self.view()
+        return pd.DataFrame({
+            "Seconds": seconds,
+            "Voltage": voltage,
+            "State": pd.Categorical.from_codes(state, categories=STATE_NAMES),
+        }, copy=False)
+
+    def to_arrow(self):
+        import pyarrow as pa
+
+        seconds, voltage, state = self.view()
+        return pa.table({
+            "Seconds": pa.array(seconds),
+            "Voltage": pa.array(voltage),
+            "State": pa.DictionaryArray.from_arrays(pa.array(state), pa.array(STATE_NAMES)),
+        })
@@ -0,0 +1,291 @@
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+
+import pandas as pd
+
+from command_channel import config_lines, describe
+from daemon_client import DaemonClient
+from device_manager import DeviceManager
+
+# ---- Campaign Scheduler ----
+# Runs a queue of run specs back to back on one or more boards, unattended. A
+# campaign is a JSON list of runs (or {"name": ..., "runs": [...]}) or a CSV with one
+# row per run:
+#
+#   name, port, mode, peak, min, discharge_min, stop_min, binary, time_min,
+#   charge_min, duration_min, repeat, <anything else, e.g. flow_rate>
+#
+# Settings are the dashboard's (volts and minutes); `port` pins a run to a board,
+# otherwise it goes to whichever board is free first; `repeat` queues it n times.
+# Other columns are copied into the run's log metadata. Each run is a normal run:
+# its own .fnmlog, the config sent through the command channel (a run whose config
+# is not acknowledged fails and the queue moves on), STOP after duration_min.
+#
+# Progress is written to <campaign>.state.json after every change. After a power
+# loss, run the same command again: finished runs are skipped, the interrupted one
+# records on into its own log until its planned end, then the queue continues.
+#
+#   python acq_daemon.py &                        # optional, owns the ports
+#   python scheduler.py campaigns/flow_rates.csv
+#   python scheduler.py campaigns/flow_rates.csv --report
+SETTINGS = {
+    "Decoupled": ["peak", "min", "discharge_min", "stop_min", "binary"],
+    "CDI": ["time_min"],
+    "Custom": ["charge_min", "discharge_min"],
+}
+SPEC_KEYS = {"name", "port", "mode", "duration_min", "repeat"}
+STATE_KEYS = {"status", "port_used", "started", "ended", "log_path", "interruptions", "samples", "cycles", "config", "error"}
+CONFIG_WAIT = 90.0  # s to wait for the config acks (the channel holds commands while a board reboots)
+
+
+def load_campaign(path):
+    if path.endswith(".csv"):
+        frame = pd.read_csv(path)
+        specs = [{key: value for key, value in row.items() if not pd.isna(value)} for row in frame.to_dict("records")]
+        name = os.path.splitext(os.path.basename(path))[0]
+    else:
+        with open(path) as f:
+            data = json.load(f)
+        specs = data["runs"] if isinstance(data, dict) else data
+        name = data.get("name") if isinstance(data, dict) else None
+        name = name or os.path.splitext(os.path.basename(path))[0]
+
+    runs = []
+    for i, spec in enumerate(specs, 1):
+        spec = dict(spec)
+        spec.setdefault("mode", "Decoupled")
+        spec.setdefault("name", f"run-{i:03d}")
+        if spec["mode"] not in SETTINGS:
+            raise ValueError(f"{spec['name']}: unknown mode {spec['mode']!r}")
+        if "binary" in spec:
+            spec["binary"] = str(spec["binary"]).strip().lower() in ("1", "1.0", "true", "yes")
+        try:
+            config_lines(spec["mode"], run_settings(spec))
+            duration = float(spec["duration_min"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"{spec['name']}: missing or bad setting {e}") from None
+        if duration <= 0:
+            raise ValueError(f"{spec['name']}: duration_min must be positive")
+        repeat = int(spec.pop("repeat", 1))
+        for k in range(repeat):
+            run = dict(spec, duration_min=duration)
+            if repeat > 1:
+                run["name"] = f"{spec['name']}-{k + 1}"
+            runs.append(run)
+    names = [run["name"] for run in runs]
+    if len(set(names)) != len(names):
+        raise ValueError("run names must be unique")
+    return name, runs
+
+
+def run_settings(run):
+    return {key: run[key] for key in SETTINGS[run["mode"]] if key in run}
+
+
+# ---- Scheduler ----
+class Scheduler:
+    def __init__(self, name, runs, state_path, manager, poll=1.0):
+        self.name = name
+        self.state_path = state_path
+        self.manager = manager
+        self.poll = poll
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+        # Runs already in the state file keep their progress; new ones start pending.
+        previous = {}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                previous = {run["name"]: run for run in json.load(f)["runs"]}
+        self.runs = []
+        for run in runs:
+            old = previous.get(run["name"], {})
+            run.update({key: old[key] for key in STATE_KEYS if key in old})
+            run.setdefault("status", "pending")
+            run.setdefault("interruptions", 0)
+            if run["status"] == "starting":
+                # Taken off the queue, but stopped before its log was opened: queue it again.
+                run["status"] = "pending"
+                run["interruptions"] += 1
+            self.runs.append(run)
+        self.save()
+
+    def save(self):
+        with self.lock:
+            data = json.dumps({"campaign": self.name, "updated": time.time(), "runs": self.runs}, indent=1, default=str)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.state_path)
+
+    def next_run(self, port):
+        # An interrupted run goes back to its own board first, then the queue in order.
+        with self.lock:
+            for run in self.runs:
+                if run["status"] == "running" and run.get("port_used") == port:
+                    return run
+            for run in self.runs:
+                if run["status"] == "pending" and run.get("port") in (None, port):
+                    run["status"] = "starting"
+                    run["port_used"] = port
+                    return run
+        return None
+
+    def update(self, run, **changes):
+        with self.lock:
+            run.update(changes)
+        self.save()
+
+    # ---- Board Loop ----
+    def board_loop(self, port):
+        worker = self.manager.get(port)
+        while not self.stop_event.is_set():
+            run = self.next_run(port)
+            if run is None:
+                return
+            try:
+                self.execute(run, worker)
+            except Exception as e:
+                try:
+                    worker.send_config(["STOP"])
+                    worker.end_run()
+                except Exception:
+                    pass
+                self.update(run, status="failed", ended=time.time(), error=str(e))
+            print(f"[{port}] {run['name']}: {run['status']}" + (f" ({run['error']})" if run.get("error") else ""))
+
+    def execute(self, run, worker):
+        lines = config_lines(run["mode"], run_settings(run))
+        send = True
+        if run["status"] == "running":
+            # Interrupted by a restart. If the daemon kept recording it, just carry on.
+            if worker.recording and worker.log_path == run["log_path"]:
+                send = False
+            elif not (worker.resume(run["log_path"]) and worker.continue_run()):
+                raise RuntimeError(f"cannot continue {run['log_path']}")
+            self.update(run, interruptions=run["interruptions"] + send)
+        else:
+            extra = {key: value for key, value in run.items() if key not in SPEC_KEYS | STATE_KEYS | set(run_settings(run))}
+            meta = {"mode": run["mode"], **run_settings(run), **extra, "campaign": self.name, "run": run["name"]}
+            worker.begin_run(run.get("min", 0.0), meta)
+            self.update(run, status="running", started=time.time(), log_path=worker.log_path, error=None)
+
+        if send:
+            transaction = worker.send_config(lines)
+            commands = self.wait_config(worker, transaction["id"])
+            self.update(run, config=[describe(command) for command in commands])
+            if any(command["status"] not in ("ok", "sent") for command in commands):
+                raise RuntimeError("config not acknowledged: " + " · ".join(run["config"]))
+
+        end = run["started"] + run["duration_min"] * 60
+        while not self.stop_event.is_set() and time.time() < end:
+            self.stop_event.wait(min(self.poll, max(end - time.time(), 0)))
+        if self.stop_event.is_set():
+            return  # left "running"; the next start continues it
+
+        worker.send_config(["STOP"])
+        worker.end_run()
+        status = worker.status()
+        self.update(run, status="done", ended=time.time(), samples=status["seq"],
+                    cycles=(status.get("cycles") or {}).get("cycles"))
+
+    def wait_config(self, worker, transaction_id):
+        deadline = time.monotonic() + CONFIG_WAIT
+        while True:
+            for transaction in worker.recent_transactions(20):
+                if transaction["id"] == transaction_id:
+                    commands = transaction["commands"]
+                    if transaction["finished"] or time.monotonic() > deadline:
+                        return commands
+            if time.monotonic() > deadline:
+                return [{"line": "config", "status": "failed", "reply": "transaction lost", "attempts": 0}]
+            if self.stop_event.wait(0.5):
+                return []
+
+    def run(self):
+        ports = self.manager.ports()
+        # Runs pinned to a board that is not attached would wait forever; say so, and keep
+        # them pending (with the reason in the report) for a start with the board plugged in.
+        with self.lock:
+            stranded = [run for run in self.runs if run["status"] == "pending" and run.get("port") not in (None, *ports)]
+            for run in stranded:
+                run["error"] = f"board {run['port']} not attached"
+        for run in stranded:
+            print(f"WARNING {run['name']}: pinned to {run['port']}, which is not attached; left pending")
+        if stranded:
+            self.save()
+        threads = [threading.Thread(target=self.board_loop, args=(port,), daemon=True) for port in ports]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+
+
+# ---- Report ----
+def report(runs):
+    rows = []
+    for run in runs:
+        started, ended = run.get("started"), run.get("ended")
+        rows.append({
+            "run": run["name"],
+            "board": run.get("port_used") or run.get("port"),
+            "mode": run["mode"],
+            "status": run["status"],
+            "started": pd.Timestamp(started, unit="s", tz="UTC").tz_convert(None) if started else None,
+            "minutes": round((ended - started) / 60, 2) if started and ended else None,
+            "planned": run["duration_min"],
+            "samples": run.get("samples"),
+            "cycles": run.get("cycles"),
+            "interruptions": run.get("interruptions", 0),
+            "log": os.path.basename(run["log_path"]) if run.get("log_path") else None,
+            "error": run.get("error"),
+        })
+    return pd.DataFrame(rows)
+
+
+# ---- CLI ----
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a campaign of runs back to back, unattended.")
+    parser.add_argument("campaign", help="JSON or CSV of run specs")
+    parser.add_argument("--state", help="progress file (default: <campaign>.state.json)")
+    parser.add_argument("--report", action="store_true", help="print the report from the state file and exit")
+    args = parser.parse_args()
+
+    name, runs = load_campaign(args.campaign)
+    state_path = args.state or os.path.splitext(args.campaign)[0] + ".state.json"
+    if args.report:
+        with open(state_path) as f:
+            runs = json.load(f)["runs"]
+    else:
+        client = DaemonClient()
+        if client.available():
+            manager = client
+        else:
+            manager = DeviceManager(115200)
+            manager.scan()
+        scheduler = Scheduler(name, runs, state_path, manager)
+        signal.signal(signal.SIGTERM, lambda *_: scheduler.stop_event.set())
+        print(f"Campaign {name}: {len(runs)} runs on {', '.join(manager.ports()) or 'no boards'}")
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            scheduler.stop_event.set()
+        runs = scheduler.runs
+        if not scheduler.stop_event.is_set():
+            if isinstance(manager, DeviceManager):
+                manager.close_all()
+
+    table = report(runs)
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(table.to_string(index=False))
+    if not args.report:
+        out = os.path.splitext(state_path)[0].removesuffix(".state") + ".report.csv"
+        table.to_csv(out, index=False)
+        print(f"Wrote {out}")
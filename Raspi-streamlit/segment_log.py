@@ -0,0 +1,252 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from sample_store import STATE_NAMES
+
+# ---- File Format ----
+# header : MAGIC, u32 length, JSON metadata (mode, settings, start time)
+# chunk  : 4-byte tag, u32 row count, u32 crc32(payload), payload
+# payload: float64 seconds[n], float32 voltage[n], uint8 state[n]
+# A run that was stopped cleanly ends with an END chunk (n = 0).
+MAGIC = b"FNMLOG1\n"
+CHUNK = struct.Struct("<4sII")
+DATA_TAG = b"DATA"
+END_TAG = b"END\0"
+ROW_BYTES = 8 + 4 + 1
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+log = logging.getLogger(__name__)
+
+
+def new_log_path(log_dir=LOG_DIR, prefix="run"):
+    # The name carries milliseconds, and the file is created here with O_EXCL, so two runs
+    # started in the same second (the scheduler does that) never share a log.
+    os.makedirs(log_dir, exist_ok=True)
+    now = time.time()
+    stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}"
+    name, i = f"{prefix}-{stamp}", 1
+    while True:
+        path = os.path.join(log_dir, name + ".fnmlog")
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return path
+        except FileExistsError:
+            i += 1
+            name = f"{prefix}-{stamp}-{i}"
+
+
+def latest_log(log_dir=LOG_DIR, prefix="run"):
+    paths = sorted(glob.glob(os.path.join(log_dir, f"{prefix}-*.fnmlog")), key=os.path.getmtime)
+    return paths[-1] if paths else None
+
+
+# ---- Writer ----
+# Rows are buffered and written as one chunk every `flush_rows` rows or
+# `flush_interval` seconds; the file is fsynced at most every `fsync_interval`.
+class SegmentWriter:
+    def __init__(self, path, meta=None, flush_rows=256, flush_interval=1.0, fsync_interval=5.0):
+        self.path = path
+        self.meta = dict(meta or {})
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.rows = 0
+
+        self._seconds = np.empty(flush_rows, dtype=np.float64)
+        self._voltage = np.empty(flush_rows, dtype=np.float32)
+        self._state = np.empty(flush_rows, dtype=np.uint8)
+        self._n = 0
+        self._last_flush = time.monotonic()
+        self._last_fsync = self._last_flush
+        self._dirty = False
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            # Appending after an END chunk would hide the new rows from every reader;
+            # a finished run is only continued through reopen().
+            if is_closed(path):
+                raise ValueError(f"{path} holds a finished run; reopen() it to append")
+        else:
+            # The header goes in under a temporary name first, so a crash never leaves a
+            # .fnmlog without a complete header.
+            header = json.dumps(self.meta).encode()
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(MAGIC + struct.pack("<I", len(header)) + header)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        self._file = open(path, "ab")
+
+    def append(self, seconds, voltage, state):
+        i = self._n
+        self._seconds[i] = seconds
+        self._voltage[i] = voltage
+        self._state[i] = state
+        self._n = i + 1
+        if self._n >= self.flush_rows:
+            self.flush()
+
+    def extend(self, seconds, voltage, state):
+        start, count = 0, len(seconds)
+        while start < count:
+            take = min(self.flush_rows - self._n, count - start)
+            i, j = self._n, self._n + take
+            self._seconds[i:j] = seconds[start:start + take]
+            self._voltage[i:j] = voltage[start:start + take]
+            self._state[i:j] = state[start:start + take]
+            self._n = j
+            start += take
+            if self._n >= self.flush_rows:
+                self.flush()
+
+    def tick(self):
+        now = time.monotonic()
+        if self._n and now - self._last_flush >= self.flush_interval:
+            self.flush()
+        elif self._dirty and now - self._last_fsync >= self.fsync_interval:
+            self._sync()
+
+    def flush(self):
+        n = self._n
+        if n:
+            payload = self._seconds[:n].tobytes() + self._voltage[:n].tobytes() + self._state[:n].tobytes()
+            self._file.write(CHUNK.pack(DATA_TAG, n, zlib.crc32(payload)) + payload)
+            self.rows += n
+            self._n = 0
+            self._dirty = True
+        self._file.flush()
+        self._last_flush = time.monotonic()
+        if self._last_flush - self._last_fsync >= self.fsync_interval:
+            self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+        self._dirty = False
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.write(CHUNK.pack(END_TAG, 0, 0))
+        self._sync()
+        self._file.close()
+
+
+# ---- Reader / Recovery ----
+def _scan(path):
+    chunks = []
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an FNM log")
+        size = f.read(4)
+        if len(size) < 4:
+            raise ValueError(f"{path} has a torn header")
+        (length,) = struct.unpack("<I", size)
+        header = f.read(length)
+        if len(header) < length:
+            raise ValueError(f"{path} has a torn header")
+        try:
+            meta = json.loads(header or b"{}")
+        except ValueError:
+            raise ValueError(f"{path} has a torn header") from None
+        good = f.tell()
+        closed = False
+        while True:
+            head = f.read(CHUNK.size)
+            if len(head) < CHUNK.size:
+                break
+            tag, n, crc = CHUNK.unpack(head)
+            if tag == END_TAG:
+                closed = True
+                good = f.tell()
+                break
+            payload = f.read(n * ROW_BYTES)
+            if tag != DATA_TAG or len(payload) < n * ROW_BYTES or zlib.crc32(payload) != crc:
+                break
+            chunks.append((n, payload))
+            good = f.tell()
+    return meta, chunks, closed, good
+
+
+def read_segment(path):
+    meta, chunks, closed, _ = _scan(path)
+    n = sum(rows for rows, _ in chunks)
+    seconds = np.empty(n, dtype=np.float64)
+    voltage = np.empty(n, dtype=np.float32)
+    state = np.empty(n, dtype=np.uint8)
+    i = 0
+    for rows, payload in chunks:
+        seconds[i:i + rows] = np.frombuffer(payload, np.float64, rows, 0)
+        voltage[i:i + rows] = np.frombuffer(payload, np.float32, rows, 8 * rows)
+        state[i:i + rows] = np.frombuffer(payload, np.uint8, rows, 12 * rows)
+        i += rows
+    meta["closed"] = closed
+    return meta, seconds, voltage, state
+
+
+def recover(path):
+    # Cuts off a torn trailing chunk left by a crash so the file can be appended to again.
+    # A file without a complete header holds no run: it is renamed to .bad and None returned.
+    try:
+        meta, chunks, closed, good = _scan(path)
+    except ValueError as e:
+        os.replace(path, path + ".bad")
+        log.warning("%s; moved aside to %s.bad", e, path)
+        return None
+    if os.path.getsize(path) > good:
+        with open(path, "r+b") as f:
+            f.truncate(good)
+            f.flush()
+            os.fsync(f.fileno())
+    return read_segment(path)
+
+
+def is_closed(path):
+    # A cleanly stopped log ends with the END chunk.
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < len(MAGIC) + 4 + CHUNK.size:
+            return False
+        f.seek(-CHUNK.size, os.SEEK_END)
+        return f.read(CHUNK.size) == CHUNK.pack(END_TAG, 0, 0)
+
+
+def reopen(path):
+    # Removes the end marker of a closed log so a continued run can append to it.
+    meta, chunks, closed, good = _scan(path)
+    if closed:
+        with open(path, "r+b") as f:
+            f.truncate(good - CHUNK.size)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def load_frame(path):
+    meta, seconds, voltage, state = read_segment(path)
+    return pd.DataFrame({
+        "Seconds": seconds,
+        "Voltage": voltage,
+        "State": pd.Categorical.from_codes(state, categories=STATE_NAMES),
+    })
+
+
+# ---- CLI ----
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert an FNM run log to CSV.")
+    parser.add_argument("log")
+    parser.add_argument("-o", "--output", help="CSV path (default: next to the log)")
+    args = parser.parse_args()
+    output = args.output or os.path.splitext(args.log)[0] + ".csv"
+    load_frame(args.log).to_csv(output, index=False)
+    print(f"Wrote {output}")
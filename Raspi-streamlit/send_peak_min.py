@@ -1,10 +1,14 @@
 import serial
+import sys
 import time
+from device_manager import find_boards
 
-ser = serial.Serial('/dev/ttyACM1', 115200, timeout=1.0)
+# Port from the command line, else the first attached board.
+port = sys.argv[1] if len(sys.argv) > 1 else (find_boards() or ['/dev/ttyACM1'])[0]
+ser = serial.Serial(port, 115200, timeout=1.0)
 time.sleep(3)
 ser.reset_input_buffer()
-print("Serial connection success")
+print(f"Serial connection success ({port})")
 
 try:
     while True:
@@ -24,11 +28,8 @@ try:
         mn_msg = f"Min:{min_voltage:.2f}\n"
         time_msg = f"Time:{time_data}\n"
         print(f"Sending: {pk_msg.strip()} and {mn_msg.strip()}")
-        ser.write(pk_msg.encode('utf-8'))
-        time.sleep(0.2)
-        ser.write(mn_msg.encode('utf-8'))
-        time.sleep(0.2)
-        ser.write(time_msg.encode('utf-8'))
+        # One write for the whole config; the board reads it line by line and the acks show up below.
+        ser.write((pk_msg + mn_msg + time_msg).encode('utf-8'))
         print("Listening to simulation output from Arduino (press Ctrl+C to stop)...")
         print("-" * 40)
 
@@ -0,0 +1,87 @@
+import select
+import time
+
+from frames import FRAME_SIZE, SYNC
+
+# ---- Serial Reader ----
+# Bulk reads from a pyserial port without spinning. read() sleeps in select() on
+# the port's file descriptor until bytes arrive (or `timeout` passes), then takes
+# everything waiting in one read() call, never one syscall per line. A burst that
+# piled up in the OS buffer comes back as one chunk.
+#
+# A read returns at once when it holds a complete line or binary frame, so samples
+# and acks are never held back. Only when it woke up inside one (the rest is still
+# on the wire) does it wait for the rest, in select() and for at most `max_delay`,
+# so the line or frame is decoded in one piece instead of costing another wakeup.
+#
+# High-water marks (since the port was opened) show how close the OS buffer came
+# to overrunning: `waiting_high` is the most bytes found waiting at a read.
+SYNC_BYTE = bytes([SYNC])
+
+
+def complete(chunk):
+    # True if the chunk holds at least one whole text line or binary frame.
+    if b"\n" in chunk:
+        return True
+    sync = chunk.find(SYNC_BYTE)
+    return sync >= 0 and len(chunk) - sync >= FRAME_SIZE
+
+
+class SerialReader:
+    def __init__(self, ser, timeout=0.1, max_delay=0.005):
+        self.ser = ser
+        self.timeout = timeout
+        self.max_delay = max_delay
+        self.rate = 0.0  # bytes/s, smoothed
+        self.waiting = 0  # bytes waiting at the last read
+        self._last = None
+        try:
+            self.fd = ser.fileno()
+        except Exception:
+            self.fd = None  # no fd (e.g. Windows): fall back to pyserial's own read timeout
+        self.wakeups = 0
+        self.delayed = 0
+        self.waiting_high = 0
+        self.chunk_high = 0
+
+    def wait(self, timeout):
+        if self.fd is None:
+            return True
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        return bool(readable)
+
+    def read(self):
+        # Returns the bytes read, b"" on timeout. Raises like ser.read() when the port is gone.
+        if not self.wait(self.timeout):
+            return b""
+        self.wakeups += 1
+        waiting = self.ser.in_waiting
+        chunk = self.ser.read(waiting or 1)
+        if self.fd is not None and not complete(chunk):
+            self.delayed += 1
+            deadline = time.monotonic() + self.max_delay
+            while not complete(chunk):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.wait(remaining):
+                    break
+                chunk += self.ser.read(self.ser.in_waiting or 1)
+
+        now = time.monotonic()
+        if self._last is not None:
+            elapsed = max(now - self._last, 1e-3)
+            # After a quiet spell, start over from the current rate.
+            self.rate = len(chunk) / elapsed if elapsed > 1.0 else 0.7 * self.rate + 0.3 * len(chunk) / elapsed
+        self._last = now
+        self.waiting = waiting
+        self.waiting_high = max(self.waiting_high, waiting)
+        self.chunk_high = max(self.chunk_high, len(chunk))
+        return chunk
+
+    def stats(self):
+        return {
+            "rate_bps": round(self.rate, 1),
+            "wakeups": self.wakeups,
+            "coalesced": self.delayed,
+            "waiting_high": self.waiting_high,
+            "chunk_high": self.chunk_high,
+        }
@@ -0,0 +1,548 @@
+import abc
+import argparse
+import math
+import os
+import pty
+import random
+import re
+import select
+import signal
+import sys
+import termios
+import time
+import tty
+from collections import deque
+
+from frames import encode_frame
+from sample_store import STATE_CODES
+
+# ---- Board Simulator ----
+# Stands in for an Arduino on a pseudo-terminal, speaking the same text protocol,
+# commands, acks and binary frames as decoupled.ino / cdi_final.ino / custom_time.ino.
+# Each sketch is ported as a generator: `yield ms` is one waitWithFrames(ms), so the
+# control flow (including the loops that ignore commands) matches the firmware.
+# Firmware time runs `rate` times faster than real time, one loop pass per tick.
+#
+#   python sim_device.py --firmware decoupled --rate 1000 --corrupt 0.01 --disconnect-every 60
+#   FNM_EXTRA_PORTS=/tmp/fnm-sim0 streamlit run combine_app.py
+DEFAULT_LINK = "/tmp/fnm-sim0"
+
+
+def to_int(text):
+    # Arduino String.toInt(): leading integer, 0 if there is none.
+    match = re.match(r"\s*[-+]?\d+", text)
+    return int(match.group()) if match else 0
+
+
+def to_float(text):
+    match = re.match(r"\s*[-+]?(\d+\.?\d*|\.\d+)", text)
+    return float(match.group()) if match else 0.0
+
+
+# ---- Cell Model ----
+# First-order RC towards the supply while charging and towards 0 V while discharging.
+class Cell:
+    def __init__(self, supply=3.3, tau_charge=30.0, tau_discharge=10.0, noise=0.002):
+        self.supply = supply
+        self.tau_charge = tau_charge
+        self.tau_discharge = tau_discharge
+        self.noise = noise
+        self.voltage = 0.0
+        self.charging = True
+
+    def advance(self, ms):
+        target, tau = (self.supply, self.tau_charge) if self.charging else (0.0, self.tau_discharge)
+        self.voltage += (target - self.voltage) * (1 - math.exp(-ms / 1000.0 / tau))
+
+    def adc(self):
+        voltage = self.voltage + random.gauss(0.0, self.noise)
+        return min(max(int(round(voltage * 1023 / 5.0)), 0), 1023)
+
+
+# ---- Firmware Base ----
+class Firmware(abc.ABC):
+    def __init__(self):
+        self.clock_ms = 0
+        self.out = bytearray()
+        self.inbox = deque()
+        self.binary_mode = False
+        self.frame_interval_ms = 10
+        self.frame_seq = 0
+        self.reported_mode = 0
+        self.cell = Cell()
+        self.loop = self.run()
+
+    def millis(self):
+        return self.clock_ms
+
+    def println(self, text):
+        self.out += text.encode() + b"\n"
+
+    def read_adc(self):
+        return 0
+
+    def read_voltage(self):
+        return self.read_adc() * (5.0 / 1023.0)
+
+    def message(self):
+        return self.inbox.popleft().strip() if self.inbox else None
+
+    def handle_common(self, message):
+        if message.startswith("BIN:"):
+            self.binary_mode = to_int(message[4:]) == 1
+            self.println("Binary telemetry " + ("ON" if self.binary_mode else "OFF"))
+        elif message.startswith("RATE:"):
+            val = to_int(message[5:])
+            if val > 0:
+                self.frame_interval_ms = val
+                self.println(f"Updated frame interval to: {val} ms")
+
+    def print_zero(self, mode):
+        self.reported_mode = STATE_CODES[mode]
+        if not self.binary_mode:
+            self.println(f"Live Input | VOLTAGE: 0.0000 | DIR: STABLE | MODE: {mode} | T: {self.millis()}")
+
+    def step(self):
+        # One pass up to the next waitWithFrames(); returns the firmware ms it waited.
+        ms = next(self.loop)
+        if ms and self.binary_mode:
+            for k in range(0, ms, self.frame_interval_ms):
+                adc = self.frame_adc()
+                self.out += encode_frame(self.frame_seq, self.clock_ms + k, adc, self.reported_mode)
+                self.frame_seq = (self.frame_seq + 1) & 0xFFFF
+        self.clock_ms += ms
+        self.cell.advance(ms)
+        return ms
+
+    def frame_adc(self):
+        return 0
+
+    @abc.abstractmethod
+    def run(self):
+        # The sketch's loop(): a generator that yields the ms of each wait.
+        ...
+
+
+# ---- decoupled.ino ----
+class Decoupled(Firmware):
+    def __init__(self):
+        super().__init__()
+        self.peak_value = 0.0
+        self.bottom_value = 0.0
+        self.running = False
+        self.is_discharging = False
+        self.peak_received = False
+        self.min_received = False
+        self.is_loop_phase = False
+        self.sub_charging_started = False
+        self.sub_charging_start = 0
+        self.waiting_to_restart = False
+        self.last_loop_print = 0
+        self.second_loop_pending = False
+        self.recharging_before_loop = False
+        self.redischarging = False
+        self.last_direction = ""
+        self.last_voltage = 0.0
+        self.custom_delay = 120000
+        self.below_threshold_start = 0
+        self.report_zero = False
+
+    def read_adc(self):
+        return self.cell.adc()
+
+    def frame_adc(self):
+        return 0 if self.report_zero else self.cell.adc()
+
+    def start_charging(self):
+        self.cell.charging = True
+
+    def start_discharging(self):
+        self.cell.charging = False
+
+    def display(self, voltage):
+        if voltage <= 0.05:
+            return
+        if voltage > self.last_voltage:
+            direction = "INCREASING"
+        elif voltage < self.last_voltage:
+            direction = "DECREASING"
+        else:
+            direction = self.last_direction
+        self.last_voltage = voltage
+        self.last_direction = direction
+        self.reported_mode = 2 if self.is_discharging else 1
+        self.report_zero = False
+        if self.binary_mode:
+            return
+        mode = "Discharging" if self.is_discharging else "Charging"
+        self.println(f"Live Input | VOLTAGE: {voltage:.4f} | DIR: {direction} | MODE: {mode} | T: {self.millis()}")
+
+    def print_zero(self, mode):
+        self.report_zero = True
+        super().print_zero(mode)
+
+    def handle(self):
+        message = self.message()
+        if message is None:
+            return
+        if message.startswith("Peak:"):
+            val = to_float(message[5:])
+            if 0.0 < val <= 5.0:
+                self.peak_value = val
+                self.peak_received = True
+        elif message.startswith("Min:"):
+            val = to_float(message[4:])
+            if val >= 0.0 and self.peak_received and val < self.peak_value:
+                self.bottom_value = val
+                self.min_received = True
+                self.is_discharging = False
+                self.running = True
+                self.last_direction = ""
+                self.last_voltage = self.read_voltage()
+                self.start_charging()
+                self.println("Updated Peak/Min received. Starting simulation...")
+                self.display(self.last_voltage)
+        elif message.startswith("Time:"):
+            val = to_int(message[5:])
+            if val > 0:
+                self.custom_delay = val
+                self.println(f"Updated custom delay time to: {val} ms")
+            else:
+                self.println("Invalid time value. Must be greater than 0.")
+        elif message.upper() == "STOP":
+            self.running = False
+            self.start_charging()
+            self.println("Simulation stopped.")
+        elif message.upper() == "START":
+            if self.peak_received and self.min_received:
+                self.running = True
+                self.is_discharging = False
+                self.last_direction = ""
+                self.last_voltage = self.read_voltage()
+                self.start_charging()
+                self.println("Simulation resumed.")
+            else:
+                self.println("Cannot start: Peak and Min not set.")
+        else:
+            self.handle_common(message)
+
+    def run(self):
+        while True:
+            self.handle()
+            if not self.running or not (self.peak_received and self.min_received):
+                yield 0
+                continue
+            voltage = self.read_voltage()
+
+            if (not self.is_discharging and voltage >= self.peak_value and not self.is_loop_phase
+                    and not self.recharging_before_loop and not self.redischarging):
+                self.start_discharging()
+                self.is_discharging = True
+                self.println("Voltage exceeded peak_value. Switching to DISCHARGING and monitoring...")
+
+            if self.is_discharging and not self.is_loop_phase and not self.recharging_before_loop and not self.redischarging:
+                if voltage <= 0.05:
+                    if self.below_threshold_start == 0:
+                        self.below_threshold_start = self.millis()
+                    elif self.millis() - self.below_threshold_start >= 2000:
+                        self.println("Voltage <= 0.05V confirmed for 2s. Starting RECHARGING before entering Step 3...")
+                        self.is_discharging = False
+                        self.start_charging()
+                        self.recharging_before_loop = True
+                        self.below_threshold_start = 0
+                else:
+                    self.below_threshold_start = 0
+
+            if self.recharging_before_loop and not self.is_discharging and not self.is_loop_phase:
+                if self.millis() - self.last_loop_print >= 1000:
+                    self.display(voltage)
+                    self.last_loop_print = self.millis()
+                if voltage >= self.peak_value:
+                    self.println("Voltage exceeded peak again. Starting DISCHARGING before Step 3...")
+                    self.start_discharging()
+                    self.is_discharging = True
+                    self.redischarging = True
+                    self.recharging_before_loop = False
+
+            if self.redischarging and self.is_discharging and voltage <= 0.05:
+                self.println("Voltage reached 0V after re-discharge. Entering LOOP CHARGING phase (Step 3)...")
+                self.is_discharging = False
+                self.is_loop_phase = True
+                self.sub_charging_started = True
+                self.redischarging = False
+                self.start_charging()
+                self.sub_charging_start = self.millis()
+
+            if self.is_loop_phase and self.sub_charging_started and self.millis() - self.sub_charging_start < 120000:
+                if self.millis() - self.last_loop_print >= 1000:
+                    self.print_zero("Stop")
+                    self.last_loop_print = self.millis()
+                self._toggle(voltage)
+
+            if (self.is_loop_phase and self.sub_charging_started and self.millis() - self.sub_charging_start >= 120000
+                    and not self.waiting_to_restart and not self.second_loop_pending):
+                self.println("60 seconds passed. Restarting DISCHARGING with custom duration...")
+                self.start_discharging()
+                self.is_discharging = True
+                self.waiting_to_restart = True
+                hold_start = self.millis()
+                while self.millis() - hold_start < self.custom_delay:
+                    self.print_zero("Discharging")
+                    yield 1000
+                self.println("Finished Discharging loop. Entering LOOP CHARGING phase again...")
+                self.is_discharging = False
+                self.is_loop_phase = True
+                self.sub_charging_started = False
+                self.waiting_to_restart = False
+                self.second_loop_pending = True
+                self.start_charging()
+
+            if self.second_loop_pending and not self.sub_charging_started:
+                if self.millis() - self.last_loop_print >= 1000:
+                    self.print_zero("Charging")
+                    self.last_loop_print = self.millis()
+                if voltage > 0.1:
+                    self.println("Voltage > 0.1V detected. Starting 60 second loop now...")
+                    self.sub_charging_start = self.millis()
+                    self.sub_charging_started = True
+                    self.last_loop_print = self.millis()
+
+            if self.second_loop_pending and self.sub_charging_started and self.millis() - self.sub_charging_start < 120000:
+                if self.millis() - self.last_loop_print >= 1000:
+                    self.print_zero("Stop")
+                    self.last_loop_print = self.millis()
+                self._toggle(voltage)
+
+            if self.second_loop_pending and self.sub_charging_started and self.millis() - self.sub_charging_start >= 120000:
+                self.println("Second 60 second loop complete. Resuming normal charging...")
+                self.is_loop_phase = False
+                self.sub_charging_started = False
+                self.second_loop_pending = False
+                self.is_discharging = False
+                self.start_charging()
+
+            if (voltage > 0.05 and not self.is_loop_phase and not self.second_loop_pending
+                    and not self.recharging_before_loop and not self.redischarging):
+                self.display(voltage)
+
+            yield 1000
+
+    def _toggle(self, voltage):
+        if not self.is_discharging and voltage > 0.1:
+            self.start_discharging()
+            self.is_discharging = True
+        elif self.is_discharging and voltage <= 0.05:
+            self.start_charging()
+            self.is_discharging = False
+
+
+# ---- cdi_final.ino ----
+class CDI(Firmware):
+    def __init__(self):
+        super().__init__()
+        self.custom_delay = 300000
+
+    def handle(self):
+        message = self.message()
+        if message is None:
+            return
+        if message.startswith("Time:"):
+            val = to_int(message[5:])
+            if val > 0:
+                self.custom_delay = val
+                self.println(f"Updated custom delay time to: {val} ms")
+            else:
+                self.println("Invalid time value. Must be greater than 0.")
+        else:
+            self.handle_common(message)
+
+    def run(self):
+        while True:
+            self.handle()
+            for mode, duration in (("Charging", lambda: self.custom_delay), ("Discharging", lambda: self.custom_delay)):
+                start = self.millis()
+                while self.millis() - start < duration():
+                    self.handle()
+                    self.print_zero(mode)
+                    yield 1000
+
+
+# ---- custom_time.ino ----
+class CustomTime(Firmware):
+    def __init__(self):
+        super().__init__()
+        self.charge_delay = 300000
+        self.discharge_delay = 300000
+
+    def handle(self):
+        message = self.message()
+        if message is None:
+            return
+        lower = message.lower()
+        if lower.startswith("c_time:"):
+            val = to_int(message[7:])
+            if val > 0:
+                self.charge_delay = val
+                self.println(f"Updated CHARGING time to: {val} ms")
+        elif lower.startswith("dc_time:"):
+            val = to_int(message[8:])
+            if val > 0:
+                self.discharge_delay = val
+                self.println(f"Updated DISCHARGING time to: {val} ms")
+        else:
+            self.handle_common(message)
+
+    def run(self):
+        while True:
+            self.handle()
+            for mode, duration in (("Charging", lambda: self.charge_delay), ("Discharging", lambda: self.discharge_delay)):
+                start = self.millis()
+                while self.millis() - start < duration():
+                    self.handle()
+                    self.print_zero(mode)
+                    yield 1000
+
+
+FIRMWARE = {"decoupled": Decoupled, "cdi": CDI, "custom": CustomTime}
+
+
+# ---- Line Faults ----
+def corrupt(data, probability):
+    if not probability:
+        return data
+    lines = data.split(b"\n")
+    for i, line in enumerate(lines[:-1]):
+        if line and random.random() < probability:
+            fault = random.randrange(3)
+            if fault == 0:    # flipped byte
+                pos = random.randrange(len(line))
+                lines[i] = line[:pos] + bytes([random.randrange(32, 127)]) + line[pos + 1:]
+            elif fault == 1:  # truncated line
+                lines[i] = line[:random.randrange(len(line))]
+            else:             # lost newline, two lines run together
+                lines[i] = line + lines[i + 1]
+                lines[i + 1] = b""
+    return b"\n".join(lines)
+
+
+# ---- Pseudo-terminal ----
+class SimPort:
+    def __init__(self, link):
+        self.link = link
+        self.master = None
+        self.slave = None
+        self.open()
+
+    def open(self):
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        attrs = termios.tcgetattr(self.slave)
+        attrs[2] &= ~termios.HUPCL
+        termios.tcsetattr(self.slave, termios.TCSANOW, attrs)
+        os.set_blocking(self.master, False)
+        name = os.ttyname(self.slave)
+        if self.link:
+            tmp = self.link + ".tmp"
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+            os.symlink(name, tmp)
+            os.replace(tmp, self.link)
+        return name
+
+    def close(self):
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = None
+        if self.link and os.path.lexists(self.link):
+            os.unlink(self.link)
+
+    def read(self):
+        try:
+            return os.read(self.master, 4096)
+        except (BlockingIOError, OSError):
+            return b""
+
+    def write(self, data):
+        # Like Serial.write() with nobody listening: what does not fit is lost.
+        try:
+            return os.write(self.master, data)
+        except (BlockingIOError, OSError):
+            return 0
+
+
+# ---- Driver ----
+def simulate(firmware="decoupled", rate=1.0, jitter=0.0, corrupt_rate=0.0,
+             disconnect_every=0.0, downtime=3.0, link=DEFAULT_LINK, duration=None, quiet=False):
+    port = SimPort(link)
+    board = FIRMWARE[firmware]()
+    inbuf = b""
+    period = 1.0 / rate
+    now = time.monotonic()
+    next_tick = now
+    next_drop = now + disconnect_every if disconnect_every else None
+    end = now + duration if duration else None
+    stats = {"ticks": 0, "bytes": 0, "commands": 0, "disconnects": 0}
+    if not quiet:
+        print(f"{firmware} simulator on {link or os.ttyname(port.slave)} ({os.ttyname(port.slave)}), {rate:g} loops/s")
+    try:
+        while end is None or now < end:
+            data = port.read()
+            if data:
+                inbuf += data
+                *lines, inbuf = inbuf.split(b"\n")
+                board.inbox.extend(line.decode(errors="replace") for line in lines)
+                stats["commands"] += len(lines)
+
+            now = time.monotonic()
+            behind = 0
+            while now >= next_tick and behind < 10000:
+                # Idle passes (yield 0) drain queued commands without consuming a tick.
+                while board.step() == 0 and board.inbox:
+                    pass
+                next_tick += period * (1 + random.uniform(-jitter, jitter))
+                stats["ticks"] += 1
+                behind += 1
+            if board.out:
+                out = corrupt(bytes(board.out), corrupt_rate)
+                board.out.clear()
+                stats["bytes"] += port.write(out)
+
+            if next_drop and now >= next_drop:
+                # USB unplug / hub power cycle: the port vanishes and the board reboots.
+                port.close()
+                stats["disconnects"] += 1
+                if not quiet:
+                    print(f"disconnected for {downtime:g} s")
+                time.sleep(downtime)
+                port.open()
+                board = FIRMWARE[firmware]()
+                inbuf = b""
+                now = next_tick = time.monotonic()
+                next_drop = now + disconnect_every
+
+            timeout = max(0.0, min(next_tick - time.monotonic(), 0.05))
+            select.select([port.master], [], [], timeout)
+            now = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        port.close()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated FNM board on a pseudo-terminal.")
+    parser.add_argument("--firmware", choices=sorted(FIRMWARE), default="decoupled")
+    parser.add_argument("--rate", type=float, default=1.0, help="loop passes (sample lines) per second; 1 = real time")
+    parser.add_argument("--jitter", type=float, default=0.0, help="relative jitter of the loop period (0-1)")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="probability a line is corrupted")
+    parser.add_argument("--disconnect-every", type=float, default=0.0, help="seconds between simulated unplugs (0 = never)")
+    parser.add_argument("--downtime", type=float, default=3.0, help="seconds the port stays gone per unplug")
+    parser.add_argument("--link", default=DEFAULT_LINK, help="stable symlink to the current pty")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    args = parser.parse_args()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # still remove the link
+    stats = simulate(args.firmware, args.rate, args.jitter, args.corrupt,
+                     args.disconnect_every, args.downtime, args.link, args.duration)
+    print(stats, file=sys.stderr)
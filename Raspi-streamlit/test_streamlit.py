@@ -2,6 +2,7 @@ import streamlit as st
 from streamlit_autorefresh import st_autorefresh
 import serial
 import time
+from serial_reader import SerialReader
 
 # ----------------- Refresh every 1s -----------------
 st_autorefresh(interval=1000, key="serial-monitor")
@@ -41,13 +42,14 @@ output_area = st.empty()
 
 if st.session_state.ser:
     try:
-        lines = []
-        start = time.time()
-        while time.time() - start < 0.5:
-            if st.session_state.ser.in_waiting > 0:
-                line = st.session_state.ser.readline().decode('utf-8', errors='ignore').strip()
-                if line:
-                    lines.append(line)
+        # Collect for 0.5 s, sleeping in select() between bursts instead of spinning on in_waiting.
+        reader = SerialReader(st.session_state.ser)
+        data = b""
+        end = time.time() + 0.5
+        while time.time() < end:
+            reader.timeout = max(end - time.time(), 0)
+            data += reader.read()
+        lines = [line.strip() for line in data.decode('utf-8', errors='ignore').splitlines() if line.strip()]
         if lines:
             output_area.text("\n".join(lines))
         else:
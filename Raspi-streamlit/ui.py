@@ -0,0 +1,107 @@
+# ---- Static Markup ----
+# Everything the dashboards render that does not depend on live data. The app scripts
+# are re-executed on every rerun, but this module is imported once per process, so the
+# markup and chart specs here are built once and only the live values are filled in.
+STYLE = """
+    <style>
+    body { background-color: #f5fff5; }
+    .title { text-align: center; color: #2E8B57; font-size: 36px; font-weight: bold; }
+    .subtitle { text-align: center; color: #444; font-size: 18px; margin-top: -10px; }
+    </style>
+"""
+RADIO_ROW = """
+    <style>
+    div.row-widget.stRadio > div {
+        flex-direction: row;
+        justify-content: center;
+        gap: 30px;
+    }
+    </style>
+"""
+HEADER = """
+    <div class='title'>FNM Team</div>
+    <div class='subtitle'>{subtitle}</div>
+    <hr style="margin-top:10px;"/>
+"""
+HEADERS = {
+    "combine": STYLE + RADIO_ROW + HEADER.format(subtitle="Dashboard"),
+    "electrolyzer": STYLE + HEADER.format(subtitle="Supercapacitive Electrolyzer Dashboard"),
+}
+
+WAITING = "<span style='font-size: 20px; color: #888;'>Waiting for Arduino data...</span>"
+
+# ---- Live Markup ----
+STATE_COLORS = {"Charging": "#0099FF", "Discharging": "#F44336", "Stop": "#888888"}
+# State -> (voltage text color, state badge color) of the Decoupled readout.
+READOUT_COLORS = {
+    "Stop": ("#888888", "#FFFFFF"),
+    "Charging": ("#2E8B57", "#0099FF"),
+    "Discharging": ("#F44336", "#F44336"),
+}
+
+TILE = """
+    <div style='text-align:center;border:1px solid #ddd;border-radius:12px;padding:6px;'>
+        <div style='font-size: 14px; color: #444;'>{name} · {mode}</div>
+        <div style='font-size: 22px; font-weight: 600;'>{voltage:.3f} V</div>
+        <div style='font-size: 14px; color: {color};'>[{state}]</div>
+    </div>
+"""
+READOUT = """
+    <div style='display:flex;align-items:center;gap:20px;'>
+        <span style='font-size: 35px; color: {color}; font-weight: 600;'>
+            Voltage (V): {voltage:.3f} V
+        </span>
+        <span style='font-size: 28px; color: {state_color}; font-weight: 600; background-color:#222; padding:4px 16px; border-radius:12px;'>
+            [{state}]
+        </span>
+    </div>
+"""
+BADGE = """
+    <div style='display:flex;align-items:center;justify-content:center;'>
+        <span style='font-size: 32px; color: {color}; font-weight: 600; background-color:#222; padding:6px 20px; border-radius:12px;'>
+            [{state}]
+        </span>
+    </div>
+"""
+
+
+def tile(name, mode, voltage, state):
+    return TILE.format(name=name, mode=mode, voltage=voltage, state=state, color=STATE_COLORS.get(state, "#888888"))
+
+
+def readout(voltage, state):
+    color, state_color = READOUT_COLORS.get(state, ("#888888", "#888888"))
+    return READOUT.format(color=color, voltage=voltage, state_color=state_color, state=state)
+
+
+def badge(state):
+    return BADGE.format(color=STATE_COLORS.get(state, "#888888"), state=state)
+
+
+def format_time(seconds):
+    days = seconds // 86400
+    seconds = seconds % 86400
+    hours = seconds // 3600
+    seconds = seconds % 3600
+    minutes = seconds // 60
+    seconds = seconds % 60
+    return f"{days} day {hours} hrs {minutes} min {seconds} sec"
+
+
+# ---- Chart Spec ----
+# Plain Vega-Lite dicts; the live refresh only ships the (downsampled) data.
+CHART_WINDOWS = {"All": None, "Last 10 min": 600, "Last 1 hr": 3600, "Last 6 hrs": 21600}
+
+
+def chart_spec(field, title):
+    return {
+        "mark": {"type": "line", "color": "green"},
+        "encoding": {
+            "x": {"field": field, "type": "quantitative", "title": title},
+            "y": {"field": "Voltage", "type": "quantitative", "title": "Voltage (V)"},
+        },
+        "height": 400,
+    }
+
+
+CHART_SPECS = {"Seconds": chart_spec("Seconds", "Time (s)"), "Minutes": chart_spec("Minutes", "Time (min)")}
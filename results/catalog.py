@@ -0,0 +1,258 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import merge_runs
+from timestamps import dashboard_ns
+
+# Dashboard run logs are read with the acquisition code's own reader.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Raspi-streamlit"))
+from segment_log import read_segment  # noqa: E402
+from sample_store import STATE_NAMES  # noqa: E402
+
+# ---- Experiment Catalog ----
+# One archive folder holds every run we have, in two parts:
+#   samples/run=<id>/*.parquet   the samples, hive-partitioned by run, sorted by ts
+#                                and split into row groups of ROW_GROUP rows
+#   runs.parquet                 the index: one row per run with its parameters
+# Experiment folders (O2 + potentiostat, via merge_runs.py) and dashboard run logs
+# (.fnmlog) are both runs. An experiment takes mode / voltages / timings from the
+# dashboard run that overlaps it in time, and that run takes the experiment's flow rate.
+#
+#   python catalog.py build --experiments /path/to/result_experiments --logs ../Raspi-streamlit/logs
+#   python catalog.py list --flow-rate 2 5
+#   python catalog.py query --mode Decoupled --start "2025-07-16 11:15" --columns ts voltage -o out.csv
+#
+# A query filters the small index first, then reads only those runs' partitions, and
+# within them only the row groups whose ts statistics overlap the time range, and only
+# the requested columns. Nothing is re-parsed from CSV.
+ARCHIVE = "archive"
+ROW_GROUP = 65_536
+PARAMS = ["mode", "peak", "min", "discharge_min", "stop_min", "charge_min", "time_min"]
+INDEX_SCHEMA = pa.schema([
+    ("run", pa.string()),
+    ("source", pa.string()),  # "experiment" or "dashboard"
+    ("date", pa.date32()),
+    ("flow_rate", pa.int64()),
+    ("mode", pa.string()),
+    ("peak", pa.float64()),
+    ("min", pa.float64()),
+    ("discharge_min", pa.float64()),
+    ("stop_min", pa.float64()),
+    ("charge_min", pa.float64()),
+    ("time_min", pa.float64()),
+    ("start", pa.timestamp("ns")),
+    ("end", pa.timestamp("ns")),
+    ("rows", pa.int64()),
+    ("streams", pa.string()),
+    ("linked", pa.string()),  # the overlapping run of the other source
+    ("path", pa.string()),
+])
+
+
+class Catalog:
+    def __init__(self, root=ARCHIVE):
+        self.root = root
+        self.samples = os.path.join(root, "samples")
+        self.index_path = os.path.join(root, "runs.parquet")
+
+    # ---- Index ----
+    def runs(self):
+        if not os.path.exists(self.index_path):
+            return pd.DataFrame({field.name: pd.Series(dtype=field.type.to_pandas_dtype()) for field in INDEX_SCHEMA})
+        return pq.read_table(self.index_path).to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+
+    def _save_index(self, runs):
+        runs = runs.sort_values("start").reset_index(drop=True)
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.index_path + ".tmp"
+        pq.write_table(pa.Table.from_pandas(runs, schema=INDEX_SCHEMA, preserve_index=False), tmp)
+        os.replace(tmp, self.index_path)
+
+    # ---- Import ----
+    def add_experiments(self, root, tolerance=1.0, force=False):
+        known = set(self.runs()["run"])
+        runs = [run for run in merge_runs.find_runs(root) if force or run["run"] not in known]
+        by_name = {run["run"]: run for run in runs}
+        rows = []
+        for table in merge_runs.merge_runs(runs, tolerance):
+            self._write(table)
+            run = by_name[table["run"][0].as_py()]
+            ts = table["ts"]
+            rows.append({
+                "run": run["run"], "source": "experiment", "date": pd.Timestamp(run["date"]).date(),
+                "flow_rate": run["flow_rate"], "start": pd.Timestamp(pc.min(ts).value),
+                "end": pd.Timestamp(pc.max(ts).value), "rows": table.num_rows, "path": os.path.abspath(run["path"]),
+                "streams": ",".join(name for name, path, kind in merge_runs.run_files(run["path"])),
+            })
+        self._merge_index(rows)
+        return len(rows)
+
+    def add_logs(self, log_dir, tz=None, force=False):
+        known = set(self.runs()["run"])
+        rows = []
+        for path in sorted(glob.glob(os.path.join(log_dir, "*.fnmlog"))):
+            run = os.path.splitext(os.path.basename(path))[0]
+            if run in known and not force:
+                continue
+            meta, seconds, voltage, state = read_segment(path)
+            if not len(seconds) or "start_wall" not in meta:
+                continue
+            ts = dashboard_ns(seconds, meta["start_wall"], tz, meta.get("utc_offset"))
+            order = np.argsort(ts, kind="stable")
+            table = pa.table({
+                "ts": pa.array(ts[order], pa.timestamp("ns")),
+                "voltage": voltage[order].astype(np.float64),
+                "state": pa.DictionaryArray.from_arrays(state[order].astype(np.int8), STATE_NAMES),
+                "run": pa.array([run] * len(ts)),
+            })
+            self._write(table)
+            start = pd.Timestamp(int(ts.min()))
+            rows.append({
+                "run": run, "source": "dashboard", "date": start.date(),
+                "start": start, "end": pd.Timestamp(int(ts.max())), "rows": len(ts),
+                "streams": "dashboard", "path": os.path.abspath(path),
+                **{key: meta.get(key) for key in PARAMS},
+            })
+        self._merge_index(rows)
+        return len(rows)
+
+    def _write(self, table):
+        # One partition per run; re-importing a run replaces only its own folder.
+        ds.write_dataset(
+            table, self.samples, format="parquet",
+            partitioning=ds.partitioning(pa.schema([("run", pa.string())]), flavor="hive"),
+            existing_data_behavior="delete_matching",
+            min_rows_per_group=ROW_GROUP, max_rows_per_group=ROW_GROUP,
+        )
+
+    def _merge_index(self, rows):
+        if not rows:
+            return
+        new = pd.DataFrame(rows)
+        runs = self.runs()
+        runs = pd.concat([runs[~runs["run"].isin(new["run"])], new], ignore_index=True)
+        self._save_index(link(runs))
+
+    # ---- Queries ----
+    def find(self, runs=None, mode=None, flow_rate=None, source=None, start=None, end=None, **params):
+        # Index filter. Scalars match exactly, lists match any, (lo, hi) tuples a range.
+        index = self.runs()
+        mask = np.ones(len(index), dtype=bool)
+        for column, wanted in [("run", runs), ("mode", mode), ("flow_rate", flow_rate), ("source", source), *params.items()]:
+            if wanted is None:
+                continue
+            if isinstance(wanted, tuple):
+                mask &= index[column].between(*wanted).to_numpy()
+            else:
+                mask &= index[column].isin(wanted if isinstance(wanted, (list, set)) else [wanted]).to_numpy()
+        if start is not None:
+            mask &= (index["end"] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (index["start"] < pd.Timestamp(end)).to_numpy()
+        return index[mask].reset_index(drop=True)
+
+    def dataset(self):
+        # Experiments and dashboard runs have different columns; the dataset schema is
+        # the union, read from the file footers only.
+        dataset = ds.dataset(self.samples, format="parquet", partitioning="hive")
+        schema = pa.unify_schemas([fragment.physical_schema for fragment in dataset.get_fragments()]
+                                  + [pa.schema([("run", pa.string())])])
+        return ds.dataset(self.samples, schema=schema, format="parquet", partitioning="hive")
+
+    def query(self, columns=None, start=None, end=None, **filters):
+        runs = self.find(start=start, end=end, **filters)
+        if not len(runs):
+            return pd.DataFrame(columns=columns)
+        expr = pc.field("run").isin(list(runs["run"]))
+        if start is not None:
+            expr &= pc.field("ts") >= pa.scalar(pd.Timestamp(start).value, pa.timestamp("ns"))
+        if end is not None:
+            expr &= pc.field("ts") < pa.scalar(pd.Timestamp(end).value, pa.timestamp("ns"))
+        return self.dataset().to_table(columns=columns, filter=expr).to_pandas()
+
+
+def link(runs):
+    # Pairs each experiment with the dashboard run that overlaps it the longest.
+    runs = runs.copy()
+    runs["start"] = pd.to_datetime(runs["start"])
+    runs["end"] = pd.to_datetime(runs["end"])
+    experiments = runs.index[runs["source"] == "experiment"]
+    dashboards = runs.index[runs["source"] == "dashboard"]
+    for i in experiments:
+        overlap = (runs.loc[dashboards, "end"].clip(upper=runs.at[i, "end"])
+                   - runs.loc[dashboards, "start"].clip(lower=runs.at[i, "start"]))
+        overlap = overlap[overlap > pd.Timedelta(0)]
+        if not len(overlap):
+            continue
+        j = overlap.idxmax()
+        runs.at[i, "linked"] = runs.at[j, "run"]
+        runs.at[j, "linked"] = runs.at[i, "run"]
+        runs.at[j, "flow_rate"] = runs.at[i, "flow_rate"]
+        for key in PARAMS:
+            runs.at[i, key] = runs.at[j, key]
+    return runs
+
+
+# ---- CLI ----
+def _filters(args):
+    filters = {"mode": args.mode, "flow_rate": args.flow_rate, "source": args.source, "runs": args.run}
+    if args.peak:
+        filters["peak"] = tuple(args.peak) if len(args.peak) == 2 else args.peak
+    return filters
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index and query all experiment runs.")
+    parser.add_argument("command", choices=["build", "list", "query"])
+    parser.add_argument("--archive", default=ARCHIVE)
+    parser.add_argument("--experiments", help="build: result_experiments folder")
+    parser.add_argument("--logs", help="build: dashboard run log folder")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="build: max seconds between joined samples")
+    parser.add_argument("--force", action="store_true", help="build: re-import runs already in the archive")
+    parser.add_argument("--tz", help="build: the lab's timezone (e.g. Asia/Bangkok) for logs that do not record their UTC offset")
+    parser.add_argument("--run", nargs="+")
+    parser.add_argument("--mode")
+    parser.add_argument("--source", choices=["experiment", "dashboard"])
+    parser.add_argument("--flow-rate", type=int, nargs="+")
+    parser.add_argument("--peak", type=float, nargs="+", help="one value, or LO HI")
+    parser.add_argument("--start", help="e.g. '2025-07-16 11:15'")
+    parser.add_argument("--end")
+    parser.add_argument("--columns", nargs="+", help="query: columns to read (default all)")
+    parser.add_argument("-o", "--output", help="query: CSV or .parquet output")
+    args = parser.parse_args()
+
+    catalog = Catalog(args.archive)
+    if args.command == "build":
+        started = time.perf_counter()
+        added = 0
+        if args.experiments:
+            added += catalog.add_experiments(args.experiments, args.tolerance, args.force)
+        if args.logs:
+            added += catalog.add_logs(args.logs, args.tz, args.force)
+        print(f"Imported {added} runs into {args.archive} in {time.perf_counter() - started:.1f} s")
+    elif args.command == "list":
+        runs = catalog.find(start=args.start, end=args.end, **_filters(args))
+        with pd.option_context("display.width", 200, "display.max_columns", 20):
+            print(runs.drop(columns=["path"]).to_string(index=False))
+    else:
+        started = time.perf_counter()
+        frame = catalog.query(args.columns, args.start, args.end, **_filters(args))
+        print(f"{len(frame):,} rows in {time.perf_counter() - started:.2f} s")
+        if args.output:
+            if args.output.endswith(".parquet"):
+                frame.to_parquet(args.output, index=False)
+            else:
+                frame.to_csv(args.output, index=False)
+            print(f"Wrote {args.output}")
+        else:
+            print(frame.head(20).to_string(index=False))
@@ -0,0 +1,225 @@
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+
+from timestamps import SECOND_NS, o2_ns, potentiostat_ns
+
+# ---- Experiment Merge ----
+# Loads every run folder under result_experiments/ (e.g. 16-07-2025-02-fr/), aligns
+# the O2 UniAmp log with the potentiostat exports on real timestamps and writes all
+# runs to one Parquet dataset partitioned by run:
+#
+#   python merge_runs.py /path/to/result_experiments --out merged.parquet
+#
+# Each CSV is read with pyarrow (multithreaded, no Python per row) and the files of
+# all runs are loaded in parallel. Streams are joined with a sorted as-of join on
+# nanosecond timestamps: each sample of the densest stream gets the nearest sample
+# of every other stream within `tolerance`, or nulls (timestamps.py makes the
+# keys). This replaces the notebooks' outer merge on second-truncated "HH:MM:SS"
+# strings, which paired samples up to a second apart and duplicated or dropped
+# rows whenever two fell in the same second.
+RUN_DIR = re.compile(r"^(\d{2})-(\d{2})-(\d{4})-(.+)$")  # dd-mm-yyyy-<tag>
+FLOW_RATE = re.compile(r"^(\d+)-fr$")
+
+O2_TIME = "Time (YYYY-MM-DD hh:mm:ss)"
+O2_MS = "Time (ms)"
+O2_COLUMNS = {
+    "Raw, Sensor 1 - OX (MilliVolt)": "ox_raw_mv",
+    "Sensor 1 - OX (μmol/L)": "ox_umol_l",
+    "Sensor 3 - Pressure (mbar)": "pressure_mbar",
+}
+POT_COLUMNS = {"Value ": "value", "Value_2ND ": "value_2nd"}
+
+
+def run_info(run_dir):
+    name = os.path.basename(os.path.normpath(run_dir))
+    match = RUN_DIR.match(name)
+    if not match:
+        return None
+    day, month, year, tag = match.groups()
+    flow = FLOW_RATE.match(tag)
+    return {
+        "run": name,
+        "date": f"{year}-{month}-{day}",
+        "flow_rate": int(flow.group(1)) if flow else None,
+        "tag": tag,
+    }
+
+
+def sniff(path):
+    # O2 UniAmp exports are ';'-separated; the potentiostat writes Time, Value, Value_2ND,
+    # an empty column and the DateTime header. Anything else (notebook outputs such as
+    # output2fr.csv or merged_time.csv) is not a raw instrument log and is skipped.
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        header = f.readline().rstrip("\r\n")
+    if ";" in header and O2_TIME in header:
+        return "o2"
+    fields = header.split(",")
+    if len(fields) == 5 and fields[0] == "Time" and fields[4].lstrip().startswith("DateTime"):
+        return "potentiostat"
+    return None
+
+
+def stream_name(path, kind):
+    if kind == "o2":
+        return "o2"
+    return re.sub(r"\W+", "_", os.path.splitext(os.path.basename(path))[0]).strip("_").lower()
+
+
+# ---- Readers ----
+def read_o2(path):
+    table = pv.read_csv(
+        path,
+        parse_options=pv.ParseOptions(delimiter=";"),
+        convert_options=pv.ConvertOptions(
+            include_columns=[O2_TIME, O2_MS] + list(O2_COLUMNS),
+            column_types={O2_TIME: pa.timestamp("s"), O2_MS: pa.int64()},
+        ),
+    )
+    columns = {"ts": o2_ns(table[O2_TIME], table[O2_MS])}
+    for source, name in O2_COLUMNS.items():
+        columns[name] = pc.cast(table[source], pa.float64())
+    return pa.table(columns)
+
+
+def read_potentiostat(path):
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        header = f.readline().rstrip("\r\n").split(",")
+    table = pv.read_csv(
+        path,
+        convert_options=pv.ConvertOptions(
+            include_columns=["Time"] + list(POT_COLUMNS),
+            column_types={"Time": pa.string(), **{column: pa.float64() for column in POT_COLUMNS}},
+        ),
+    )
+    columns = {"ts": potentiostat_ns(table["Time"], header[4])}
+    for source, name in POT_COLUMNS.items():
+        columns[name] = table[source]
+    return pa.table(columns)
+
+
+READERS = {"o2": read_o2, "potentiostat": read_potentiostat}
+
+
+def load_stream(path, kind):
+    table = READERS[kind](path)
+    ts = np.asarray(table["ts"])
+    if len(ts) > 1 and np.any(ts[1:] < ts[:-1]):
+        table = table.take(pc.sort_indices(table, [("ts", "ascending")]))
+    return table
+
+
+# ---- Alignment ----
+def align(streams, tolerance=1.0):
+    # streams: {name: table with an int64 "ts" column}. The densest stream is the base;
+    # the others are joined to it (nearest sample, |dt| <= tolerance seconds) with their
+    # columns prefixed by the stream name.
+    base = max(streams, key=lambda name: streams[name].num_rows)
+    merged = _prefixed(base, streams[base])
+    for name in sorted(streams):
+        if name == base:
+            continue
+        merged = pd.merge_asof(
+            merged, _prefixed(name, streams[name]),
+            on="ts", direction="nearest", tolerance=int(tolerance * SECOND_NS),
+        )
+    merged["ts"] = merged["ts"].astype("datetime64[ns]")
+    return merged
+
+
+def _prefixed(name, table):
+    frame = table.to_pandas()
+    frame["ts"] = frame["ts"].astype(np.int64)
+    return frame.rename(columns={column: f"{name}_{column}" for column in frame.columns if column != "ts"})
+
+
+def run_files(run_dir):
+    files = []
+    for entry in sorted(os.listdir(run_dir)):
+        path = os.path.join(run_dir, entry)
+        if entry.lower().endswith(".csv") and os.path.isfile(path):
+            kind = sniff(path)
+            if kind:
+                files.append((stream_name(path, kind), path, kind))
+    return files
+
+
+def find_runs(root):
+    runs = []
+    for entry in sorted(os.listdir(root)):
+        path = os.path.join(root, entry)
+        info = run_info(path)
+        if info and os.path.isdir(path):
+            info["path"] = path
+            runs.append(info)
+    return runs
+
+
+def merge_runs(runs, tolerance=1.0, workers=None):
+    # All files of all runs are read concurrently; pyarrow releases the GIL while parsing.
+    jobs = [(run["run"], name, path, kind) for run in runs for name, path, kind in run_files(run["path"])]
+    with ThreadPoolExecutor(max_workers=workers or min(8, (os.cpu_count() or 1) + 2)) as pool:
+        tables = list(pool.map(lambda job: load_stream(job[2], job[3]), jobs))
+
+    streams = {}
+    for (run, name, path, kind), table in zip(jobs, tables):
+        streams.setdefault(run, {})[name] = table
+
+    merged = []
+    for run in runs:
+        if run["run"] not in streams:
+            continue
+        frame = align(streams[run["run"]], tolerance)
+        frame["run"] = run["run"]
+        frame["date"] = pd.Timestamp(run["date"]).date()
+        frame["flow_rate"] = pd.array([run["flow_rate"]] * len(frame), dtype="Int64")
+        merged.append(pa.Table.from_pandas(frame, preserve_index=False))
+    return merged
+
+
+def write_dataset(tables, out):
+    # Runs carry different streams (voltagecell vs fullcell + capa), so columns a run
+    # does not have are filled with nulls.
+    table = pa.concat_tables(tables, promote_options="default")
+    ds.write_dataset(
+        table, out, format="parquet",
+        partitioning=ds.partitioning(pa.schema([("run", pa.string())]), flavor="hive"),
+        existing_data_behavior="delete_matching",
+    )
+    return table.num_rows
+
+
+def load_dataset(out, runs=None, columns=None):
+    dataset = ds.dataset(out, format="parquet", partitioning="hive")
+    flt = pc.field("run").isin(runs) if runs else None
+    return dataset.to_table(columns=columns, filter=flt).to_pandas()
+
+
+# ---- CLI ----
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge O2 and potentiostat logs of many runs into one Parquet dataset.")
+    parser.add_argument("root", help="result_experiments folder (one sub-folder per run), or a single run folder")
+    parser.add_argument("--out", default="merged.parquet", help="dataset directory")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="max seconds between joined samples")
+    parser.add_argument("--workers", type=int, help="parallel file readers")
+    args = parser.parse_args()
+
+    info = run_info(args.root)
+    if info and os.path.isdir(args.root):
+        info["path"] = args.root
+        runs = [info]
+    else:
+        runs = find_runs(args.root)
+    start = time.perf_counter()
+    tables = merge_runs(runs, args.tolerance, args.workers)
+    rows = write_dataset(tables, args.out) if tables else 0
+    print(f"Merged {len(tables)} runs, {rows:,} rows into {args.out} in {time.perf_counter() - start:.1f} s")
@@ -0,0 +1,120 @@
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# ---- Timestamps ----
+# Every instrument log is turned into one int64 column of nanoseconds since the epoch,
+# in the lab's local wall-clock time (the O2 UniAmp and the potentiostat both write
+# naive local times, so the dashboard's UTC start time is converted to match).
+# Everything here is array-at-a-time (pyarrow / numpy); there is no per-row Python.
+# Joins and time filters then compare plain integers instead of strings.
+#
+#   O2 UniAmp      "2025-07-22 14:04:51" + "Time (ms)" 115
+#   potentiostat   "14:18:20:390" (HH:MM:SS:mmm, time of day only) + header
+#                  "DateTime : ( 25 / 07 / 22 -- 14 : 18 : 19 )" (yy / mm / dd)
+#   dashboard      Seconds since the run started + the run log's start_wall
+SECOND_NS = 10**9
+MS_NS = 10**6
+DAY_NS = 86_400 * SECOND_NS
+
+POT_HEADER = re.compile(r"\(\s*(\d+)\s*/\s*(\d+)\s*/\s*(\d+)\s*--\s*(\d+)\s*:\s*(\d+)\s*:\s*(\d+)\s*\)")
+CLOCK = r"^(?P<h>\d+):(?P<m>\d+):(?P<s>\d+):(?P<ms>\d+)$"
+CLOCK_WIDTH = 12  # "HH:MM:SS:mmm"
+
+
+def _array(values, type=None):
+    if isinstance(values, pa.ChunkedArray):
+        return values.combine_chunks()
+    if isinstance(values, pa.Array):
+        return values
+    if isinstance(values, pd.Series):
+        values = values.to_numpy()
+    return pa.array(values, type=type)
+
+
+# ---- O2 UniAmp ----
+def o2_ns(wall, ms):
+    # `wall` as strings or an already parsed timestamp column (pyarrow's CSV reader can
+    # parse it while reading); `ms` is the separate millisecond column.
+    wall = _array(wall)
+    if pa.types.is_string(wall.type) or pa.types.is_large_string(wall.type):
+        wall = pc.strptime(wall, format="%Y-%m-%d %H:%M:%S", unit="s")
+    seconds = pc.cast(pc.cast(wall, pa.timestamp("s")), pa.int64()).to_numpy(zero_copy_only=False)
+    return seconds * SECOND_NS + np.asarray(_array(ms, pa.int64()).to_numpy(zero_copy_only=False), np.int64) * MS_NS
+
+
+# ---- Potentiostat ----
+def clock_ns(values):
+    # "HH:MM:SS:mmm" -> nanoseconds since midnight. The exports are fixed width, so the
+    # digits are read straight out of the string buffer; anything else (unpadded fields,
+    # nulls) goes through a vectorized regex instead.
+    values = _array(values, pa.string())
+    if pa.types.is_large_string(values.type):
+        values = values.cast(pa.string())
+    n = len(values)
+    if n and values.null_count == 0:
+        offsets = np.frombuffer(values.buffers()[1], np.int32, n + 1, values.offset * 4)
+        if offsets[-1] - offsets[0] == n * CLOCK_WIDTH and np.all(np.diff(offsets) == CLOCK_WIDTH):
+            raw = np.frombuffer(values.buffers()[2], np.uint8, n * CLOCK_WIDTH, offsets[0]).reshape(n, CLOCK_WIDTH)
+            digits = raw[:, [0, 1, 3, 4, 6, 7, 9, 10, 11]].astype(np.int64) - 48
+            if (np.all(raw[:, [2, 5, 8]] == ord(":")) and digits.min() >= 0 and digits.max() <= 9):
+                hours = digits[:, 0] * 10 + digits[:, 1]
+                minutes = digits[:, 2] * 10 + digits[:, 3]
+                seconds = digits[:, 4] * 10 + digits[:, 5]
+                millis = digits[:, 6] * 100 + digits[:, 7] * 10 + digits[:, 8]
+                return ((hours * 60 + minutes) * 60 + seconds) * SECOND_NS + millis * MS_NS
+    parts = pc.extract_regex(values, CLOCK)
+    fields = [pc.cast(pc.struct_field(parts, name), pa.int64()).to_numpy(zero_copy_only=False)
+              for name in ("h", "m", "s", "ms")]
+    return ((fields[0] * 60 + fields[1]) * 60 + fields[2]) * SECOND_NS + fields[3] * MS_NS
+
+
+def potentiostat_start(header):
+    # Start of the recording from the export's last header column.
+    match = POT_HEADER.search(header)
+    if not match:
+        raise ValueError(f"no start date in potentiostat header {header!r}")
+    yy, mm, dd, hh, mi, ss = (int(value) for value in match.groups())
+    return pd.Timestamp(2000 + yy, mm, dd, hh, mi, ss).value
+
+
+def on_days(tod, start):
+    # Time-of-day column -> epoch ns. Only the clock is logged and runs cross midnight
+    # (14:26 -> 10:36 the next day), so every backwards jump of more than 12 h starts a
+    # new day, counted from the date of `start`.
+    tod = np.asarray(tod, dtype=np.int64)
+    if not len(tod):
+        return tod
+    day = np.zeros(len(tod), dtype=np.int64)
+    np.cumsum(np.diff(tod) < -DAY_NS // 2, out=day[1:])
+    midnight = start - start % DAY_NS
+    if tod[0] < start - midnight - DAY_NS // 2:
+        day += 1  # header written just before midnight, first sample after it
+    return midnight + day * DAY_NS + tod
+
+
+def potentiostat_ns(clock, header):
+    return on_days(clock_ns(clock), potentiostat_start(header))
+
+
+# ---- Dashboard ----
+def dashboard_ns(seconds, start_wall, tz=None, utc_offset=None):
+    # Seconds column of a run (log or CSV export) + the run's start_wall (time.time() on
+    # the Pi) -> local wall-clock epoch ns, comparable with the instrument logs. The Pi's
+    # UTC offset at record time (`utc_offset`, s, in newer logs' metadata) wins; else
+    # `tz`, the lab's timezone; else the timezone of the machine doing the analysis.
+    if utc_offset is not None:
+        start = round((start_wall + utc_offset) * SECOND_NS)
+    elif tz:
+        start = pd.Timestamp(start_wall, unit="s", tz="UTC").tz_convert(tz).tz_localize(None).value
+    else:
+        start = round((start_wall + time.localtime(start_wall).tm_gmtoff) * SECOND_NS)
+    return start + np.round(np.asarray(seconds, dtype=np.float64) * SECOND_NS).astype(np.int64)
+
+
+def to_datetime(ns):
+    return np.asarray(ns, dtype=np.int64).view("datetime64[ns]")